@@ -0,0 +1,238 @@
+"""
+Benchmarks of the hot paths of the miner and the multisig signer, on synthetic mempools of 1k, 10k and 100k transactions.
+
+Each benchmark runs a number of rounds and reports the median rate with the slowest and fastest rounds.
+baseline.json holds the rates measured on a reference machine; compare fails when a rate drops by more
+than the tolerance below its baseline. Rates depend on the machine, so a new baseline should be saved
+before comparing on different hardware. The mempools are generated once into data/ and reused.
+
+Usage:
+    python run_benchmarks.py run [sizes] [rounds]        prints the results, e.g. run 1000,10000,100000 3
+    python run_benchmarks.py save [sizes] [rounds]       runs and stores the results in baseline.json
+    python run_benchmarks.py compare [sizes] [rounds]    runs and exits with status 1 on a regression
+"""
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+MINING = ROOT.parent / "mining-a-block" / "python"
+MULTISIG = ROOT.parent / "building-a-p2sh-p2wsh-multisig-tx" / "python"
+sys.path[:0] = [str(MINING), str(MULTISIG)]
+import main
+import sha256d
+from mempool_loader import iter_transaction_records
+from schnorr import verify_schnorr_signatures
+from synthetic_mempool import generate_mempool
+
+BASELINE_PATH = ROOT / "baseline.json"
+DATA_PATH = ROOT / "data"
+DEFAULT_SIZES = (1000, 10000)
+DEFAULT_ROUNDS = 3
+#a rate more than this fraction below its baseline is a regression
+TOLERANCE = 0.25
+NONCE_COUNT = 200000
+SIGNATURE_COUNT = 300
+PAIR_COUNT = 1 << 16
+
+def load_multisig_main():
+    """
+    Imports the multisig builder's main.py under another name, as the miner's main.py is already imported as main.
+
+    :return: The module.
+    """
+    spec = importlib.util.spec_from_file_location("multisig_main", MULTISIG / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def measure(function, operations, unit, rounds):
+    """
+    Times rounds calls of a function.
+
+    :param function: The function to time, called without arguments.
+    :param operations: The number of operations one call performs.
+    :param unit: The unit of the rate, e.g. "tx/s".
+    :param rounds: The number of calls.
+    :return: A dictionary of the median, min and max rates, the unit, the rounds and the operations per round.
+    """
+    rates = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        #the miner prints its progress, which isn't part of the measurement
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+        rates.append(operations / (time.perf_counter() - start))
+    return {'rate': statistics.median(rates), 'min': min(rates), 'max': max(rates), 'unit': unit, 'rounds': rounds,
+            'operations': operations}
+
+def benchmark_validation(records, rounds):
+    """
+    Times validate_transaction_signatures on the P2PKH transactions and the schnorr verification of the
+    taproot key path signatures of a mempool.
+
+    :param records: The TransactionRecords of the mempool.
+    :param rounds: The number of rounds.
+    :return: A dictionary mapping each benchmark name to its measurement.
+    """
+    legacy = []
+    signatures = []
+    for record in records:
+        taproot = main.taproot_key_path_signatures(record)
+        if taproot is None:
+            legacy.append(record.raw.hex())
+        else:
+            signatures.extend(taproot)
+    return {
+        'validate_transaction_signatures[p2pkh]': measure(
+            lambda: [main.validate_transaction_signatures(raw_hex) for raw_hex in legacy], len(legacy), 'tx/s', rounds),
+        'verify_schnorr_signatures[batch]': measure(
+            lambda: verify_schnorr_signatures(signatures, True), len(signatures), 'sig/s', rounds),
+        'verify_schnorr_signatures[single]': measure(
+            lambda: verify_schnorr_signatures(signatures, False), len(signatures), 'sig/s', rounds),
+    }
+
+def benchmark_header(rounds):
+    """
+    Times the nonce search of construct_block_header against a target no hash meets.
+
+    :param rounds: The number of rounds.
+    :return: A dictionary mapping the benchmark name to its measurement.
+    """
+    header_prefix = bytes(range(76))
+    return {'construct_block_header[nonce search]': measure(
+        lambda: main.search_nonce_range(header_prefix, 0, NONCE_COUNT, bytes(32)), NONCE_COUNT, 'H/s', rounds)}
+
+def benchmark_sha256d(rounds):
+    """
+    Times the batched double SHA-256 of Merkle node pairs and of nonces with each sha256d backend.
+
+    :param rounds: The number of rounds.
+    :return: A dictionary mapping each benchmark name to its measurement.
+    """
+    pairs = b''.join(i.to_bytes(64, 'little') for i in range(PAIR_COUNT))
+    header_prefix = bytes(range(76))
+    default = sha256d.backend
+    results = {}
+    for backend in sha256d.SHA256D_BACKENDS:
+        if sha256d.set_backend(backend) != backend:
+            continue
+        results[f'sha256d.hash_pairs[{backend}]'] = measure(lambda: sha256d.hash_pairs(pairs), PAIR_COUNT, 'pairs/s', rounds)
+        results[f'sha256d.search_nonces[{backend}]'] = measure(
+            lambda: main.search_nonce_range(header_prefix, 0, NONCE_COUNT, bytes(32)), NONCE_COUNT, 'H/s', rounds)
+    sha256d.set_backend(default)
+    return results
+
+def benchmark_mempool(size, rounds):
+    """
+    Times generate_merkle_root and get_valid_transactions on a synthetic mempool.
+
+    :param size: The number of transactions of the mempool.
+    :param rounds: The number of rounds.
+    :return: A dictionary mapping each benchmark name to its measurement.
+    """
+    folder = generate_mempool(size, DATA_PATH / f"mempool-{size}")
+    txids = [path.stem for path in sorted(folder.iterdir())]
+    results = {f'generate_merkle_root[{size}]': measure(lambda: main.generate_merkle_root(txids), size, 'txids/s', rounds)}
+    worker_counts = sorted({1, os.cpu_count() or 1})
+    for workers in worker_counts:
+        results[f'get_valid_transactions[{size}, {workers} workers]'] = measure(
+            lambda: main.get_valid_transactions(folder, workers), size, 'tx/s', rounds)
+    return results
+
+def benchmark_signing(rounds):
+    """
+    Times sign_with_ecdsa with each signing backend, with the keys already parsed.
+
+    :param rounds: The number of rounds.
+    :return: A dictionary mapping each benchmark name to its measurement.
+    """
+    multisig_main = load_multisig_main()
+    keys = ["39dc0a9f0b185a2ee56349691f34716e6e0cda06a7f9707742ac113c4e2317bf",
+            "5077ccd9c558b7d04a81920d38aa11b4a9f9de3b23fab45c3ef28039920fdd6d"]
+    digests = [i.to_bytes(32, 'big') for i in range(SIGNATURE_COUNT)]
+    results = {}
+    for backend in multisig_main.SIGNING_BACKENDS:
+        multisig_main.signing_backend = backend
+        #parse the keys and build the generator table outside of the measurement
+        multisig_main.sign_with_ecdsa(digests[0], keys[0])
+        multisig_main.sign_with_ecdsa(digests[0], keys[1])
+        results[f'sign_with_ecdsa[{backend}]'] = measure(
+            lambda: [multisig_main.sign_with_ecdsa(digest, keys[i % 2]) for i, digest in enumerate(digests)],
+            SIGNATURE_COUNT, 'sig/s', rounds)
+    return results
+
+def run(sizes, rounds):
+    """
+    Runs every benchmark.
+
+    :param sizes: The sizes of the synthetic mempools.
+    :param rounds: The number of rounds of each benchmark.
+    :return: A dictionary mapping each benchmark name to its measurement.
+    """
+    results = {}
+    validation_folder = generate_mempool(min(sizes), DATA_PATH / f"mempool-{min(sizes)}")
+    results.update(benchmark_validation(list(iter_transaction_records(sorted(validation_folder.iterdir()))), rounds))
+    results.update(benchmark_header(rounds))
+    results.update(benchmark_sha256d(rounds))
+    for size in sizes:
+        results.update(benchmark_mempool(size, rounds))
+    results.update(benchmark_signing(rounds))
+    return results
+
+def environment():
+    """
+    :return: A description of the machine the benchmarks ran on.
+    """
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'processor': platform.processor(),
+            'cpus': os.cpu_count()}
+
+def print_results(results, baseline=None):
+    """
+    Prints the results, with the change from the baseline when there is one.
+
+    :param results: The measurements.
+    :param baseline: The baseline measurements, or None.
+    :return: The names of the benchmarks that regressed.
+    """
+    regressions = []
+    for name, result in results.items():
+        line = f"{name}: {result['rate']:.0f} {result['unit']} (min {result['min']:.0f}, max {result['max']:.0f})"
+        if baseline is not None and name in baseline:
+            change = result['rate'] / baseline[name]['rate'] - 1
+            line += f", {change:+.1%} from baseline"
+            if change < -TOLERANCE:
+                line += " REGRESSION"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+def main_cli():
+    command = sys.argv[1] if len(sys.argv) > 1 else 'run'
+    sizes = sorted(int(size) for size in sys.argv[2].split(',')) if len(sys.argv) > 2 else DEFAULT_SIZES
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_ROUNDS
+    results = run(sizes, rounds)
+    if command == 'save':
+        print_results(results)
+        with open(BASELINE_PATH, "w") as file:
+            json.dump({'environment': environment(), 'results': results}, file, indent=2)
+        print(f"baseline written to {BASELINE_PATH}")
+    elif command == 'compare':
+        with open(BASELINE_PATH) as file:
+            baseline = json.load(file)
+        if baseline['environment'] != environment():
+            print(f"warning: the baseline was measured on {baseline['environment']}")
+        if print_results(results, baseline['results']):
+            sys.exit(1)
+    else:
+        print_results(results)
+
+if __name__ == "__main__":
+    main_cli()
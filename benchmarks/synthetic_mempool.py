@@ -0,0 +1,250 @@
+"""
+Generates synthetic mempools in the JSON format of mining-a-block/mempool/, with real signatures.
+
+Transactions alternate between P2PKH spends (the kind bitcoinlib validates) and taproot key path
+spends (verified by the schnorr module), with 1 or 2 inputs and 1 or 2 outputs each. About 2% of them
+carry a corrupted signature, so that the rejection paths are exercised too. The spent outputs are
+random and never collide. A mempool is fully determined by its size and seed.
+
+Usage: python synthetic_mempool.py <size> <output folder> [seed]
+"""
+import hashlib
+import json
+import random
+import sys
+import time
+from pathlib import Path
+import base58
+from ecdsa import SigningKey, SECP256k1, util
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "mining-a-block" / "python"))
+from sighash import SighashCache, tagged_hash
+from txparser import parse_transaction, serialize_varint
+
+N = SECP256k1.order
+BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+BECH32M_CONSTANT = 0x2bc830a3
+INVALID_FRACTION = 0.02
+#keys are reused across transactions like addresses of a busy wallet
+KEY_COUNT = 64
+
+def hash256(data):
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+def hash160(data):
+    return hashlib.new('ripemd160', hashlib.sha256(data).digest()).digest()
+
+def push_data(data):
+    """
+    :param data: Up to 75 bytes to push.
+    :return: The push opcode followed by the data.
+    """
+    return bytes([len(data)]) + data
+
+def bech32m_address(program, hrp="bc", version=1):
+    """
+    Encodes a segwit v1+ witness program as a bech32m address (BIP350).
+
+    :param program: The witness program.
+    :param hrp: The human readable part.
+    :param version: The witness version.
+    :return: The address string.
+    """
+    data = [version]
+    accumulator, bits = 0, 0
+    for byte in program:
+        accumulator = accumulator << 8 | byte
+        bits += 8
+        while bits >= 5:
+            bits -= 5
+            data.append(accumulator >> bits & 31)
+    if bits:
+        data.append(accumulator << (5 - bits) & 31)
+    values = [ord(character) >> 5 for character in hrp] + [0] + [ord(character) & 31 for character in hrp] + data
+    checksum = 1
+    for value in values + [0] * 6:
+        top = checksum >> 25
+        checksum = (checksum & 0x1ffffff) << 5 ^ value
+        for i, generator in enumerate((0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)):
+            if top >> i & 1:
+                checksum ^= generator
+    checksum ^= BECH32M_CONSTANT
+    return hrp + "1" + "".join(BECH32_CHARSET[d] for d in data + [checksum >> 5 * (5 - i) & 31 for i in range(6)])
+
+class SyntheticKey:
+    """
+    A private key with its P2PKH and P2TR output scripts.
+    """
+
+    def __init__(self, secret):
+        self.signing_key = SigningKey.from_secret_exponent(secret, curve=SECP256k1)
+        point = SECP256k1.generator * secret
+        self.pubkey = (b'\x03' if point.y() & 1 else b'\x02') + point.x().to_bytes(32, 'big')
+        #BIP340 signs with the secret whose public key has an even y
+        self.taproot_secret = secret if point.y() % 2 == 0 else N - secret
+        self.xonly = point.x().to_bytes(32, 'big')
+        pubkey_hash = hash160(self.pubkey)
+        self.p2pkh_script = b'\x76\xa9\x14' + pubkey_hash + b'\x88\xac'
+        self.p2pkh_address = base58.b58encode_check(b'\x00' + pubkey_hash).decode()
+        self.p2tr_script = b'\x51\x20' + self.xonly
+        self.p2tr_address = bech32m_address(self.xonly)
+
+    def sign_ecdsa(self, digest):
+        """
+        :return: A low-S DER signature of the digest with SIGHASH_ALL appended.
+        """
+        r, s = self.signing_key.sign_digest_deterministic(digest, sigencode=lambda r, s, order: (r, s))
+        return util.sigencode_der(r, min(s, N - s), N) + b'\x01'
+
+    def sign_schnorr(self, message, aux):
+        """
+        :return: A BIP340 signature of the message.
+        """
+        secret = self.taproot_secret
+        masked = (secret ^ int.from_bytes(tagged_hash("BIP0340/aux", aux), 'big')).to_bytes(32, 'big')
+        nonce = int.from_bytes(tagged_hash("BIP0340/nonce", masked + self.xonly + message), 'big') % N
+        point = SECP256k1.generator * nonce
+        if point.y() % 2:
+            nonce = N - nonce
+        r = point.x().to_bytes(32, 'big')
+        challenge = int.from_bytes(tagged_hash("BIP0340/challenge", r + self.xonly + message), 'big') % N
+        return r + ((nonce + challenge * secret) % N).to_bytes(32, 'big')
+
+def script_asm(script):
+    """
+    :return: The ASM string of a P2PKH, P2TR or scriptSig of pushes, as the mempool files write it.
+    """
+    if len(script) == 25 and script[:3] == b'\x76\xa9\x14':
+        return f"OP_DUP OP_HASH160 OP_PUSHBYTES_20 {script[3:23].hex()} OP_EQUALVERIFY OP_CHECKSIG"
+    if len(script) == 34 and script[:2] == b'\x51\x20':
+        return f"OP_PUSHNUM_1 OP_PUSHBYTES_32 {script[2:].hex()}"
+    tokens = []
+    offset = 0
+    while offset < len(script):
+        length = script[offset]
+        tokens += [f"OP_PUSHBYTES_{length}", script[offset + 1:offset + 1 + length].hex()]
+        offset += 1 + length
+    return " ".join(tokens)
+
+def output_json(value, key, taproot):
+    script = key.p2tr_script if taproot else key.p2pkh_script
+    return {'scriptpubkey': script.hex(), 'scriptpubkey_asm': script_asm(script),
+            'scriptpubkey_type': 'v1_p2tr' if taproot else 'p2pkh',
+            'scriptpubkey_address': key.p2tr_address if taproot else key.p2pkh_address, 'value': value}
+
+def serialize(version, inputs, outputs, locktime, script_sigs=None, witnesses=None):
+    """
+    Serializes a transaction.
+
+    :param inputs: A list of (txid, vout, sequence) tuples.
+    :param outputs: A list of (value, script) tuples.
+    :param script_sigs: The scriptSig of each input, empty by default.
+    :param witnesses: The witness stack of each input, or None for a legacy serialization.
+    :return: The serialized transaction.
+    """
+    script_sigs = script_sigs or [b''] * len(inputs)
+    parts = [version.to_bytes(4, 'little')]
+    if witnesses is not None:
+        parts.append(b'\x00\x01')
+    parts.append(serialize_varint(len(inputs)))
+    for (txid, vout, sequence), script_sig in zip(inputs, script_sigs):
+        parts += [bytes.fromhex(txid)[::-1], vout.to_bytes(4, 'little'), serialize_varint(len(script_sig)), script_sig,
+                  sequence.to_bytes(4, 'little')]
+    parts.append(serialize_varint(len(outputs)))
+    for value, script in outputs:
+        parts += [value.to_bytes(8, 'little'), serialize_varint(len(script)), script]
+    if witnesses is not None:
+        for stack in witnesses:
+            parts.append(serialize_varint(len(stack)))
+            for item in stack:
+                parts += [serialize_varint(len(item)), item]
+    parts.append(locktime.to_bytes(4, 'little'))
+    return b''.join(parts)
+
+def legacy_sighash(version, inputs, outputs, locktime, index, script):
+    """
+    :return: The SIGHASH_ALL signature hash of a legacy input.
+    """
+    script_sigs = [script if position == index else b'' for position in range(len(inputs))]
+    return hash256(serialize(version, inputs, outputs, locktime, script_sigs) + b'\x01\x00\x00\x00')
+
+def generate_transaction(rng, keys):
+    """
+    Builds one signed transaction and its JSON description.
+
+    :param rng: A random.Random instance.
+    :param keys: The SyntheticKey objects to spend from and pay to.
+    :return: The transaction as a dictionary in the format of the mempool files.
+    """
+    taproot = rng.random() < 0.5
+    spent = [(rng.randrange(20000, 5000000), rng.choice(keys)) for _ in range(rng.choice((1, 1, 2)))]
+    inputs = [(rng.randbytes(32).hex(), rng.randrange(4), 0xfffffffd) for _ in spent]
+    total = sum(value for value, _ in spent)
+    fee = rng.randrange(200, 20000)
+    paid = [(total - fee, rng.choice(keys))] if rng.random() < 0.4 else \
+        [(value, rng.choice(keys)) for value in ((total - fee) // 3, total - fee - (total - fee) // 3)]
+    outputs = [(value, key.p2tr_script if taproot else key.p2pkh_script) for value, key in paid]
+    version, locktime = 2, 0
+    if taproot:
+        unsigned = serialize(version, inputs, outputs, locktime, witnesses=[[bytes(64)] for _ in inputs])
+        sighashes = SighashCache(unsigned, parse_transaction(unsigned), [(value, key.p2tr_script) for value, key in spent])
+        witnesses = [[key.sign_schnorr(sighashes.taproot_key_path(index), rng.randbytes(32))]
+                     for index, (_, key) in enumerate(spent)]
+        script_sigs = None
+    else:
+        witnesses = None
+        script_sigs = [push_data(key.sign_ecdsa(legacy_sighash(version, inputs, outputs, locktime, index, key.p2pkh_script))) +
+                       push_data(key.pubkey) for index, (_, key) in enumerate(spent)]
+    if rng.random() < INVALID_FRACTION:
+        #flip a bit inside the first signature
+        if witnesses is not None:
+            witnesses[0][0] = bytes([witnesses[0][0][0] ^ 1]) + witnesses[0][0][1:]
+        else:
+            script_sigs[0] = script_sigs[0][:10] + bytes([script_sigs[0][10] ^ 1]) + script_sigs[0][11:]
+    raw = serialize(version, inputs, outputs, locktime, script_sigs, witnesses)
+    tx = parse_transaction(raw)
+    vin = []
+    for index, ((txid, vout, sequence), (value, key)) in enumerate(zip(inputs, spent)):
+        script_sig = script_sigs[index] if script_sigs else b''
+        entry = {'txid': txid, 'vout': vout, 'prevout': output_json(value, key, taproot),
+                 'scriptsig': script_sig.hex(), 'scriptsig_asm': script_asm(script_sig)}
+        if witnesses is not None:
+            entry['witness'] = [item.hex() for item in witnesses[index]]
+        entry['is_coinbase'] = False
+        entry['sequence'] = sequence
+        vin.append(entry)
+    return {'txid': tx.txid, 'version': version, 'locktime': locktime, 'vin': vin,
+            'vout': [output_json(value, key, taproot) for value, key in paid], 'size': tx.size, 'weight': tx.weight,
+            'fee': fee, 'status': {'confirmed': False}, 'hex': raw.hex()}
+
+def generate_mempool(size, folder, seed=0):
+    """
+    Writes a synthetic mempool of size transactions to folder/<txid>.json.
+    A folder generated before with the same size and seed is reused as is; the parameters are
+    stamped in a .seed file next to it, as the miner reads every file of the folder.
+
+    :param size: The number of transactions.
+    :param folder: The output folder.
+    :param seed: The random seed.
+    :return: The folder as a Path.
+    """
+    folder = Path(folder)
+    stamp = folder.with_suffix(".seed")
+    if stamp.exists() and stamp.read_text() == f"{size} {seed}":
+        return folder
+    folder.mkdir(parents=True, exist_ok=True)
+    for path in folder.glob("*.json"):
+        path.unlink()
+    rng = random.Random(seed)
+    keys = [SyntheticKey(rng.randrange(1, N)) for _ in range(KEY_COUNT)]
+    for _ in range(size):
+        data = generate_transaction(rng, keys)
+        with open(folder / f"{data['txid']}.json", "w") as file:
+            json.dump(data, file, indent=2)
+    stamp.write_text(f"{size} {seed}")
+    return folder
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    generate_mempool(int(sys.argv[1]), sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+    print(f"generated {sys.argv[1]} transactions in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,171 @@
+"""
+Signs many transactions spending m-of-n P2SH-P2WSH multisig outputs in bulk.
+
+A transaction is described by a dictionary:
+    {"version": 1, "locktime": 0,
+     "inputs": [{"txid": "...", "vout": 0, "value": 100000, "sequence": 4294967295, "m": 2,
+                 "keys": ["<private key hex>", ...], "pubkeys": ["<compressed public key hex>", ...]}],
+     "outputs": [{"address": "325UUecEQuyrTd28Xs2hvAxdAjHM7XzqVF", "value": 100000}]}
+"pubkeys" lists the n keys of the witness script in order and can be left out when "keys" holds all of them
+(the witness script then uses the order of "keys"). "sequence", "version" and "locktime" are optional, and
+an output can give a "script" in hex instead of an "address".
+
+Parsed keys and witness scripts are cached, the BIP143 hashes shared by the inputs of a transaction are
+computed once, and the transactions are spread over a process pool.
+
+Usage:
+    python batch_signer.py <transactions.json> [signed.txt] [processes]    writes one signed transaction hex per line
+    python batch_signer.py benchmark [inputs] [processes]                  signs synthetic 2-of-2 inputs
+"""
+import functools
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import base58
+from bitcoin.core import CTxIn, CTxOut, COutPoint, CTxInWitness, CTxWitness, CScriptWitness, CMutableTransaction
+from bitcoin.core.script import CScript, OP_HASH160, OP_EQUAL, OP_DUP, OP_EQUALVERIFY, OP_CHECKSIG
+from derivation import public_key, derive
+from main import sign_with_ecdsa, calculate_signature_hash, precompute_signature_hashes
+
+#base58 version bytes of P2SH and P2PKH addresses, mainnet and testnet
+P2SH_VERSIONS = (0x05, 0xc4)
+P2PKH_VERSIONS = (0x00, 0x6f)
+#transactions per task sent to a worker process
+CHUNK_SIZE = 64
+
+@functools.lru_cache(maxsize=4096)
+def multisig_scripts(m, pubkeys):
+    """
+    The witness script of an m-of-n input and the scriptSig of its P2SH-P2WSH output, once per set of keys.
+
+    :param m: The number of signatures required.
+    :param pubkeys: A tuple of the n compressed public keys (bytes), in script order.
+    :return: A tuple of the witness script and the scriptSig pushing the P2WSH redeem script (CScript).
+    """
+    derivation = derive(m, pubkeys)
+    return CScript(derivation.witness_script), CScript([derivation.redeem_script])
+
+@functools.lru_cache(maxsize=4096)
+def output_script(address):
+    """
+    :param address: A base58 P2SH or P2PKH address.
+    :return: The scriptPubKey paying to the address (CScript).
+    """
+    payload = base58.b58decode_check(address)
+    if payload[0] in P2SH_VERSIONS:
+        return CScript([OP_HASH160, payload[1:], OP_EQUAL])
+    if payload[0] in P2PKH_VERSIONS:
+        return CScript([OP_DUP, OP_HASH160, payload[1:], OP_EQUALVERIFY, OP_CHECKSIG])
+    raise ValueError(f"unsupported address version {payload[0]} of {address}")
+
+def input_keys(tx_input):
+    """
+    Resolves the witness script of an input and the private keys that sign it.
+
+    :param tx_input: An input description.
+    :return: A tuple of the witness script, the scriptSig and the m private keys to sign with, in script order.
+    """
+    m = tx_input.get('m', 2)
+    keys = tx_input['keys']
+    if 'pubkeys' in tx_input:
+        pubkeys = tuple(bytes.fromhex(pubkey) for pubkey in tx_input['pubkeys'])
+    else:
+        pubkeys = tuple(public_key(key) for key in keys)
+    witness_script, script_sig = multisig_scripts(m, pubkeys)
+    by_pubkey = {public_key(key): key for key in keys}
+    #CHECKMULTISIG needs the signatures in the order of their public keys in the script
+    signers = [by_pubkey[pubkey] for pubkey in pubkeys if pubkey in by_pubkey][:m]
+    if len(signers) < m:
+        raise ValueError(f"{len(signers)} of the {m} keys needed to spend {tx_input['txid']}:{tx_input['vout']}")
+    return witness_script, script_sig, signers
+
+def sign_transaction(description):
+    """
+    Builds and signs one transaction.
+
+    :param description: A transaction description.
+    :return: The signed transaction in hexadecimal format.
+    """
+    inputs = [input_keys(tx_input) for tx_input in description['inputs']]
+    vin = [CTxIn(COutPoint(bytes.fromhex(tx_input['txid'])[::-1], tx_input['vout']), scriptSig=script_sig,
+                 nSequence=tx_input.get('sequence', 0xffffffff))
+           for tx_input, (_, script_sig, _) in zip(description['inputs'], inputs)]
+    vout = [CTxOut(output['value'], CScript(bytes.fromhex(output['script'])) if 'script' in output else output_script(output['address']))
+            for output in description['outputs']]
+    tx = CMutableTransaction(vin, vout, nLockTime=description.get('locktime', 0), nVersion=description.get('version', 1))
+    precomputed = precompute_signature_hashes(tx)
+    witnesses = []
+    for index, (tx_input, (witness_script, _, signers)) in enumerate(zip(description['inputs'], inputs)):
+        sighash = calculate_signature_hash(tx, witness_script, tx_input['value'], index, precomputed)
+        #the leading empty item is consumed by the off-by-one bug of OP_CHECKMULTISIG
+        stack = [b''] + [sign_with_ecdsa(sighash, key) for key in signers] + [bytes(witness_script)]
+        witnesses.append(CTxInWitness(CScriptWitness(stack)))
+    tx.wit = CTxWitness(witnesses)
+    return tx.serialize().hex()
+
+def sign_chunk(descriptions):
+    """
+    Signs a chunk of transactions in a worker process.
+
+    :param descriptions: A list of transaction descriptions.
+    :return: The list of signed transactions in hexadecimal format.
+    """
+    return [sign_transaction(description) for description in descriptions]
+
+def sign_transactions(descriptions, processes=None):
+    """
+    Signs transactions over a process pool, in chunks of CHUNK_SIZE.
+
+    :param descriptions: A list of transaction descriptions.
+    :param processes: The number of worker processes, the number of CPUs by default. 1 signs in this process.
+    :return: The list of signed transactions in hexadecimal format, in the order of descriptions.
+    """
+    processes = processes or os.cpu_count() or 1
+    chunks = [descriptions[i:i + CHUNK_SIZE] for i in range(0, len(descriptions), CHUNK_SIZE)]
+    if processes == 1 or len(chunks) <= 1:
+        return [tx_hex for chunk in chunks for tx_hex in sign_chunk(chunk)]
+    with ProcessPoolExecutor(processes) as executor:
+        return [tx_hex for signed in executor.map(sign_chunk, chunks) for tx_hex in signed]
+
+def benchmark(count, processes=None):
+    """
+    Signs count 2-of-2 inputs spread over transactions of 10 inputs, spending the outputs of the exercise keys.
+
+    :param count: The number of inputs.
+    :param processes: The number of worker processes.
+    :return: The number of inputs signed per second.
+    """
+    keys = ["5077ccd9c558b7d04a81920d38aa11b4a9f9de3b23fab45c3ef28039920fdd6d",
+            "39dc0a9f0b185a2ee56349691f34716e6e0cda06a7f9707742ac113c4e2317bf"]
+    descriptions = []
+    for start in range(0, count, 10):
+        inputs = [{'txid': hashlib.sha256(index.to_bytes(8, 'little')).hexdigest(), 'vout': 0, 'value': 100000, 'keys': keys}
+                  for index in range(start, min(start + 10, count))]
+        descriptions.append({'inputs': inputs, 'outputs': [{'address': "325UUecEQuyrTd28Xs2hvAxdAjHM7XzqVF",
+                                                            'value': 100000 * len(inputs) - 5000}]})
+    start = time.perf_counter()
+    sign_transactions(descriptions, processes)
+    return count / (time.perf_counter() - start)
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+        processes = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        print(f"{benchmark(count, processes):.0f} inputs/s")
+        return
+    with open(sys.argv[1]) as file:
+        descriptions = json.load(file)
+    out_path = sys.argv[2] if len(sys.argv) > 2 else "signed.txt"
+    processes = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    start = time.perf_counter()
+    signed = sign_transactions(descriptions, processes)
+    with open(out_path, "w") as file:
+        file.write("\n".join(signed) + "\n")
+    inputs = sum(len(description['inputs']) for description in descriptions)
+    print(f"Signed {len(signed)} transactions ({inputs} inputs) in {time.perf_counter() - start:.2f}s, written to '{out_path}'")
+
+if __name__ == "__main__":
+    main()
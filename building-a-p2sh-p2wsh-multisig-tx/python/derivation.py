@@ -0,0 +1,226 @@
+"""
+Derives everything about an m-of-n P2SH-P2WSH multisig output from its public keys in one pass:
+the witness script, the P2WSH redeem script, the P2SH scriptPubKey and the base58 address.
+Results are memoized, bulk derivation is spread over a process pool, and vanity_search looks for
+a key that gives an address with a chosen prefix.
+
+Usage:
+    python derivation.py bulk [count] [processes]                 derives count 2-of-2 addresses from fresh keys
+    python derivation.py vanity <prefix> [processes] [max keys]   searches a second key for a 2-of-2 address with the prefix
+"""
+import functools
+import hashlib
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import base58
+import secp256k1
+
+P2SH_VERSION = b'\x05'
+#every P2SH address encodes a 25-byte payload starting with P2SH_VERSION in 34 base58 characters
+P2SH_ADDRESS_LENGTH = 34
+OP_CHECKMULTISIG = 0xae
+#key sets per task sent to a worker process
+CHUNK_SIZE = 4096
+#candidate keys per vanity task
+VANITY_CHUNK = 8192
+
+Derivation = namedtuple('Derivation', ['witness_script', 'redeem_script', 'script_pubkey', 'address'])
+
+def encode_public_key(point):
+    """
+    :param point: An affine (x, y) tuple.
+    :return: The compressed public key (bytes).
+    """
+    return (b'\x03' if point[1] & 1 else b'\x02') + point[0].to_bytes(32, 'big')
+
+def consecutive_public_keys(start, count):
+    """
+    Computes the public keys of count consecutive private keys: each one is the previous one plus G,
+    and all of them are converted to affine coordinates with a single inversion.
+
+    :param start: The first private key, as an integer.
+    :param count: The number of keys.
+    :return: The list of compressed public keys (bytes).
+    """
+    point = secp256k1.multiply_generator(start)
+    jacobian = [(point[0], point[1], 1)]
+    for _ in range(count - 1):
+        jacobian.append(secp256k1.jacobian_add_affine(jacobian[-1], secp256k1.G))
+    return [encode_public_key(point) for point in secp256k1.to_affine_all(jacobian)]
+
+@functools.lru_cache(maxsize=65536)
+def public_key(private_key_hex):
+    """
+    :param private_key_hex: The private key in hexadecimal format.
+    :return: The compressed public key (bytes).
+    """
+    return encode_public_key(secp256k1.multiply_generator(int(private_key_hex, 16)))
+
+def derive_uncached(m, pubkeys):
+    """
+    Derives the scripts and address of an m-of-n multisig output, hashing each step once.
+
+    :param m: The number of signatures required, 1 to 16.
+    :param pubkeys: A sequence of the n compressed public keys (bytes), in script order, m to 16 of them.
+    :return: A Derivation of bytes scripts and the address string.
+    :raises ValueError: If m and n aren't 1 <= m <= n <= 16, the range OP_1 to OP_16 can push.
+    """
+    if not 1 <= m <= len(pubkeys) <= 16:
+        raise ValueError(f"a {m}-of-{len(pubkeys)} multisig can't be scripted")
+    witness_script = bytes([0x50 + m]) + b''.join(bytes([len(pubkey)]) + pubkey for pubkey in pubkeys) + \
+        bytes([0x50 + len(pubkeys), OP_CHECKMULTISIG])
+    redeem_script = b'\x00\x20' + hashlib.sha256(witness_script).digest()
+    script_hash = hashlib.new('ripemd160', hashlib.sha256(redeem_script).digest()).digest()
+    return Derivation(witness_script, redeem_script, b'\xa9\x14' + script_hash + b'\x87',
+                      base58.b58encode_check(P2SH_VERSION + script_hash).decode())
+
+@functools.lru_cache(maxsize=65536)
+def derive(m, pubkeys):
+    """
+    The memoized derive_uncached.
+
+    :param m: The number of signatures required.
+    :param pubkeys: A tuple of the n compressed public keys (bytes), in script order.
+    :return: A Derivation.
+    """
+    return derive_uncached(m, pubkeys)
+
+def derive_from_private_keys(m, private_keys):
+    """
+    :param m: The number of signatures required.
+    :param private_keys: The n private keys in hexadecimal format, in script order.
+    :return: A Derivation.
+    """
+    return derive(m, tuple(public_key(key) for key in private_keys))
+
+def derive_chunk(m, key_sets):
+    """
+    Derives a chunk of key sets in a worker process, bypassing the cache as every key set is new.
+
+    :param m: The number of signatures required.
+    :param key_sets: A list of tuples of public keys.
+    :return: The list of Derivations.
+    """
+    return [derive_uncached(m, pubkeys) for pubkeys in key_sets]
+
+def bulk_derive(m, key_sets, processes=None):
+    """
+    Derives many multisig outputs over a process pool, in chunks of CHUNK_SIZE.
+
+    :param m: The number of signatures required.
+    :param key_sets: A list of tuples of public keys.
+    :param processes: The number of worker processes, the number of CPUs by default. 1 derives in this process.
+    :return: The list of Derivations, in the order of key_sets.
+    """
+    processes = processes or os.cpu_count() or 1
+    chunks = [key_sets[i:i + CHUNK_SIZE] for i in range(0, len(key_sets), CHUNK_SIZE)]
+    if processes == 1 or len(chunks) <= 1:
+        return [derivation for chunk in chunks for derivation in derive_chunk(m, chunk)]
+    with ProcessPoolExecutor(processes) as executor:
+        return [derivation for derived in executor.map(derive_chunk, [m] * len(chunks), chunks) for derivation in derived]
+
+def prefix_reachable(prefix):
+    """
+    Checks that some P2SH address starts with prefix: the payload's version byte bounds the
+    first characters, e.g. every address starts with 3 and its second character is 1 to R.
+
+    :param prefix: An address prefix.
+    :return: True if an address can start with prefix.
+    """
+    alphabet = base58.BITCOIN_ALPHABET.decode()
+    if len(prefix) > P2SH_ADDRESS_LENGTH or any(character not in alphabet for character in prefix):
+        return False
+    lowest = highest = 0
+    for low, high in zip(prefix.ljust(P2SH_ADDRESS_LENGTH, alphabet[0]), prefix.ljust(P2SH_ADDRESS_LENGTH, alphabet[-1])):
+        lowest = lowest * 58 + alphabet.index(low)
+        highest = highest * 58 + alphabet.index(high)
+    version = P2SH_VERSION[0]
+    return lowest < (version + 1) << 192 and highest >= version << 192
+
+def vanity_chunk(m, pubkeys, position, prefix, start):
+    """
+    Tries the VANITY_CHUNK private keys from start at position in the key set.
+
+    :param m: The number of signatures required.
+    :param pubkeys: A tuple of the other public keys.
+    :param position: Where the searched key goes in the script.
+    :param prefix: The address prefix to look for.
+    :param start: The first private key to try, as an integer.
+    :return: A tuple of the private key and its Derivation, or None if no key of the chunk matches.
+    """
+    for offset, candidate in enumerate(consecutive_public_keys(start, VANITY_CHUNK)):
+        key_set = pubkeys[:position] + (candidate,) + pubkeys[position:]
+        derivation = derive_uncached(m, key_set)
+        if derivation.address.startswith(prefix):
+            return format(start + offset, '064x'), derivation
+    return None
+
+def vanity_search(m, pubkeys, prefix, position=None, processes=None, max_keys=None):
+    """
+    Searches for a private key that, added to the other keys, gives a P2SH address starting with prefix.
+    Each base58 character after the leading 3 multiplies the expected work by about 58.
+
+    :param m: The number of signatures required.
+    :param pubkeys: A tuple of the other compressed public keys, in script order.
+    :param prefix: The address prefix, starting with 3.
+    :param position: Where the searched key goes in the script, last by default.
+    :param processes: The number of worker processes, the number of CPUs by default.
+    :param max_keys: The number of keys to try at most, rounded up to a multiple of VANITY_CHUNK; no limit by default.
+    :return: A tuple of the private key in hexadecimal format, its Derivation and the number of keys tried,
+             or None if no key was found within max_keys.
+    :raises ValueError: If no P2SH address starts with prefix.
+    """
+    if not prefix_reachable(prefix):
+        raise ValueError(f"P2SH addresses can't start with {prefix!r}")
+    #refuse an m-of-n that can't be scripted here rather than in every worker
+    derive_uncached(m, pubkeys + (encode_public_key(secp256k1.G),))
+    position = len(pubkeys) if position is None else position
+    processes = processes or os.cpu_count() or 1
+    #a random starting key, leaving room for 2^64 keys below the group order
+    start = int.from_bytes(os.urandom(32), 'big') % (secp256k1.N - (1 << 64)) + 1
+    submitted = 0
+    tried = 0
+    with ProcessPoolExecutor(processes) as executor:
+        pending = set()
+        while True:
+            while len(pending) < 2 * processes and (max_keys is None or submitted < max_keys):
+                pending.add(executor.submit(vanity_chunk, m, pubkeys, position, prefix, start))
+                start += VANITY_CHUNK
+                submitted += VANITY_CHUNK
+            if not pending:
+                return None
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                tried += VANITY_CHUNK
+                if future.result() is not None:
+                    for other in pending:
+                        other.cancel()
+                    return (*future.result(), tried)
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else 'bulk'
+    processes = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    start = time.perf_counter()
+    if command == 'vanity':
+        fixed = (public_key("39dc0a9f0b185a2ee56349691f34716e6e0cda06a7f9707742ac113c4e2317bf"),)
+        max_keys = int(sys.argv[4]) if len(sys.argv) > 4 else None
+        found = vanity_search(2, fixed, sys.argv[2], processes=processes, max_keys=max_keys)
+        if found is None:
+            print(f"No address starting with {sys.argv[2]} within {max_keys} keys")
+            return
+        private_key, derivation, tried = found
+        print(f"{derivation.address} with key {private_key} after {tried} keys in {time.perf_counter() - start:.1f}s")
+        return
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    keys = consecutive_public_keys(int.from_bytes(os.urandom(16), 'big'), count + 1)
+    key_sets = [(keys[i], keys[i + 1]) for i in range(count)]
+    start = time.perf_counter()
+    bulk_derive(2, key_sets, processes)
+    elapsed = time.perf_counter() - start
+    print(f"Derived {count} addresses in {elapsed:.2f}s ({count / elapsed:.0f} addresses/s)")
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,32 @@
+import functools
 import hashlib
-from bitcoinlib.transactions import Key
-import base58
-from bitcoin.core import CTxIn, CTxOut, COutPoint,CTxInWitness, CTxWitness,CScriptWitness, CMutableTransaction, x
-from bitcoin.core.script import CScript, SignatureHash, SIGHASH_ALL
+import os
+from bitcoin.core import CTxIn, CTxOut, COutPoint,CTxInWitness, CTxWitness,CScriptWitness, CMutableTransaction
+from bitcoin.core.script import CScript, SIGHASH_ALL
+from bitcoin.core.serialize import BytesSerializer
 from ecdsa import SigningKey, SECP256k1, util
-from bitcoin.core.script import OP_HASH160, OP_EQUAL, OP_2, OP_CHECKMULTISIG
+import base58
+import secp256k1
+from derivation import derive_from_private_keys, P2SH_VERSION
+
+#"precomputed" signs with the generator table of secp256k1.py, "ecdsa" with python-ecdsa; both give the same bytes
+SIGNING_BACKENDS = ("precomputed", "ecdsa")
+signing_backend = os.environ.get("SIGNING_BACKEND", "precomputed")
+if signing_backend not in SIGNING_BACKENDS:
+    raise ValueError(f"unknown signing backend {signing_backend}, expected one of {SIGNING_BACKENDS}")
 
 def generate_witness_script_hash(private_key_1, private_key_2):
     """
-    Generates a witness script and its corresponding SHA-256 hash.
-    This function takes two private keys, derives their public keys, and constructs
-    a 2-of-2 multisig witness script. The script is then hashed using SHA-256 to
-    generate the witness script hash.
+    Generates the witness script of the 2-of-2 multisig of two private keys and its SHA-256 hash.
+    The public key of private_key_2 comes first in the script.
 
     :param private_key_1: First private key (hex or bytes)
     :param private_key_2: Second private key (hex or bytes)
     :return: Tuple containing the witness script and its SHA-256 hash
     """
-    private_key_1 = Key(private_key_1)
-    private_key_2 = Key(private_key_2)
-    public_keys = [private_key_2.public(), private_key_1.public()]
-    witness_script = CScript([OP_2 ,private_key_2.public().as_bytes() ,private_key_1.public().as_bytes() , OP_2 , OP_CHECKMULTISIG])
-    print("witness script: ", witness_script)
-    witness_script_bytes = bytes(witness_script)
-    witness_script_hash = hashlib.sha256(witness_script_bytes).digest()
-    return witness_script, witness_script_hash
+    private_keys = [key.hex() if isinstance(key, bytes) else key for key in (private_key_2, private_key_1)]
+    derivation = derive_from_private_keys(2, private_keys)
+    return CScript(derivation.witness_script), derivation.redeem_script[2:]
 
 def generate_redeem_script(witness_script_hash):
     """
@@ -40,29 +42,77 @@ def generate_address(redeem_script):
     Generates the P2SH address
 
     :param: redeem_script: The redeem script in bytes
-    :return: The P2SH address in bytes
+    :return: The P2SH address (str)
+    """
+    script_hash = hashlib.new('ripemd160', hashlib.sha256(redeem_script).digest()).digest()
+    return base58.b58encode_check(P2SH_VERSION + script_hash).decode()
+
+def hash256(data):
     """
-    sha256_hash = hashlib.sha256(redeem_script).digest()
-    script_hash = hashlib.new('ripemd160', sha256_hash).digest()
-    prefix = b'\x05'
-    payload = prefix + script_hash
-    checksum = hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
-    address_bytes = payload + checksum
-    p2sh_address = base58.b58encode(address_bytes).decode('utf-8')
-    return p2sh_address
+    Computes the double SHA-256 hash of the given bytes object.
 
-def calculate_signature_hash(tx,witness_script, value):
+    :param data: A bytes object
+    :return: The double SHA-256 hash as a bytes object
+    """
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+def precompute_signature_hashes(tx):
+    """
+    Computes the BIP143 hashes shared by the signature hash of every input of a SegWit transaction.
+    They only depend on the transaction, so a transaction with N inputs computes them once instead of N times.
+
+    :param tx: The transaction object to sign.
+    :return: A tuple of hashPrevouts, hashSequence and hashOutputs (bytes).
+    """
+    hash_prevouts = hash256(b''.join(txin.prevout.serialize() for txin in tx.vin))
+    hash_sequence = hash256(b''.join(txin.nSequence.to_bytes(4, byteorder='little') for txin in tx.vin))
+    hash_outputs = hash256(b''.join(txout.serialize() for txout in tx.vout))
+    return hash_prevouts, hash_sequence, hash_outputs
+
+def calculate_signature_hash(tx,witness_script, value, in_idx=0, precomputed=None):
     """
     Calculates the signature hash for a transaction input.
-    This function generates a signature hash for a SegWit transaction
+    This function generates a BIP143 signature hash with SIGHASH_ALL for a SegWit transaction
 
     :param tx: The transaction object to sign.
     :param witness_script: The witness script corresponding to the input.
     :param value: The amount being spent (in satoshis).
+    :param in_idx: The index of the input being signed.
+    :param precomputed: The result of precompute_signature_hashes(tx), to reuse it across the inputs of tx.
     :return: The computed signature hash
     """
-    sighash = SignatureHash(script=CScript(bytes(witness_script)), txTo=tx, inIdx=0, hashtype=SIGHASH_ALL, amount=value, sigversion=1)
-    return sighash
+    if precomputed is None:
+        precomputed = precompute_signature_hashes(tx)
+    hash_prevouts, hash_sequence, hash_outputs = precomputed
+    txin = tx.vin[in_idx]
+    preimage = (tx.nVersion.to_bytes(4, byteorder='little') + hash_prevouts + hash_sequence +
+        txin.prevout.serialize() + BytesSerializer.serialize(bytes(witness_script)) +
+        value.to_bytes(8, byteorder='little') + txin.nSequence.to_bytes(4, byteorder='little') + hash_outputs +
+        tx.nLockTime.to_bytes(4, byteorder='little') + SIGHASH_ALL.to_bytes(4, byteorder='little'))
+    return hash256(preimage)
+
+@functools.lru_cache(maxsize=4096)
+def load_signing_key(private_key_hex):
+    """
+    Parses a private key once; later calls with the same key return the cached SigningKey.
+
+    :param private_key_hex: The private key in hexadecimal format (str).
+    :return: The ecdsa SigningKey.
+    """
+    return SigningKey.from_string(bytes.fromhex(private_key_hex), curve=SECP256k1)
+
+@functools.lru_cache(maxsize=4096)
+def load_secret(private_key_hex):
+    """
+    Parses a private key into the integer the precomputed backend signs with.
+
+    :param private_key_hex: The private key in hexadecimal format (str).
+    :return: The private key as an integer.
+    """
+    secret = int(private_key_hex, 16)
+    if not 1 <= secret < secp256k1.N:
+        raise ValueError("private key out of range")
+    return secret
 
 def sign_with_ecdsa(sighash, private_key_hex):
     """
@@ -72,8 +122,9 @@ def sign_with_ecdsa(sighash, private_key_hex):
     :param private_key_hex: The private key in hexadecimal format (str).
     :return: The DER-encoded ECDSA signature with SIGHASH_ALL appended (bytes).
     """
-    private_key_bytes = bytes.fromhex(private_key_hex)
-    signing_key = SigningKey.from_string(private_key_bytes, curve=SECP256k1)
+    if signing_backend == "precomputed":
+        return secp256k1.sign_digest(sighash, load_secret(private_key_hex)) + bytes([SIGHASH_ALL])
+    signing_key = load_signing_key(private_key_hex)
     signature = signing_key.sign_digest_deterministic(sighash, sigencode=util.sigencode_der)
     r, s = util.sigdecode_der(signature, signing_key.curve.order)
     curve_order = signing_key.curve.order
@@ -98,19 +149,20 @@ def add_witness_stack(tx,witness_items):
 def main():
     private_key_1 = "39dc0a9f0b185a2ee56349691f34716e6e0cda06a7f9707742ac113c4e2317bf"
     private_key_2 = "5077ccd9c558b7d04a81920d38aa11b4a9f9de3b23fab45c3ef28039920fdd6d"
-    witness_script, witness_script_hash = generate_witness_script_hash(private_key_1, private_key_2)
-    redeem_script=generate_redeem_script(witness_script_hash)
-    recipient_address = generate_address(redeem_script)
+    # witness script, redeem script, scriptPubKey and address of the 2-of-2 multisig, derived in one pass
+    derivation = derive_from_private_keys(2, [private_key_2, private_key_1])
+    witness_script = CScript(derivation.witness_script)
+    print("witness script: ", witness_script)
 
     txid ="0000000000000000000000000000000000000000000000000000000000000000"
     index = 0
     sequence = 0xFFFFFFFF
     value = 100000 
-    scriptSig = CScript([x('0020') + witness_script_hash])
+    scriptSig = CScript([derivation.redeem_script])
     outpoint = COutPoint(bytes.fromhex(txid), index)
     
-    recipient_hash = base58.b58decode_check(recipient_address)[1:] 
-    scriptPubKey = CScript([OP_HASH160, recipient_hash, OP_EQUAL]) 
+    # the output pays back to the multisig address
+    scriptPubKey = CScript(derivation.script_pubkey)
    
     txin = CTxIn(outpoint,scriptSig=scriptSig, nSequence=sequence)
     txout = CTxOut(value, scriptPubKey)
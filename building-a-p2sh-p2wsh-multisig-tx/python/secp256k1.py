@@ -0,0 +1,220 @@
+"""
+Deterministic ECDSA signing over secp256k1 with a precomputed table of generator multiples.
+
+k*G is the sum of one table entry per byte of k: 31 mixed additions and no doublings, instead of the
+double-and-add of python-ecdsa. The nonce is derived as python-ecdsa's sign_digest_deterministic does
+(RFC6979 with the key's default hash function, SHA-1) and s is produced low directly, so the DER
+signatures are byte-identical to sign_with_ecdsa's python-ecdsa path.
+
+Usage: python secp256k1.py [signatures]    checks both backends agree and compares their speed
+"""
+import hashlib
+import hmac
+import os
+import sys
+import time
+
+#secp256k1 field size, group order and generator
+P = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEFFFFFC2F
+N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+G = (0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798,
+     0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8)
+#bits of the scalar per table window: 32 windows of 255 points each
+WINDOW_BITS = 8
+generator_table = None
+
+def jacobian_double(point):
+    """
+    Doubles a point in Jacobian coordinates.
+
+    :param point: An (X, Y, Z) tuple, or None for the point at infinity.
+    :return: The doubled point in Jacobian coordinates.
+    """
+    if point is None:
+        return None
+    x, y, z = point
+    if y == 0:
+        return None
+    y_squared = y * y % P
+    s = 4 * x * y_squared % P
+    m = 3 * x * x % P
+    x3 = (m * m - 2 * s) % P
+    return x3, (m * (s - x3) - 8 * y_squared * y_squared) % P, 2 * y * z % P
+
+def jacobian_add_affine(first, second):
+    """
+    Adds an affine point to a point in Jacobian coordinates.
+
+    :param first: An (X, Y, Z) tuple, or None for the point at infinity.
+    :param second: An affine (x, y) tuple.
+    :return: The sum in Jacobian coordinates.
+    """
+    if first is None:
+        return second[0], second[1], 1
+    x1, y1, z1 = first
+    z1_squared = z1 * z1 % P
+    u2 = second[0] * z1_squared % P
+    s2 = second[1] * z1_squared * z1 % P
+    h = (u2 - x1) % P
+    r = (s2 - y1) % P
+    if h == 0:
+        return jacobian_double(first) if r == 0 else None
+    h_squared = h * h % P
+    h_cubed = h * h_squared % P
+    x1_h_squared = x1 * h_squared % P
+    x3 = (r * r - h_cubed - 2 * x1_h_squared) % P
+    return x3, (r * (x1_h_squared - x3) - y1 * h_cubed) % P, z1 * h % P
+
+def to_affine_all(points):
+    """
+    Converts Jacobian points to affine coordinates with a single modular inversion (Montgomery's trick).
+
+    :param points: A list of (X, Y, Z) tuples, none of them at infinity.
+    :return: The list of affine (x, y) tuples.
+    """
+    prefix = [1]
+    for _, _, z in points:
+        prefix.append(prefix[-1] * z % P)
+    inverse = pow(prefix[-1], -1, P)
+    result = [None] * len(points)
+    for i in range(len(points) - 1, -1, -1):
+        x, y, z = points[i]
+        z_inverse = inverse * prefix[i] % P
+        inverse = inverse * z % P
+        z_inverse_squared = z_inverse * z_inverse % P
+        result[i] = (x * z_inverse_squared % P, y * z_inverse_squared * z_inverse % P)
+    return result
+
+def build_generator_table():
+    """
+    Computes j * 2^(8*i) * G for every window i and every byte value j from 1 to 255, in affine coordinates.
+
+    :return: A list of 32 lists of 255 affine points.
+    """
+    table = []
+    base = G
+    for _ in range(256 // WINDOW_BITS):
+        row = [(base[0], base[1], 1)]
+        for _ in range((1 << WINDOW_BITS) - 2):
+            row.append(jacobian_add_affine(row[-1], base))
+        #the base of the next window, 2^WINDOW_BITS times this one
+        row.append(jacobian_add_affine(row[-1], base))
+        row = to_affine_all(row)
+        base = row.pop()
+        table.append(row)
+    return table
+
+def multiply_generator(scalar):
+    """
+    Computes scalar*G by adding one precomputed multiple per byte of the scalar.
+    The table is built on first use (about 8000 point additions).
+
+    :param scalar: An integer between 1 and N - 1.
+    :return: The affine point as an (x, y) tuple.
+    """
+    global generator_table
+    if generator_table is None:
+        generator_table = build_generator_table()
+    mask = (1 << WINDOW_BITS) - 1
+    result = None
+    for row in generator_table:
+        digit = scalar & mask
+        if digit:
+            result = jacobian_add_affine(result, row[digit - 1])
+        scalar >>= WINDOW_BITS
+    return to_affine_all([result])[0]
+
+def deterministic_nonces(secret, digest, hashfunc=hashlib.sha1):
+    """
+    Generates the RFC6979 nonces for a key and a 32-byte digest, in the order python-ecdsa tries them.
+
+    :param secret: The private key as an integer.
+    :param digest: The digest to sign (bytes).
+    :param hashfunc: The HMAC hash function; python-ecdsa keys default to SHA-1.
+    :return: A generator of nonces between 1 and N - 1.
+    """
+    digest_int = int.from_bytes(digest, 'big')
+    if digest_int >= N:
+        digest_int -= N
+    seed = secret.to_bytes(32, 'big') + digest_int.to_bytes(32, 'big')
+    v = b'\x01' * hashfunc().digest_size
+    k = b'\x00' * len(v)
+    k = hmac.new(k, v + b'\x00' + seed, hashfunc).digest()
+    v = hmac.new(k, v, hashfunc).digest()
+    k = hmac.new(k, v + b'\x01' + seed, hashfunc).digest()
+    v = hmac.new(k, v, hashfunc).digest()
+    while True:
+        t = b''
+        while len(t) < 32:
+            v = hmac.new(k, v, hashfunc).digest()
+            t += v
+        nonce = int.from_bytes(t[:32], 'big')
+        if 1 <= nonce < N:
+            yield nonce
+        k = hmac.new(k, v + b'\x00', hashfunc).digest()
+        v = hmac.new(k, v, hashfunc).digest()
+
+def encode_der(r, s):
+    """
+    DER-encodes an ECDSA signature.
+
+    :param r: The r value.
+    :param s: The s value.
+    :return: The DER signature (bytes).
+    """
+    r_bytes = r.to_bytes((r.bit_length() + 8) // 8, 'big')
+    s_bytes = s.to_bytes((s.bit_length() + 8) // 8, 'big')
+    body = b'\x02' + bytes([len(r_bytes)]) + r_bytes + b'\x02' + bytes([len(s_bytes)]) + s_bytes
+    return b'\x30' + bytes([len(body)]) + body
+
+def sign_digest(digest, secret):
+    """
+    Signs a 32-byte digest with a deterministic nonce and a low s value.
+
+    :param digest: The digest to sign (bytes).
+    :param secret: The private key as an integer between 1 and N - 1.
+    :return: The DER-encoded signature (bytes), without a sighash byte.
+    """
+    z = int.from_bytes(digest, 'big')
+    for nonce in deterministic_nonces(secret, digest):
+        r = multiply_generator(nonce)[0] % N
+        if r == 0:
+            continue
+        s = pow(nonce, -1, N) * (z + secret * r % N) % N
+        if s == 0:
+            continue
+        return encode_der(r, min(s, N - s))
+
+def benchmark(count=500):
+    """
+    Signs random digests with ten random keys on both backends of sign_with_ecdsa, checking that they agree.
+    The keys are parsed and the table is built before timing, as in a long-running signer.
+
+    :param count: The number of signatures per backend.
+    :return: A dictionary mapping each backend to its signatures per second.
+    """
+    import main
+
+    keys = [os.urandom(32).hex() for _ in range(10)]
+    cases = [(os.urandom(32), keys[i % len(keys)]) for i in range(count)]
+    for key in keys:
+        main.load_signing_key(key)
+        main.load_secret(key)
+    multiply_generator(1)
+    results = {}
+    signatures = {}
+    for backend in main.SIGNING_BACKENDS:
+        main.signing_backend = backend
+        start = time.perf_counter()
+        signatures[backend] = [main.sign_with_ecdsa(digest, key) for digest, key in cases]
+        results[backend] = count / (time.perf_counter() - start)
+    if len(set(map(tuple, signatures.values()))) != 1:
+        raise AssertionError("the signing backends disagree")
+    return results
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    multiply_generator(1)
+    print(f"generator table built in {time.perf_counter() - start:.2f}s")
+    for backend, rate in benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 500).items():
+        print(f"{backend}: {rate:.0f} signatures/s")
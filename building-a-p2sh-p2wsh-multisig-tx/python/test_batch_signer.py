@@ -0,0 +1,67 @@
+import pytest
+from pathlib import Path
+from bitcoin.core import CTransaction
+from ecdsa import VerifyingKey, SECP256k1, BadSignatureError, util
+from batch_signer import sign_transaction, sign_transactions, input_keys, output_script, CHUNK_SIZE
+from derivation import public_key, derive_from_private_keys
+from main import calculate_signature_hash
+
+PRIVATE_KEY_1 = "39dc0a9f0b185a2ee56349691f34716e6e0cda06a7f9707742ac113c4e2317bf"
+PRIVATE_KEY_2 = "5077ccd9c558b7d04a81920d38aa11b4a9f9de3b23fab45c3ef28039920fdd6d"
+OTHER_KEY = "0101010101010101010101010101010101010101010101010101010101010101"
+ADDRESS = "325UUecEQuyrTd28Xs2hvAxdAjHM7XzqVF"
+
+def description(index, keys, m=2, pubkeys=None, inputs=1):
+    tx_inputs = [{'txid': f"{index * 16 + position:064x}", 'vout': position, 'value': 100000, 'm': m, 'keys': keys}
+                 for position in range(inputs)]
+    if pubkeys is not None:
+        for tx_input in tx_inputs:
+            tx_input['pubkeys'] = [public_key(key).hex() for key in pubkeys]
+    return {'inputs': tx_inputs, 'outputs': [{'address': ADDRESS, 'value': 100000 * inputs - 1000}]}
+
+def verifies(private_key, signature, sighash):
+    try:
+        return VerifyingKey.from_string(public_key(private_key), curve=SECP256k1).verify_digest(
+            signature, sighash, sigdecode=util.sigdecode_der)
+    except BadSignatureError:
+        return False
+
+def check_signatures(tx_hex, m, pubkeys):
+    tx = CTransaction.deserialize(bytes.fromhex(tx_hex))
+    for index, witness in enumerate(tx.wit.vtxinwit):
+        stack = list(witness.scriptWitness.stack)
+        assert stack[0] == b'' and len(stack) == m + 2
+        sighash = calculate_signature_hash(tx, stack[-1], 100000, index)
+        signers = iter(pubkeys)
+        #every signature must match one of the remaining keys, in script order
+        for signature in stack[1:-1]:
+            r, s = util.sigdecode_der(signature[:-1], SECP256k1.order)
+            assert s <= SECP256k1.order // 2 and signature[-1] == 1
+            assert any(verifies(key, signature[:-1], sighash) for key in signers)
+
+def test_single_input_matches_the_exercise_transaction():
+    derivation = derive_from_private_keys(2, [PRIVATE_KEY_2, PRIVATE_KEY_1])
+    signed = sign_transaction({'inputs': [{'txid': "00" * 32, 'vout': 0, 'value': 100000, 'keys': [PRIVATE_KEY_2, PRIVATE_KEY_1]}],
+                               'outputs': [{'script': derivation.script_pubkey.hex(), 'value': 100000}]})
+    assert signed == (Path(__file__).parent.parent / "out.txt").read_text().strip()
+
+def test_signatures_follow_the_order_of_the_public_keys():
+    keys = [PRIVATE_KEY_1, PRIVATE_KEY_2, OTHER_KEY]
+    signed = sign_transaction(description(0, keys[::-1][:2], m=2, pubkeys=keys, inputs=3))
+    check_signatures(signed, 2, keys)
+
+def test_missing_keys_are_refused():
+    with pytest.raises(ValueError):
+        input_keys(description(0, [PRIVATE_KEY_1], m=2, pubkeys=[PRIVATE_KEY_1, PRIVATE_KEY_2])['inputs'][0])
+
+def test_output_scripts_of_addresses():
+    assert bytes(output_script(ADDRESS)).hex() == "a914043f512301b66ffa8d73e71907e2b0b80989521587"
+    assert bytes(output_script("1BgGZ9tcN4rm9KBzDn7KprQz87SZ26SAMH"))[:3] == b'\x76\xa9\x14'
+    with pytest.raises(ValueError):
+        output_script("5HueCGU8rMjxEXxiPuD5BDku4MkFqeZyd4dZ1jvhTVqvbTLvyTJ")
+
+def test_process_pool_gives_the_same_transactions():
+    descriptions = [description(index, [PRIVATE_KEY_1, PRIVATE_KEY_2]) for index in range(CHUNK_SIZE + 3)]
+    signed = sign_transactions(descriptions, processes=2)
+    assert signed == sign_transactions(descriptions, processes=1)
+    check_signatures(signed[-1], 2, [PRIVATE_KEY_1, PRIVATE_KEY_2])
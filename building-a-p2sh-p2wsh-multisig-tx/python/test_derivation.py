@@ -0,0 +1,58 @@
+import pytest
+from derivation import (derive_uncached, derive_from_private_keys, public_key, consecutive_public_keys, bulk_derive,
+                        prefix_reachable, vanity_search, CHUNK_SIZE, VANITY_CHUNK)
+from main import generate_witness_script_hash, generate_redeem_script, generate_address
+
+PRIVATE_KEY_1 = "39dc0a9f0b185a2ee56349691f34716e6e0cda06a7f9707742ac113c4e2317bf"
+PRIVATE_KEY_2 = "5077ccd9c558b7d04a81920d38aa11b4a9f9de3b23fab45c3ef28039920fdd6d"
+
+def test_exercise_address():
+    derivation = derive_from_private_keys(2, [PRIVATE_KEY_2, PRIVATE_KEY_1])
+    assert derivation.witness_script.hex() == (
+        "5221032ff8c5df0bc00fe1ac2319c3b8070d6d1e04cfbf4fedda499ae7b775185ad53b21039bbc8d24f89e5bc44c5b0d1980d6658316a6b2"
+        "440023117c3c03a4975b04dd5652ae")
+    assert derivation.redeem_script.hex() == "00204d4b11da1a44efeb2882827c0b85fbc82d30a60fccab14d032226f5428b57cb6"
+    assert derivation.script_pubkey.hex() == "a914043f512301b66ffa8d73e71907e2b0b80989521587"
+    assert derivation.address == "325UUecEQuyrTd28Xs2hvAxdAjHM7XzqVF"
+
+def test_exercise_helpers_match_the_derivation():
+    derivation = derive_from_private_keys(2, [PRIVATE_KEY_2, PRIVATE_KEY_1])
+    witness_script, witness_script_hash = generate_witness_script_hash(PRIVATE_KEY_1, bytes.fromhex(PRIVATE_KEY_2))
+    assert bytes(witness_script) == derivation.witness_script
+    redeem_script = generate_redeem_script(witness_script_hash)
+    assert redeem_script == derivation.redeem_script
+    assert generate_address(redeem_script) == derivation.address
+
+@pytest.mark.parametrize("m, n", [(0, 2), (3, 2), (1, 17), (17, 17), (1, 0)])
+def test_unscriptable_multisigs_are_refused(m, n):
+    with pytest.raises(ValueError):
+        derive_uncached(m, consecutive_public_keys(1, n) if n else [])
+
+def test_consecutive_public_keys():
+    assert consecutive_public_keys(5, 4) == [public_key(format(key, '064x')) for key in range(5, 9)]
+
+def test_process_pool_gives_the_same_derivations():
+    keys = consecutive_public_keys(1000, 65)
+    key_sets = [(keys[i % 64], keys[i % 64 + 1]) for i in range(CHUNK_SIZE + 5)]
+    assert bulk_derive(2, key_sets, processes=2) == bulk_derive(2, key_sets, processes=1)
+
+@pytest.mark.parametrize("prefix, reachable", [("3", True), ("31h", True), ("3R2", True), ("3R3", False), ("31g", False),
+                                               ("1", False), ("3l", False), ("3" * 35, False)])
+def test_prefix_reachable(prefix, reachable):
+    assert prefix_reachable(prefix) == reachable
+
+def test_vanity_search_finds_a_matching_key():
+    fixed = (public_key(PRIVATE_KEY_1),)
+    private_key, derivation, tried = vanity_search(2, fixed, "32", processes=1)
+    assert derivation == derive_uncached(2, fixed + (public_key(private_key),))
+    assert derivation.address.startswith("32") and tried % VANITY_CHUNK == 0
+
+def test_vanity_search_refuses_unreachable_prefixes():
+    with pytest.raises(ValueError):
+        vanity_search(2, (public_key(PRIVATE_KEY_1),), "3S", processes=1)
+    with pytest.raises(ValueError):
+        vanity_search(3, (public_key(PRIVATE_KEY_1),), "3", processes=1)
+
+def test_vanity_search_gives_up_after_max_keys():
+    #a 9-character prefix takes about 58^8 keys
+    assert vanity_search(2, (public_key(PRIVATE_KEY_1),), "32222222z", processes=1, max_keys=1) is None
@@ -0,0 +1,59 @@
+import hashlib
+import os
+import subprocess
+import sys
+import pytest
+from pathlib import Path
+from ecdsa import SECP256k1
+import main
+from secp256k1 import N, multiply_generator, sign_digest, to_affine_all, jacobian_double, G
+
+PRIVATE_KEYS = ["0000000000000000000000000000000000000000000000000000000000000001",
+                "39dc0a9f0b185a2ee56349691f34716e6e0cda06a7f9707742ac113c4e2317bf",
+                "5077ccd9c558b7d04a81920d38aa11b4a9f9de3b23fab45c3ef28039920fdd6d",
+                format(N - 1, '064x')]
+DIGESTS = [hashlib.sha256(i.to_bytes(4, 'big')).digest() for i in range(8)] + [bytes(32), b'\xff' * 32]
+
+@pytest.mark.parametrize("scalar", [1, 2, 255, 256, 2 ** 128 + 7, N - 1] + [int(key, 16) for key in PRIVATE_KEYS[1:3]])
+def test_generator_multiples_match_ecdsa(scalar):
+    point = SECP256k1.generator * scalar
+    assert multiply_generator(scalar) == (point.x(), point.y())
+
+def test_jacobian_points_convert_to_affine():
+    doubled = jacobian_double((G[0], G[1], 1))
+    assert to_affine_all([doubled, (G[0], G[1], 1)]) == [multiply_generator(2), G]
+
+@pytest.mark.parametrize("private_key", PRIVATE_KEYS)
+def test_signatures_are_identical_to_the_ecdsa_backend(private_key, monkeypatch):
+    for digest in DIGESTS:
+        monkeypatch.setattr(main, "signing_backend", "ecdsa")
+        expected = main.sign_with_ecdsa(digest, private_key)
+        monkeypatch.setattr(main, "signing_backend", "precomputed")
+        assert main.sign_with_ecdsa(digest, private_key) == expected
+
+def test_signatures_have_a_low_s():
+    for digest in DIGESTS:
+        signature = sign_digest(digest, int(PRIVATE_KEYS[1], 16))
+        s_length = signature[5 + signature[3]]
+        s = int.from_bytes(signature[6 + signature[3]:6 + signature[3] + s_length], 'big')
+        assert s <= N // 2
+
+def test_private_keys_out_of_range_are_refused(monkeypatch):
+    monkeypatch.setattr(main, "signing_backend", "precomputed")
+    with pytest.raises(ValueError):
+        main.sign_with_ecdsa(DIGESTS[0], "00" * 32)
+    with pytest.raises(ValueError):
+        main.sign_with_ecdsa(DIGESTS[0], format(N, '064x'))
+
+@pytest.mark.parametrize("backend", main.SIGNING_BACKENDS)
+def test_exercise_transaction_is_unchanged(backend, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "signing_backend", backend)
+    monkeypatch.chdir(tmp_path)
+    main.main()
+    assert (tmp_path / "out.txt").read_text() == (Path(__file__).parent.parent / "out.txt").read_text().strip()
+
+def test_unknown_signing_backends_are_refused():
+    result = subprocess.run([sys.executable, "-c", "import main"], cwd=Path(__file__).parent, capture_output=True,
+                            text=True, env=dict(os.environ, SIGNING_BACKEND="openssl"))
+    assert result.returncode != 0
+    assert f"ValueError: unknown signing backend openssl, expected one of {main.SIGNING_BACKENDS}" in result.stderr
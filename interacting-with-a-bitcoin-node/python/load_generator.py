@@ -0,0 +1,354 @@
+"""
+A regtest load generator for testing block assembly.
+
+It funds the wallet, pre-splits its coins into one confirmed UTXO per transaction to send, then
+pushes transactions at a target rate from a pool of threads with create_transaction, sign_transaction
+and send_transaction. The latency of each stage is recorded in a histogram, and the resulting mempool
+is written as one JSON file per transaction in the format of mining-a-block/mempool/.
+
+Usage: python load_generator.py [target tps] [duration in seconds] [mempool output folder] [threads]
+"""
+import json
+import math
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+from bitcoinrpc.authproxy import JSONRPCException
+from rpc_client import RPCClient
+from main import (RPC_URL, wallet_name, create_wallet, generate_new_address, mine_blocks, create_transaction,
+                  sign_transaction, send_transaction)
+
+COIN = 100000000
+COINBASE_MATURITY = 100
+HALVING_INTERVAL = 150
+#the value of each pre-split UTXO and the amount each load transaction sends out of it
+SPLIT_VALUE = Decimal("0.01")
+TRANSFER_AMOUNT = Decimal("0.001")
+#outputs per splitting transaction, keeping it well below the standard transaction size
+SPLIT_OUTPUTS = 1000
+#transactions fetched per batch request when dumping the mempool
+DUMP_BATCH_SIZE = 500
+STAGES = ('create', 'sign', 'send', 'total')
+#scriptPubKey types as bitcoind names them, and as the mempool files name them
+SCRIPT_TYPES = {'witness_v0_keyhash': 'v0_p2wpkh', 'witness_v0_scripthash': 'v0_p2wsh', 'witness_v1_taproot': 'v1_p2tr',
+                'pubkeyhash': 'p2pkh', 'scripthash': 'p2sh', 'nulldata': 'op_return', 'pubkey': 'p2pk'}
+OPCODE_NAMES = {0x00: 'OP_0', 0x4f: 'OP_PUSHNUM_NEG1', 0x61: 'OP_NOP', 0x63: 'OP_IF', 0x64: 'OP_NOTIF', 0x67: 'OP_ELSE',
+                0x68: 'OP_ENDIF', 0x69: 'OP_VERIFY', 0x6a: 'OP_RETURN', 0x75: 'OP_DROP', 0x76: 'OP_DUP', 0x82: 'OP_SIZE',
+                0x87: 'OP_EQUAL', 0x88: 'OP_EQUALVERIFY', 0xa8: 'OP_SHA256', 0xa9: 'OP_HASH160', 0xaa: 'OP_HASH256',
+                0xac: 'OP_CHECKSIG', 0xad: 'OP_CHECKSIGVERIFY', 0xae: 'OP_CHECKMULTISIG', 0xaf: 'OP_CHECKMULTISIGVERIFY',
+                0xb1: 'OP_CLTV', 0xb2: 'OP_CSV', 0xba: 'OP_CHECKSIGADD'}
+
+class LatencyHistogram:
+    """
+    The latencies of one stage, bucketed on a 1-2-5 scale of milliseconds.
+    Samples are kept so that percentiles are exact. Recording is thread-safe.
+    """
+    BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self):
+        self.samples = []
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        """
+        :param seconds: A latency in seconds.
+        """
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, fraction):
+        """
+        :param fraction: The percentile as a fraction, e.g. 0.99.
+        :return: The latency in milliseconds below which that fraction of the samples lies.
+        """
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000
+
+    def buckets(self):
+        """
+        :return: A list of (upper bound in ms, count) pairs, the last bound being infinity.
+        """
+        counts = Counter(next((bound for bound in self.BOUNDS_MS if seconds * 1000 <= bound), math.inf)
+                         for seconds in self.samples)
+        return [(bound, counts[bound]) for bound in self.BOUNDS_MS + (math.inf,)]
+
+    def summary(self):
+        """
+        :return: A one-line summary of the count, mean, percentiles and maximum.
+        """
+        if not self.samples:
+            return "no samples"
+        mean = sum(self.samples) / len(self.samples) * 1000
+        return (f"n={len(self.samples)} mean={mean:.1f}ms p50={self.percentile(0.5):.1f}ms "
+                f"p90={self.percentile(0.9):.1f}ms p99={self.percentile(0.99):.1f}ms max={max(self.samples) * 1000:.1f}ms")
+
+def timed(histogram, function, *args, **kwargs):
+    """
+    Calls a function and records how long it took.
+
+    :param histogram: The LatencyHistogram to record into.
+    :param function: The function to call.
+    :return: The result of the function.
+    """
+    start = time.perf_counter()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        histogram.record(time.perf_counter() - start)
+
+def fund_wallet(rpc, address, amount):
+    """
+    Mines enough blocks to the address for amount BTC of mature coinbase outputs.
+
+    :param rpc: The RPC connection.
+    :param address: The address receiving the block rewards.
+    :param amount: The amount in BTC the wallet needs.
+    """
+    height = rpc.getblockcount()
+    subsidy = Decimal(50 * COIN >> (height // HALVING_INTERVAL)) / COIN
+    #one more coinbase for the fees of the splitting transactions
+    blocks = math.ceil(amount / subsidy) + 1
+    mine_blocks(rpc, COINBASE_MATURITY + blocks, address)
+
+def split_utxos(rpc, sender_address, passphrase, count):
+    """
+    Splits the wallet's coins into count confirmed UTXOs of SPLIT_VALUE, so that every load transaction
+    can spend its own confirmed output instead of chaining on unconfirmed change.
+
+    :param rpc: The RPC connection.
+    :param sender_address: The address receiving the change.
+    :param passphrase: The wallet passphrase.
+    :param count: The number of UTXOs to create.
+    :return: The txids of the splitting transactions.
+    """
+    txids = []
+    for start in range(0, count, SPLIT_OUTPUTS):
+        addresses = rpc.batch([('getnewaddress', '', 'bech32')] * min(SPLIT_OUTPUTS, count - start))
+        unsigned_tx_hex = rpc.createrawtransaction([], {address: SPLIT_VALUE for address in addresses})
+        txids.append(send_transaction(rpc, sign_transaction(rpc, sender_address, passphrase, unsigned_tx_hex)))
+    mine_blocks(rpc, 1, sender_address)
+    return txids
+
+def send_one(rpc, sender_address, recipient_address, scheduled, histograms):
+    """
+    Builds, funds, signs and broadcasts one transaction, recording the latency of each stage.
+
+    :param rpc: The RPC connection, with the wallet already unlocked.
+    :param sender_address: The address receiving the change.
+    :param recipient_address: The address receiving TRANSFER_AMOUNT.
+    :param scheduled: The perf_counter time the transaction was scheduled at; the total stage counts from it.
+    :param histograms: A dictionary mapping each of STAGES to its LatencyHistogram.
+    :return: The txid of the broadcast transaction.
+    """
+    unsigned_tx_hex = timed(histograms['create'], create_transaction, rpc, recipient_address, TRANSFER_AMOUNT)
+    signed_tx = timed(histograms['sign'], sign_transaction, rpc, sender_address, None, unsigned_tx_hex, lock_unspents=True)
+    try:
+        txid = timed(histograms['send'], send_transaction, rpc, signed_tx)
+    except JSONRPCException:
+        #release the inputs locked by the funding so they can be selected again
+        decoded = rpc.decoderawtransaction(signed_tx)
+        rpc.lockunspent(True, [{'txid': tx_input['txid'], 'vout': tx_input['vout']} for tx_input in decoded['vin']])
+        raise
+    histograms['total'].record(time.perf_counter() - scheduled)
+    return txid
+
+def push_load(rpc, sender_address, recipient_address, tps, duration, threads):
+    """
+    Sends transactions at a target rate from a pool of threads.
+    A transaction is scheduled every 1/tps seconds; when the threads can't keep up, the backlog
+    shows in the total latency, which is measured from the scheduled time. A transaction that fails,
+    whether the node refused it or the connection broke, is counted as an error and the load goes on.
+
+    :param rpc: The RPC connection, with the wallet already unlocked.
+    :param sender_address: The address receiving the change.
+    :param recipient_address: The address receiving the transfers.
+    :param tps: The target number of transactions per second.
+    :param duration: For how many seconds to schedule transactions.
+    :param threads: The number of concurrent senders.
+    :return: A tuple of the txids sent, a Counter of error messages, the elapsed seconds and the histograms.
+    """
+    histograms = {stage: LatencyHistogram() for stage in STAGES}
+    txids = []
+    errors = Counter()
+    with ThreadPoolExecutor(threads) as executor:
+        start = time.perf_counter()
+        futures = []
+        for i in range(int(tps * duration)):
+            scheduled = start + i / tps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(send_one, rpc, sender_address, recipient_address, scheduled, histograms))
+        for future in futures:
+            try:
+                txids.append(future.result())
+            except JSONRPCException as e:
+                errors[e.error.get('message', str(e))] += 1
+            except Exception as e:
+                errors[f"{type(e).__name__}: {e}"] += 1
+    return txids, errors, time.perf_counter() - start, histograms
+
+def script_asm(script):
+    """
+    Disassembles a script the way the mempool files do, e.g. "OP_0 OP_PUSHBYTES_20 <hex>".
+
+    :param script: The script as bytes.
+    :return: The ASM string.
+    """
+    tokens = []
+    i = 0
+    while i < len(script):
+        opcode = script[i]
+        i += 1
+        if 0x01 <= opcode <= 0x4e:
+            if opcode <= 0x4b:
+                name, length = f"OP_PUSHBYTES_{opcode}", opcode
+            else:
+                size = {0x4c: 1, 0x4d: 2, 0x4e: 4}[opcode]
+                name, length = f"OP_PUSHDATA{size}", int.from_bytes(script[i:i + size], 'little')
+                i += size
+            tokens += [name, script[i:i + length].hex()]
+            i += length
+        elif 0x51 <= opcode <= 0x60:
+            tokens.append(f"OP_PUSHNUM_{opcode - 0x50}")
+        else:
+            tokens.append(OPCODE_NAMES.get(opcode, f"OP_RETURN_{opcode}"))
+    return " ".join(tokens)
+
+def mempool_output(output):
+    """
+    :param output: An output of a decoded transaction, as bitcoind returns it.
+    :return: The output in the format of the mempool files.
+    """
+    script = bytes.fromhex(output['scriptPubKey']['hex'])
+    result = {'scriptpubkey': script.hex(), 'scriptpubkey_asm': script_asm(script),
+              'scriptpubkey_type': SCRIPT_TYPES.get(output['scriptPubKey']['type'], 'unknown')}
+    if 'address' in output['scriptPubKey']:
+        result['scriptpubkey_address'] = output['scriptPubKey']['address']
+    result['value'] = int(Decimal(output['value']) * COIN)
+    return result
+
+def mempool_transaction(decoded, transactions):
+    """
+    Converts a decoded transaction to the format of the mempool files.
+
+    :param decoded: The transaction as getrawtransaction returns it with verbose set.
+    :param transactions: A dictionary mapping the txid of every parent transaction to its decoded form.
+    :return: A dictionary ready to be written as JSON.
+    """
+    vin = []
+    for tx_input in decoded['vin']:
+        prevout = mempool_output(transactions[tx_input['txid']]['vout'][tx_input['vout']])
+        script_sig = bytes.fromhex(tx_input['scriptSig']['hex'])
+        entry = {'txid': tx_input['txid'], 'vout': tx_input['vout'], 'prevout': prevout,
+                 'scriptsig': script_sig.hex(), 'scriptsig_asm': script_asm(script_sig)}
+        if tx_input.get('txinwitness'):
+            entry['witness'] = tx_input['txinwitness']
+        entry['is_coinbase'] = False
+        entry['sequence'] = tx_input['sequence']
+        vin.append(entry)
+    vout = [mempool_output(output) for output in decoded['vout']]
+    fee = sum(entry['prevout']['value'] for entry in vin) - sum(output['value'] for output in vout)
+    return {'txid': decoded['txid'], 'version': decoded['version'], 'locktime': decoded['locktime'], 'vin': vin,
+            'vout': vout, 'size': decoded['size'], 'weight': decoded['weight'], 'fee': fee,
+            'status': {'confirmed': False}, 'hex': decoded['hex']}
+
+def fetch_transactions(rpc, txids):
+    """
+    Decodes transactions with batched getrawtransaction calls. Confirmed transactions that the node
+    can't find without -txindex are taken from the wallet with gettransaction instead.
+
+    :param rpc: The RPC connection.
+    :param txids: The txids to fetch.
+    :return: A dictionary mapping each txid to its decoded transaction.
+    """
+    transactions = {}
+    txids = list(txids)
+    for start in range(0, len(txids), DUMP_BATCH_SIZE):
+        chunk = txids[start:start + DUMP_BATCH_SIZE]
+        results = rpc.batch([('getrawtransaction', txid, True) for txid in chunk])
+        missing = [txid for txid, result in zip(chunk, results) if isinstance(result, JSONRPCException)]
+        transactions.update((txid, result) for txid, result in zip(chunk, results) if not isinstance(result, JSONRPCException))
+        for txid, result in zip(missing, rpc.batch([('gettransaction', txid, True, True) for txid in missing])):
+            if isinstance(result, JSONRPCException):
+                raise result
+            transactions[txid] = dict(result['decoded'], hex=result['hex'])
+    return transactions
+
+def write_mempool(rpc, folder):
+    """
+    Writes every mempool transaction to folder/<txid>.json in the format of mining-a-block/mempool/.
+
+    :param rpc: The RPC connection.
+    :param folder: The output folder, created if needed.
+    :return: The number of files written.
+    """
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    transactions = fetch_transactions(rpc, rpc.getrawmempool())
+    mempool_txids = list(transactions)
+    parents = {tx_input['txid'] for decoded in transactions.values() for tx_input in decoded['vin']} - transactions.keys()
+    transactions.update(fetch_transactions(rpc, parents))
+    for txid in mempool_txids:
+        with open(folder / f"{txid}.json", "w") as file:
+            json.dump(mempool_transaction(transactions[txid], transactions), file, indent=2)
+    return len(mempool_txids)
+
+def print_report(sent, errors, elapsed, histograms):
+    """
+    Prints the achieved rate, the errors and the latency histogram of each stage.
+    """
+    print(f"Sent {len(sent)} transactions in {elapsed:.1f}s ({len(sent) / elapsed:.1f} tx/s), "
+          f"{sum(errors.values())} failed")
+    for message, count in errors.most_common():
+        print(f"  {count} failed: {message}")
+    for stage in STAGES:
+        histogram = histograms[stage]
+        print(f"{stage}: {histogram.summary()}")
+        if histogram.samples:
+            print("  " + " ".join(f"<={bound}ms:{count}" if bound != math.inf else f">{histogram.BOUNDS_MS[-1]}ms:{count}"
+                                  for bound, count in histogram.buckets() if count))
+
+def run(url, tps, duration, folder, threads, passphrase="passphrase"):
+    """
+    Funds and splits, pushes the load, prints the report and dumps the mempool.
+
+    :param url: The URL of the wallet endpoint.
+    :param tps: The target number of transactions per second.
+    :param duration: For how many seconds to send transactions.
+    :param folder: The folder the mempool is written to.
+    :param threads: The number of concurrent senders.
+    :param passphrase: The wallet passphrase.
+    :return: The number of mempool files written.
+    """
+    #as many UTXOs as push_load sends transactions
+    count = int(tps * duration)
+    with RPCClient(url, pool_size=threads) as rpc:
+        print(create_wallet(rpc, wallet_name, passphrase))
+        sender_address = generate_new_address(rpc, wallet_name)
+        recipient_address = rpc.getnewaddress('', 'bech32')
+        fund_wallet(rpc, sender_address, count * SPLIT_VALUE)
+        start = time.perf_counter()
+        split_txids = split_utxos(rpc, sender_address, passphrase, count)
+        print(f"Split {count} UTXOs in {len(split_txids)} transactions in {time.perf_counter() - start:.1f}s")
+        #unlock once for the whole run instead of once per transaction
+        rpc.walletpassphrase(passphrase, int(duration) + 600)
+        print_report(*push_load(rpc, sender_address, recipient_address, tps, duration, threads))
+        start = time.perf_counter()
+        written = write_mempool(rpc, folder)
+        print(f"Wrote {written} mempool transactions to {folder} in {time.perf_counter() - start:.1f}s")
+        return written
+
+def main():
+    tps = float(sys.argv[1]) if len(sys.argv) > 1 else 20
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 30
+    folder = sys.argv[3] if len(sys.argv) > 3 else "mempool"
+    threads = int(sys.argv[4]) if len(sys.argv) > 4 else 8
+    run(RPC_URL, tps, duration, folder, threads)
+
+if __name__ == "__main__":
+    main()
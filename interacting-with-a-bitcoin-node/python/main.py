@@ -1,4 +1,5 @@
-from bitcoinrpc.authproxy import AuthServiceProxy, JSONRPCException
+from bitcoinrpc.authproxy import JSONRPCException
+from rpc_client import RPCClient
 
 wallet_name="testwallet"
 # Node access params
@@ -94,19 +95,22 @@ def create_transaction(rpc, recipient_address, transfer_amount):
     return unsigned_tx_hex
 
 
-def sign_transaction(rpc, sender_address ,wallet_passphrase, unsigned_tx_hex):
+def sign_transaction(rpc, sender_address ,wallet_passphrase, unsigned_tx_hex, lock_unspents=False):
     """
     Unlocks the wallet, funds the transaction, and signs it.
 
     :param rpc: The RPC connection.
-    :param wallet_passphrase: Passphrase to temporarily unlock the wallet.
+    :param wallet_passphrase: Passphrase to temporarily unlock the wallet, or None if it is already unlocked.
     :param unsigned_tx_hex: The raw unsigned transaction hex string.
+    :param lock_unspents: Whether to lock the selected UTXOs, so that concurrent fundings don't select them too.
     :return: The signed transaction hex string, ready to be broadcast.
     """
-    rpc.walletpassphrase(wallet_passphrase, 60)
+    if wallet_passphrase is not None:
+        rpc.walletpassphrase(wallet_passphrase, 60)
     # fundrawtransaction automatically selects inputs to cover the required amount 
     # and allows specifying the address to receive the change.
-    funded_tx = rpc.fundrawtransaction(unsigned_tx_hex, {"fee_rate": 21, "change_address":sender_address})
+    funded_tx = rpc.fundrawtransaction(unsigned_tx_hex, {"fee_rate": 21, "change_address":sender_address,
+                                                         "lockUnspents": lock_unspents})
     signed_tx = rpc.signrawtransactionwithwallet(funded_tx["hex"])
     return signed_tx['hex']
 
@@ -122,7 +126,7 @@ def send_transaction(rpc,signed_tx):
      
 
 def main():
-    rpc = AuthServiceProxy(RPC_URL)
+    rpc = RPCClient(RPC_URL)
 
     # Check connection
     info = rpc.getblockchaininfo()
@@ -0,0 +1,59 @@
+import itertools
+import sys
+from decimal import Decimal
+from pathlib import Path
+from bitcoinrpc.authproxy import JSONRPCException
+import load_generator
+from load_generator import push_load, print_report, write_mempool, COIN
+from rpc_client import RPCClient
+from rpc_stub import start_stub
+
+#the dump is checked with the loader of the miner that reads it
+sys.path.append(str(Path(__file__).parent.parent.parent / "mining-a-block" / "python"))
+from mempool_loader import load_transaction_record
+
+def test_failed_transactions_are_counted_and_the_load_goes_on(monkeypatch, capsys):
+    calls = itertools.count()
+
+    def send_one(rpc, sender_address, recipient_address, scheduled, histograms):
+        index = next(calls)
+        if index % 4 == 1:
+            raise JSONRPCException({'code': -26, 'message': "insufficient fee"})
+        if index % 4 == 2:
+            raise ConnectionResetError("connection reset by the node")
+        histograms['total'].record(0.001)
+        return f"{index:064x}"
+    monkeypatch.setattr(load_generator, "send_one", send_one)
+    txids, errors, elapsed, histograms = push_load(None, "sender", "recipient", 2000, 0.01, 4)
+    assert len(txids) == 10
+    assert errors == {"insufficient fee": 5, "ConnectionResetError: connection reset by the node": 5}
+    assert len(histograms['total'].samples) == 10
+    print_report(txids, errors, elapsed, histograms)
+    report = capsys.readouterr().out
+    assert "Sent 10 transactions" in report and "10 failed" in report
+    assert "5 failed: insufficient fee" in report
+
+def test_mempool_dump_loads_in_the_miner(tmp_path):
+    server, url = start_stub()
+    try:
+        with RPCClient(url) as rpc:
+            rpc.createwallet('load')
+            rpc.generatetoaddress(101, rpc.getnewaddress('', 'bech32'))
+            sent = []
+            inputs = []
+            for _ in range(2):
+                unsigned_tx_hex = rpc.createrawtransaction(inputs, {rpc.getnewaddress('', 'bech32'): Decimal("0.001")})
+                funded = rpc.fundrawtransaction(unsigned_tx_hex)
+                sent.append(rpc.sendrawtransaction(rpc.signrawtransactionwithwallet(funded['hex'])['hex']))
+                #the second transaction spends the unconfirmed change of the first
+                inputs = [{'txid': sent[-1], 'vout': funded['changepos']}]
+            assert write_mempool(rpc, tmp_path) == 2
+            for txid in sent:
+                entry = rpc.getmempoolentry(txid)
+                record = load_transaction_record(tmp_path / f"{txid}.json")
+                assert record.txid == txid
+                assert record.weight == entry['weight']
+                assert record.fee == int(Decimal(entry['fees']['base']) * COIN)
+            assert sent[0] in load_transaction_record(tmp_path / f"{sent[1]}.json").parents
+    finally:
+        server.shutdown()
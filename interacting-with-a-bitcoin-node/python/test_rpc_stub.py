@@ -0,0 +1,15 @@
+from rpc_stub import StubNode, address_to_script
+
+def test_every_generated_block_pays_the_requested_address():
+    node = StubNode()
+    node.rpc_createwallet(None, 'miner')
+    funding, recipient, miner = (node.rpc_getnewaddress('miner') for _ in range(3))
+    node.rpc_generatetoaddress('miner', 101, funding)
+    unsigned = node.rpc_createrawtransaction('miner', [], [{recipient: 1}])
+    funded = node.rpc_fundrawtransaction('miner', unsigned)
+    node.rpc_sendrawtransaction('miner', node.rpc_signrawtransactionwithwallet('miner', funded['hex'])['hex'])
+    assert len(node.rpc_getrawmempool(None)) == 1
+    node.rpc_generatetoaddress('miner', 2, miner)
+    coinbases = [tx for tx, fee, height, _ in node.transactions.values() if fee is None and height > 101]
+    assert len(coinbases) == 2
+    assert all(coinbase.outputs[0][1] == address_to_script(miner) for coinbase in coinbases)
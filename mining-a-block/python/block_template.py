@@ -0,0 +1,144 @@
+import heapq
+
+MAX_BLOCK_WEIGHT = 4000000
+#weight kept free for the coinbase transaction, the same reserve bitcoin core uses
+COINBASE_WEIGHT_RESERVE = 4000
+#give up once this many packages in a row didn't fit in an almost full block
+MAX_CONSECUTIVE_FAILURES = 1000
+
+def transaction_entry(tx):
+    """
+    Extracts what the block builder needs from a mempool transaction record.
+
+    :param tx: A TransactionRecord.
+    :return: A tuple of the txid, the fee in satoshis, the weight and the parent txids.
+    """
+    return tx.txid, tx.fee, tx.weight, tx.parents
+
+def collect_ancestors(txid, parents, ancestors):
+    """
+    Computes the set of in-mempool ancestors of a transaction, memoizing every set it builds.
+
+    :param txid: The transaction ID whose ancestors are wanted.
+    :param parents: A dictionary mapping each txid that has in-mempool parents to those parents.
+    :param ancestors: The memo dictionary mapping a txid to its ancestor set.
+    :return: The set of ancestor txids, not including txid itself.
+    """
+    stack = [txid]
+    while stack:
+        current = stack[-1]
+        if current in ancestors:
+            stack.pop()
+            continue
+        current_parents = parents.get(current, ())
+        missing = [parent for parent in current_parents if parent not in ancestors]
+        if missing:
+            stack.extend(missing)
+            continue
+        result = set(current_parents)
+        for parent in current_parents:
+            result |= ancestors[parent]
+        ancestors[current] = result
+        stack.pop()
+    return ancestors[txid]
+
+def build_block_template(transactions, max_weight=MAX_BLOCK_WEIGHT - COINBASE_WEIGHT_RESERVE, mempool_txids=None):
+    """
+    Selects the transactions of a block by ancestor package fee rate.
+    A transaction is always considered together with its not yet selected in-mempool ancestors,
+    so a high fee child pulls in its low fee parents (CPFP) and parents are placed before children.
+    Packages are taken from a heap; when a package is selected the packages of its descendants
+    shrink, and they are pushed again with their new fee rate while the stale heap entries are skipped.
+
+    :param transactions: A list of valid transaction records.
+    :param max_weight: The maximum total weight of the selected transactions.
+    :param mempool_txids: An optional set of every txid in the mempool. A transaction spending an output of a
+                          mempool transaction that isn't in transactions (an invalid one) can't be mined and is dropped.
+    :return: The selected transaction records in block order.
+    """
+    entries = [transaction_entry(tx) for tx in transactions]
+    by_txid = {entry[0]: tx for entry, tx in zip(entries, transactions)}
+    fees = {}
+    weights = {}
+    #only transactions with in-mempool parents get an entry, parents outside the mempool are assumed to be confirmed
+    parents = {}
+    children = {}
+    for txid, fee, weight, parent_txids in entries:
+        fees[txid] = fee
+        weights[txid] = weight
+        in_pool = [parent for parent in parent_txids if parent in by_txid]
+        if in_pool:
+            parents[txid] = in_pool
+            for parent in in_pool:
+                children.setdefault(parent, []).append(txid)
+    unavailable = set()
+    if mempool_txids is not None:
+        missing = set(mempool_txids).difference(by_txid)
+        stack = [entry[0] for entry in entries if not missing.isdisjoint(entry[3])]
+        unavailable.update(stack)
+        #children of unavailable transactions can't be mined either
+        while stack:
+            for child in children.get(stack.pop(), ()):
+                if child not in unavailable:
+                    unavailable.add(child)
+                    stack.append(child)
+
+    no_ancestors = frozenset()
+    ancestors = {}
+    package = {}
+    heap = []
+    for txid, package_fee, package_weight, _ in entries:
+        if txid in unavailable:
+            continue
+        if txid in parents:
+            members = collect_ancestors(txid, parents, ancestors)
+            package_fee += sum(fees[member] for member in members)
+            package_weight += sum(weights[member] for member in members)
+        else:
+            ancestors[txid] = no_ancestors
+        package[txid] = (package_fee, package_weight)
+        heap.append((-package_fee / package_weight, txid, package_fee, package_weight))
+    heapq.heapify(heap)
+
+    selected = []
+    included = set()
+    block_weight = 0
+    failures = 0
+    while heap:
+        _, txid, package_fee, package_weight = heapq.heappop(heap)
+        if txid in included or package.get(txid) != (package_fee, package_weight):
+            continue
+        if block_weight + package_weight > max_weight:
+            del package[txid]
+            failures += 1
+            if failures > MAX_CONSECUTIVE_FAILURES and block_weight > max_weight - COINBASE_WEIGHT_RESERVE:
+                break
+            continue
+        failures = 0
+        members = [member for member in ancestors[txid] if member not in included]
+        members.append(txid)
+        #an ancestor always has fewer ancestors than its descendants
+        members.sort(key=lambda member: (len(ancestors[member]), member))
+        for member in members:
+            included.add(member)
+            selected.append(by_txid[member])
+            block_weight += weights[member]
+            package.pop(member, None)
+        touched = set()
+        stack = list(members)
+        while stack:
+            for child in children.get(stack.pop(), ()):
+                if child not in touched and child not in included:
+                    touched.add(child)
+                    stack.append(child)
+        for child in touched:
+            if child not in package:
+                continue
+            child_fee, child_weight = package[child]
+            for member in members:
+                if member in ancestors[child]:
+                    child_fee -= fees[member]
+                    child_weight -= weights[member]
+            package[child] = (child_fee, child_weight)
+            heapq.heappush(heap, (-child_fee / child_weight, child, child_fee, child_weight))
+    return selected
@@ -1,12 +1,40 @@
-import bitcoinlib.wallets
-from bitcoinlib.transactions import Transaction
-from bitcoin.core import CTxIn , CTxOut , CMutableTransaction , COutPoint, CTxInWitness , CTxWitness , CScriptWitness
-from bitcoin.core.script import CScript, OP_DUP, OP_HASH160, OP_EQUALVERIFY, OP_CHECKSIG, CScriptWitness, OP_RETURN 
-from bitcoin.core.script import CScript
+import time
+#the startup time reported in the metrics is measured from here
+import_start = time.perf_counter()
 import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque, Counter
 from pathlib import Path
 import json
-import time
+import os
+from time import perf_counter as timer
+from validation_cache import ValidationCache
+from block_template import build_block_template
+from merkle import MerkleTree
+import sha256d
+from mempool_loader import iter_transaction_records, iter_prevouts
+from snapshot import MempoolSnapshot
+from txparser import parse_transaction, witness_items, serialize_varint
+from sighash import SighashCache, SIGHASH_DEFAULT, p2wpkh_script_code
+from schnorr import verify_schnorr_signatures, ecdsa_verify
+from outpoint_index import select_consistent_transactions
+from metrics import Metrics, profiled
+#bitcoinlib takes most of a second to import and opens its database, so it and python-bitcoinlib are
+#imported by the functions that use them
+import_seconds = time.perf_counter() - import_start
+
+#validation results known before the run, installed in every validation worker
+known_results = {}
+#the mempool snapshot being validated, if the mempool is read from one
+mempool_snapshot = None
+#whether taproot key path signatures are collected for batch verification instead of verified one by one
+batch_schnorr = True
+#bumped whenever validation changes, so cached results from an older validator aren't reused
+VALIDATION_RULES_VERSION = 3
+#the sighash types a taproot signature may use (BIP341)
+TAPROOT_HASHTYPES = (0x00, 0x01, 0x02, 0x03, 0x81, 0x82, 0x83)
+#where the payout address taken from the wallet is kept for the next runs
+PAYOUT_ADDRESS_PATH = Path(__file__).parent / "payout-address.txt"
 
 def create_or_load_wallet(wallet_name):
     """
@@ -15,6 +43,7 @@ def create_or_load_wallet(wallet_name):
     :param wallet_name: The wallet's name to be created or loaded
     :return: A wallet object
     """
+    import bitcoinlib.wallets
     wallet = bitcoinlib.wallets.wallet_create_or_open(wallet_name)
     print(f"Wallet '{wallet_name}' created or opened successfully.")
     return wallet
@@ -31,6 +60,24 @@ def generate_or_get_address(wallet):
     else:
         return wallet.get_key().address
 
+def get_payout_address(wallet_name="mywallet"):
+    """
+    Returns the address receiving the block reward without opening the wallet database when possible:
+    the MINER_PAYOUT_ADDRESS environment variable if set, otherwise the address saved by an earlier run,
+    otherwise the wallet's address, which is then saved for the next runs.
+
+    :param wallet_name: The wallet's name, used when no address is configured or saved
+    :return: The payout address
+    """
+    address = os.environ.get("MINER_PAYOUT_ADDRESS")
+    if address:
+        return address
+    if PAYOUT_ADDRESS_PATH.exists():
+        return PAYOUT_ADDRESS_PATH.read_text().strip()
+    address = generate_or_get_address(create_or_load_wallet(wallet_name))
+    PAYOUT_ADDRESS_PATH.write_text(address + '\n')
+    return address
+
 def hash256(data):
     """
     Computes the double SHA-256 hash of the given bytes object.
@@ -49,6 +96,7 @@ def validate_transaction_signatures(raw_tx_hex):
     :param raw_tx_hex: The raw transaction in hexadecimal format.
     :return: True if the transaction is valid, otherwise False.
     """
+    from bitcoinlib.transactions import Transaction
     try:
         parsed_tx = Transaction.parse_hex(raw_tx_hex)
         validity = parsed_tx.verify()
@@ -58,6 +106,148 @@ def validate_transaction_signatures(raw_tx_hex):
     except Exception as e:
         return False , f"an error occured: {e}"
 
+def taproot_key_path_signatures(record):
+    """
+    Collects the BIP340 signatures of a transaction whose inputs all spend taproot outputs by key path.
+    Other transactions (and key path spends with an invalid sighash type) are left to bitcoinlib.
+
+    :param record: A TransactionRecord with the outputs spent by its inputs.
+    :return: A list of (x-only public key, signature hash, 64-byte signature) tuples,
+             or None if the transaction isn't a taproot key path spend.
+    """
+    tx = parse_transaction(record.raw)
+    prevouts = list(iter_prevouts(record.prevouts))
+    if not tx.segwit or len(prevouts) != len(tx.inputs):
+        return None
+    sighashes = SighashCache(record.raw, tx, prevouts)
+    signatures = []
+    for index, (_, script) in enumerate(prevouts):
+        if len(script) != 34 or script[:2] != b'\x51\x20':
+            return None
+        items = witness_items(record.raw, tx, index)
+        annex = None
+        if len(items) >= 2 and items[-1][:1] == b'\x50':
+            annex = bytes(items.pop())
+        if len(items) != 1 or len(items[0]) not in (64, 65):
+            return None
+        signature = bytes(items[0])
+        hashtype = signature[64] if len(signature) == 65 else SIGHASH_DEFAULT
+        if hashtype not in TAPROOT_HASHTYPES or (len(signature) == 65 and hashtype == SIGHASH_DEFAULT):
+            return None
+        try:
+            message = sighashes.taproot_key_path(index, hashtype, annex)
+        except ValueError:
+            return None
+        signatures.append((script[2:], message, signature[:64]))
+    return signatures
+
+def hash160(data):
+    """
+    Computes the RIPEMD-160 hash of the SHA-256 hash of the given bytes object.
+
+    :param data: A bytes object
+    :return: The 20-byte hash as a bytes object
+    """
+    return hashlib.new('ripemd160', hashlib.sha256(data).digest()).digest()
+
+def parse_multisig_script(script):
+    """
+    Decodes a bare multisig script, OP_m <public key>... OP_n OP_CHECKMULTISIG.
+
+    :param script: The script as bytes.
+    :return: A tuple of m and the list of public keys, or None if the script isn't a bare multisig script.
+    """
+    if len(script) < 3 or script[-1] != 0xae:
+        return None
+    required = script[0] - 0x50
+    count = script[-2] - 0x50
+    if not 1 <= required <= count <= 16:
+        return None
+    pubkeys = []
+    offset = 1
+    while offset < len(script) - 2:
+        length = script[offset]
+        if length not in (33, 65):
+            return None
+        pubkeys.append(script[offset + 1:offset + 1 + length])
+        offset += 1 + length
+    if offset != len(script) - 2 or len(pubkeys) != count:
+        return None
+    return required, pubkeys
+
+def segwit_v0_signatures(record):
+    """
+    Collects the ECDSA signatures of a transaction whose inputs all spend P2WPKH outputs or P2WSH outputs with
+    a bare multisig witness script. Their BIP143 signature hashes commit to the amounts of the spent outputs
+    and share the hashes of the prevouts, sequences and outputs of a single SighashCache.
+    Other transactions (and spends whose witness doesn't match the spent output) are left to bitcoinlib.
+
+    :param record: A TransactionRecord with the outputs spent by its inputs.
+    :return: A list of (signatures, public keys) tuples, one per input, with each signature given as a
+             (DER signature, signature hash) tuple or None when it is empty, or None if the transaction isn't
+             a segwit v0 spend of these kinds.
+    """
+    tx = parse_transaction(record.raw)
+    prevouts = list(iter_prevouts(record.prevouts))
+    if not tx.segwit or len(prevouts) != len(tx.inputs):
+        return None
+    sighashes = SighashCache(record.raw, tx, prevouts)
+    checks = []
+    for index, (amount, script) in enumerate(prevouts):
+        items = [bytes(item) for item in witness_items(record.raw, tx, index)]
+        if len(script) == 22 and script[:2] == b'\x00\x14':
+            if len(items) != 2 or hash160(items[1]) != script[2:]:
+                return None
+            script_code = p2wpkh_script_code(script[2:])
+            signatures, pubkeys = items[:1], items[1:]
+        elif len(script) == 34 and script[:2] == b'\x00\x20':
+            if not items or hashlib.sha256(items[-1]).digest() != script[2:]:
+                return None
+            multisig = parse_multisig_script(items[-1])
+            #OP_CHECKMULTISIG pops an extra item, which must be empty (BIP147)
+            if multisig is None or len(items) != multisig[0] + 2 or items[0]:
+                return None
+            script_code = serialize_varint(len(items[-1])) + items[-1]
+            signatures, pubkeys = items[1:-1], multisig[1]
+        else:
+            return None
+        checks.append(([(signature[:-1], sighashes.segwit_v0(index, script_code, amount, signature[-1])) if signature else None
+                        for signature in signatures], pubkeys))
+    return checks
+
+def verify_multisig(signatures, pubkeys):
+    """
+    Verifies ECDSA signatures like OP_CHECKMULTISIG: each signature must be valid for one of the public keys,
+    which are tried in order and never reused.
+
+    :param signatures: A list of (DER signature, signature hash) tuples, None for an empty signature.
+    :param pubkeys: A list of SEC1 encoded public keys.
+    :return: True if every signature is valid, otherwise False.
+    """
+    key_index = 0
+    for signature in signatures:
+        if signature is None:
+            return False
+        der_signature, message = signature
+        while key_index < len(pubkeys) and not ecdsa_verify(pubkeys[key_index], message, der_signature):
+            key_index += 1
+        if key_index == len(pubkeys):
+            return False
+        key_index += 1
+    return True
+
+def verify_signature_batch(signatures, batch=True):
+    """
+    Verifies a list of BIP340 signatures and times it.
+
+    :param signatures: A list of (x-only public key, signature hash, 64-byte signature) tuples.
+    :param batch: Whether to use batch verification.
+    :return: A tuple of the list of results and the seconds spent.
+    """
+    start = time.perf_counter()
+    results = verify_schnorr_signatures(signatures, batch)
+    return results, time.perf_counter() - start
+
 def calculate_wtxid(tx_hex):
     """
     Computes the witness transaction ID (wtxid) of a given transaction hex.
@@ -74,23 +264,71 @@ def generate_merkle_root(txids):
     :param txids: A list of transaction IDs in hexadecimal format.
     :return: The Merkle root as a bytes object, or None if the input list is empty.
     """
-    if not txids:
-        return None
-    level = [bytes.fromhex(txid)[::-1] for txid in txids]
-    while len(level) > 1:
-        next_level = []
-        for i in range(0, len(level), 2):
-            if i + 1 == len(level):  
-                pair_hash = hash256(level[i] + level[i])
-            else:
-                pair_hash = hash256(level[i] + level[i + 1])
-            next_level.append(pair_hash)
-        level = next_level
-    return level[0]
+    return MerkleTree.from_txids(txids).root
+
+def search_nonce_range(header_prefix, start, count, target_bytes):
+    """
+    Searches a range of nonces for a block header hash below the target.
+    The SHA-256 state after the first 64 bytes of the header doesn't depend on the nonce,
+    so it is computed once (the midstate) and copied for every nonce. With MINER_SHA256D=numpy the
+    nonces are hashed in batches by sha256d.search_nonces.
+
+    :param header_prefix: The first 76 bytes of the block header (everything but the nonce).
+    :param start: The first nonce to try.
+    :param count: The number of nonces to try.
+    :param target_bytes: The target as 32 big-endian bytes.
+    :return: A tuple of the first nonce that meets the target (None if there is none) and the number of hashes computed.
+    """
+    if sha256d.backend == "numpy":
+        return sha256d.search_nonces(header_prefix, start, count, target_bytes)
+    midstate = hashlib.sha256(header_prefix[:64])
+    tail = header_prefix[64:]
+    sha256 = hashlib.sha256
+    for nonce in range(start, start + count):
+        first_hash = midstate.copy()
+        first_hash.update(tail + nonce.to_bytes(4, byteorder='little'))
+        if sha256(first_hash.digest()).digest()[::-1] < target_bytes:
+            return nonce, nonce - start + 1
+    return None, count
+
+def nonce_chunks(chunk_size):
+    """
+    Splits the nonce space into chunks. The last chunk is cut short when chunk_size doesn't divide 2^32,
+    so no chunk goes past the largest nonce, 0xffffffff.
+
+    :param chunk_size: The number of nonces in a chunk.
+    :return: A generator of (first nonce, number of nonces) tuples.
+    """
+    for start in range(0, 1 << 32, chunk_size):
+        yield start, min(chunk_size, (1 << 32) - start)
 
-def construct_block_header(version, previous_block, merkle_root, time, bits, target):
+def map_nonce_chunks(executor, workers, header_prefix, chunk_size, target_bytes):
+    """
+    Searches every nonce chunk on the process pool, keeping only a few chunks per worker in flight
+    so that a found nonce doesn't leave millions of queued chunks behind.
+
+    :param executor: The process pool searching the chunks.
+    :param workers: The number of worker processes of the pool.
+    :param header_prefix: The first 76 bytes of the block header.
+    :param chunk_size: The number of nonces in a chunk.
+    :param target_bytes: The target as 32 big-endian bytes.
+    :return: A generator of the search_nonce_range results in nonce order.
+    """
+    pending = deque()
+    for start, count in nonce_chunks(chunk_size):
+        pending.append(executor.submit(search_nonce_range, header_prefix, start, count, target_bytes))
+        if len(pending) >= 2 * workers:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def construct_block_header(version, previous_block, merkle_root, time, bits, target, workers=1, chunk_size=1 << 20,
+                           metrics=None):
     """
     Constructs a valid Bitcoin block header by finding a nonce that satisfies the target difficulty.
+    The nonce space is split into chunks that are searched on a process pool when more than one
+    worker is used. Chunks are consumed in order, so the nonce found is the lowest one whatever the
+    number of workers is. When all 2^32 nonces fail the timestamp is rolled forward by one second.
 
     :param version: The block version as an integer.
     :param previous_block: The hash of the previous block in hexadecimal format.
@@ -98,20 +336,38 @@ def construct_block_header(version, previous_block, merkle_root, time, bits, tar
     :param time: The timestamp as an integer (UNIX time).
     :param bits: The difficulty target in compact format as an integer.
     :param target: The mining target difficulty as a hexadecimal string.
+    :param workers: The number of worker processes searching nonces.
+    :param chunk_size: The number of nonces searched by a worker at once.
+    :param metrics: An optional Metrics object receiving the number of hashes and the hash rate.
     :return: The valid block header in hexadecimal format.
     """
-    nonce = 0x00000000
-    target_int = int(target, 16)
-    while True:
-        block_header = (version.to_bytes(4, byteorder='little') + bytes.fromhex(previous_block)[::-1] + merkle_root + 
-            time.to_bytes(4, byteorder='little') + bits.to_bytes(4, byteorder='little') + nonce.to_bytes(4, byteorder='little'))
-        first_hash = hashlib.sha256(block_header).digest()
-        block_hash = hashlib.sha256(first_hash).digest()
-        block_hash_int = int.from_bytes(block_hash[::-1], byteorder='big')
-        if block_hash_int < target_int:
-            return block_header.hex()
-        nonce += 1
-    
+    target_bytes = bytes.fromhex(target)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    hashes = 0
+    start = timer()
+    try:
+        while True:
+            header_prefix = (version.to_bytes(4, byteorder='little') + bytes.fromhex(previous_block)[::-1] + merkle_root +
+                time.to_bytes(4, byteorder='little') + bits.to_bytes(4, byteorder='little'))
+            if executor is not None:
+                results = map_nonce_chunks(executor, workers, header_prefix, chunk_size, target_bytes)
+            else:
+                results = (search_nonce_range(header_prefix, first, count, target_bytes) for first, count in nonce_chunks(chunk_size))
+            for nonce, chunk_hashes in results:
+                hashes += chunk_hashes
+                if nonce is not None:
+                    elapsed = timer() - start
+                    print(f"found nonce {nonce} after {hashes} hashes ({hashes / elapsed if elapsed else 0.0:.0f} H/s)")
+                    if metrics is not None:
+                        metrics.set('nonce_hashes', hashes)
+                        metrics.set('hash_rate', hashes / elapsed if elapsed else 0.0)
+                    return (header_prefix + nonce.to_bytes(4, byteorder='little')).hex()
+            #every nonce failed for this timestamp
+            time += 1
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
 def calculate_subsidy(block_height):
     """
     Calculates the Bitcoin block reward subsidy based on the block height.
@@ -123,31 +379,38 @@ def calculate_subsidy(block_height):
     subsidy = 50* (0.5)** halvings
     return subsidy * 100000000
 
-def calculate_total_fees(files):
+def summarize_transactions(records):
     """
-    Calculates the total transaction fees from a list of transaction files.
+    Collects the total fees, the txids and the wtxids of the given transactions in a single pass.
 
-    :param files: A list of transaction files
-    :return: The total transaction fee.
+    :param records: A list of TransactionRecord objects
+    :return: A tuple of the total transaction fee, the list of txids and the list of wtxids.
     """
-    fee = 0 
-    for file in files:
-        fee += file['fee']
-    return fee
+    fees = 0
+    txids = []
+    wtxids = []
+    for record in records:
+        fees += record.fee
+        txids.append(record.txid)
+        wtxids.append(record.wtxid)
+    return fees, txids, wtxids
 
-def create_coinbase_transaction(block_height, reward, address):
+def create_coinbase_transaction(block_height, reward, address, extranonce=b''):
     """
     Creates a coinbase transaction for a newly mined block.
 
     :param block_height: The block height at which the coinbase transaction is created (integer).
     :param reward: The mining reward for the block in satoshis.
     :param address: The recipient's address for the mining reward in string.
+    :param extranonce: Bytes pushed after the block height, giving hashers more header variations than the nonce.
     :return: A tuple containing the coinbase transaction object and its transaction ID in string.
     """
+    from bitcoin.core import CTxIn, CTxOut, CMutableTransaction, COutPoint
+    from bitcoin.core.script import CScript, OP_DUP, OP_HASH160, OP_EQUALVERIFY, OP_CHECKSIG
     txid = "0000000000000000000000000000000000000000000000000000000000000000"
     sequence = 0xFFFFFFFF
     block_height_bytes = block_height.to_bytes(4, byteorder='little')
-    script_sig = CScript([block_height_bytes + b'\x00']) 
+    script_sig = CScript([block_height_bytes + b'\x00', extranonce] if extranonce else [block_height_bytes + b'\x00'])
     txin = CTxIn(prevout=COutPoint(bytes.fromhex(txid), 0xFFFFFFFF),scriptSig= script_sig , nSequence= sequence)
     address_hash = hashlib.sha256(address.encode()).digest()[:20] 
     txout = CTxOut(reward, CScript([OP_DUP, OP_HASH160, address_hash, OP_EQUALVERIFY, OP_CHECKSIG]))
@@ -162,6 +425,7 @@ def add_witness_commitment(mtx, witness_root_hash):
     :param witness_root_hash: The root hash of the witness Merkle tree in bytes.
     :return: The serialized transaction in hex format in string.
     """
+    from bitcoin.core import CTxOut, CTxInWitness, CTxWitness, CScriptWitness
     witness_reserved_value = '0000000000000000000000000000000000000000000000000000000000000000'
     witness_data = witness_root_hash.hex() + witness_reserved_value
     witness_commitment = hash256(bytes.fromhex(witness_data)).hex()
@@ -173,63 +437,284 @@ def add_witness_commitment(mtx, witness_root_hash):
     mtx.wit = CTxWitness([witness])
     return mtx.serialize().hex()
 
-def get_valid_transactions(folder_path):
+def init_validation_worker(results, snapshot_path=None, batch=True):
     """
-    Get all transaction files from the mempool and returns only the valid transaction files.
+    Installs the cached validation results in a validation worker and opens the mempool snapshot if there is one.
 
-    :param folder_path: The folder path to where the transaction files are located
-    :return: The valid transaction files
+    :param results: A dictionary mapping a wtxid to its cached validity
+    :param snapshot_path: The path to the mempool snapshot, or None when reading the mempool folder
+    :param batch: Whether taproot key path signatures are deferred to batch verification
     """
-    valid_tx_files=[]
-    for file in folder_path.iterdir():
-        with open (file , 'r') as data:
-            data_file = json.load(data)
-            if 'hex' in data_file:
-                tx_hex = data_file['hex']
-                if validate_transaction_signatures(tx_hex):
-                    valid_tx_files.append(data_file)
-    return valid_tx_files
+    global known_results, mempool_snapshot, batch_schnorr
+    known_results = results
+    batch_schnorr = batch
+    mempool_snapshot = MempoolSnapshot(snapshot_path) if snapshot_path is not None else None
 
-def get_wtxids(files):
+def validate_shard(shard):
+    """
+    Streams a shard of transactions and keeps the ones with valid signatures as compact records.
+    Transactions whose wtxid is in the cached results are not verified again.
+    Taproot key path spends are verified with the schnorr module: in batch mode they are returned
+    unverified with their signatures, otherwise their signatures are checked one by one here.
+    P2WPKH and P2WSH multisig spends are verified with ECDSA against the amounts of the spent outputs.
+    This is the unit of work handed to each worker of the validation pool.
+
+    :param shard: A list of paths to transaction files, or a range of positions in the mempool snapshot
+    :return: A tuple of the valid transaction records, the deferred (record, signatures) taproot transactions,
+             the new (wtxid, valid) results, the wtxids answered from the cache, the worker's process id,
+             the number of transactions checked, the seconds spent, the number of schnorr signatures verified,
+             the seconds spent verifying them, the seconds spent reading and parsing the transactions
+             and the txids of every transaction read, valid or not
+    """
+    start = time.perf_counter()
+    valid_records = []
+    txids = []
+    deferred = []
+    new_results = []
+    hits = []
+    signature_count = 0
+    signature_seconds = 0.0
+    load_seconds = 0.0
+    if isinstance(shard, range):
+        records = map(mempool_snapshot.record, shard)
+    else:
+        #a malformed transaction is read but can't be valid, so its txid counts as rejected
+        records = iter_transaction_records(shard, malformed=txids)
+    while True:
+        load_start = time.perf_counter()
+        record = next(records, None)
+        load_seconds += time.perf_counter() - load_start
+        if record is None:
+            break
+        txids.append(record.txid)
+        if record.wtxid in known_results:
+            valid = known_results[record.wtxid]
+            hits.append(record.wtxid)
+        else:
+            signatures = taproot_key_path_signatures(record)
+            if signatures is None:
+                checks = segwit_v0_signatures(record)
+                if checks is not None:
+                    valid = all(verify_multisig(*check) for check in checks)
+                else:
+                    #errors come back as a (False, message) tuple, which must not be cached as valid
+                    valid = validate_transaction_signatures(record.raw.hex()) is True
+            elif batch_schnorr:
+                deferred.append((record, signatures))
+                continue
+            else:
+                results, elapsed = verify_signature_batch(signatures, batch=False)
+                valid = all(results)
+                signature_count += len(signatures)
+                signature_seconds += elapsed
+            new_results.append((record.wtxid, valid))
+        if valid:
+            valid_records.append(record)
+    return (valid_records, deferred, new_results, hits, os.getpid(), len(shard), time.perf_counter() - start,
+            signature_count, signature_seconds, load_seconds, txids)
+
+def print_worker_throughput(worker_stats):
     """
-    Get the witness transaction IDs (wtxid) from the given transaction files.
+    Prints how many transactions each validation worker checked and at which rate.
 
-    :param files: A list of transactio files
-    :return: The witness transaction IDs
+    :param worker_stats: A dictionary mapping a worker's process id to [files checked, seconds spent]
     """
-    wtxids = []
-    for file in files:
-        wtxids.append(calculate_wtxid(file['hex']))
-    return wtxids
+    for pid, (count, elapsed) in sorted(worker_stats.items()):
+        rate = count / elapsed if elapsed else 0.0
+        print(f"worker {pid}: {count} transactions in {elapsed:.2f}s ({rate:.0f} tx/s)")
 
-def get_txids(files):
+def resolve_deferred_signatures(deferred, executor=None, workers=1, batch=True):
     """
-    Get the transaction IDs from the given transaction files.
-    
-    :param files: A list of transaction IDs
-    :return: The transaction IDs
+    Verifies the signatures of the deferred taproot transactions of every shard together.
+    They are split into one batch per worker, each verified with a single multi-scalar multiplication.
+
+    :param deferred: A list of (record, signatures) tuples.
+    :param executor: The validation process pool, or None to verify in this process.
+    :param workers: The number of worker processes of the pool.
+    :param batch: Whether to use batch verification.
+    :return: A tuple of the list of (record, valid) tuples, the number of signatures and the seconds spent verifying them.
     """
-    txids = []
-    for file in files:
-        txids.append(file['txid'])
-    return txids
+    signatures = [signature for _, tx_signatures in deferred for signature in tx_signatures]
+    batch_size = max(1, -(-len(signatures) // workers))
+    batches = [signatures[i:i + batch_size] for i in range(0, len(signatures), batch_size)]
+    if executor is not None:
+        outcomes = executor.map(verify_signature_batch, batches, [batch] * len(batches))
+    else:
+        outcomes = (verify_signature_batch(signatures, batch) for signatures in batches)
+    results = []
+    seconds = 0.0
+    for batch_results, elapsed in outcomes:
+        results.extend(batch_results)
+        seconds += elapsed
+    resolved = []
+    position = 0
+    for record, tx_signatures in deferred:
+        resolved.append((record, all(results[position:position + len(tx_signatures)])))
+        position += len(tx_signatures)
+    return resolved, len(signatures), seconds
+
+def print_signature_throughput(count, seconds, batch):
+    """
+    Prints how many schnorr signatures were verified and at which rate.
+
+    :param count: The number of signatures verified.
+    :param seconds: The seconds spent verifying them, summed over the workers.
+    :param batch: Whether batch verification was used.
+    """
+    rate = count / seconds if seconds else 0.0
+    print(f"schnorr ({'batch' if batch else 'single'}): {count} signatures in {seconds:.2f}s ({rate:.0f} sig/s)")
+
+def get_valid_transactions(folder_path, workers=1, shard_size=64, cache=None, snapshot=None, batch_schnorr=True,
+                           metrics=None, mempool_txids=None):
+    """
+    Get all transaction files from the mempool and returns only the valid transactions.
+    The files are sorted and split into shards, so the result is the same whatever the
+    number of workers is. With more than one worker the shards are validated on a process pool.
+    In batch mode the taproot key path signatures of the whole mempool are verified together
+    once every shard is done, and those transactions follow the others in the result.
+
+    :param folder_path: The folder path to where the transaction files are located
+    :param workers: The number of worker processes used for signature validation
+    :param shard_size: The number of transaction files handed to a worker at once
+    :param cache: An optional ValidationCache consulted before verifying signatures and updated afterwards
+    :param snapshot: An optional MempoolSnapshot of the folder, read instead of the transaction files
+    :param batch_schnorr: Whether taproot key path signatures are batch verified instead of one by one
+    :param metrics: An optional Metrics object receiving the worker seconds spent parsing and verifying
+    :param mempool_txids: An optional set receiving the txid of every transaction read, valid or not
+    :return: The valid transactions as TransactionRecord objects
+    """
+    global mempool_snapshot
+    init_validation_worker(cache.load() if cache is not None else {}, batch=batch_schnorr)
+    mempool_snapshot = snapshot
+    if snapshot is not None:
+        shards = [range(i, min(i + shard_size, len(snapshot))) for i in range(0, len(snapshot), shard_size)]
+        snapshot_path = snapshot.path
+    else:
+        files = sorted(folder_path.iterdir())
+        shards = [files[i:i + shard_size] for i in range(0, len(files), shard_size)]
+        snapshot_path = None
+    valid_records = []
+    deferred = []
+    new_results = []
+    hits = []
+    worker_stats = {}
+    signature_count = 0
+    signature_seconds = 0.0
+    load_seconds = 0.0
+    worker_seconds = 0.0
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_validation_worker,
+                                       initargs=(known_results, snapshot_path, batch_schnorr))
+        results = executor.map(validate_shard, shards)
+    else:
+        executor = None
+        results = map(validate_shard, shards)
+    try:
+        #executor.map yields the shards in submission order, which keeps the output deterministic
+        for (valid_shard, shard_deferred, shard_results, shard_hits, pid, count, elapsed, shard_signatures, shard_seconds,
+             shard_load_seconds, shard_txids) in results:
+            valid_records.extend(valid_shard)
+            if mempool_txids is not None:
+                mempool_txids.update(shard_txids)
+            deferred.extend(shard_deferred)
+            new_results.extend(shard_results)
+            hits.extend(shard_hits)
+            stats = worker_stats.setdefault(pid, [0, 0.0])
+            stats[0] += count
+            stats[1] += elapsed
+            signature_count += shard_signatures
+            signature_seconds += shard_seconds
+            load_seconds += shard_load_seconds
+            worker_seconds += elapsed
+        if deferred:
+            resolved, signature_count, signature_seconds = resolve_deferred_signatures(deferred, executor, workers)
+            for record, valid in resolved:
+                new_results.append((record.wtxid, valid))
+                if valid:
+                    valid_records.append(record)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    print_worker_throughput(worker_stats)
+    if signature_count:
+        print_signature_throughput(signature_count, signature_seconds, batch_schnorr)
+    if cache is not None:
+        cache.update(new_results, hits)
+        print(f"validation cache: {len(hits)} hits, {len(new_results)} transactions verified")
+    if metrics is not None:
+        #summed over the workers, the deferred schnorr signatures are verified after the shards
+        metrics.set('parse_worker_seconds', load_seconds)
+        metrics.set('verify_worker_seconds', worker_seconds - load_seconds + (signature_seconds if deferred else 0.0))
+        metrics.set('schnorr_signatures', signature_count)
+        metrics.set('validation_cache_hits', len(hits))
+    return valid_records
 
 def main():
-    #wallet and address creation or loading
-    wallet = create_or_load_wallet("mywallet")
-    address = generate_or_get_address(wallet)
+    #MINER_METRICS=report.json or report.prom writes a report of the run, MINER_TRACEMALLOC=1 adds per-stage
+    #memory peaks and MINER_PROFILE=miner.pstats profiles the whole run with cProfile
+    metrics = Metrics(trace_memory=os.environ.get("MINER_TRACEMALLOC") == "1")
+    with profiled(os.environ.get("MINER_PROFILE")):
+        assemble_block(metrics)
+    metrics_path = os.environ.get("MINER_METRICS")
+    if metrics_path:
+        metrics.write(metrics_path)
+        print(f"metrics written to '{metrics_path}'")
+
+def assemble_block(metrics):
+    """
+    Validates the mempool, assembles a block and writes it to out.txt.
+
+    :param metrics: The Metrics object recording the run.
+    """
+    #the payout address, from the wallet only the first time
+    with metrics.stage('payout_address'):
+        address = get_payout_address("mywallet")
+    metrics.set('import_seconds', import_seconds)
+    metrics.set('startup_seconds', time.perf_counter() - import_start)
 
     #getting the valid transactions
     folder_path = '/home/runner/work/2025-dev-week-3-mining-a-block-shahdhoss/2025-dev-week-3-mining-a-block-shahdhoss/mempool'
-    valid_transaction_files = get_valid_transactions(Path(folder_path))
+    workers = int(os.environ.get("MINER_WORKERS", os.cpu_count() or 1))
+    with metrics.stage('validate_transactions'):
+        cache = ValidationCache(os.environ.get("MINER_CACHE", Path(__file__).parent / "validation-cache.sqlite3"),
+                                rules_version=VALIDATION_RULES_VERSION)
+        #a snapshot compiled by snapshot.py is used as long as the folder hasn't changed since
+        snapshot_path = Path(folder_path).with_suffix('.snapshot')
+        if snapshot_path.exists() and snapshot_path.stat().st_mtime >= Path(folder_path).stat().st_mtime:
+            snapshot = MempoolSnapshot(snapshot_path)
+        else:
+            snapshot = None
+        batch_schnorr = os.environ.get("MINER_BATCH_SCHNORR", "1") != "0"
+        #the txids of the transactions validation read, so files that aren't transactions (mempool.json) don't count
+        mempool_txids = set()
+        valid_transactions = get_valid_transactions(Path(folder_path), workers, cache=cache, snapshot=snapshot,
+                                                    batch_schnorr=batch_schnorr, metrics=metrics,
+                                                    mempool_txids=mempool_txids)
+        cache.close()
+    metrics.count('rejected', 'invalid_signature', len(mempool_txids) - len(valid_transactions))
+
+    #signatures don't tell whether two transactions spend the same outpoint or create money
+    with metrics.stage('check_outpoints'):
+        valid_transactions, _, rejected = select_consistent_transactions(valid_transactions)
+    for reason, count in sorted(Counter(rejected.values()).items()):
+        print(f"rejected {count} transactions: {reason}")
+        metrics.count('rejected', reason, count)
+
+    #selecting the transactions of the block by ancestor package fee rate
+    with metrics.stage('build_template'):
+        block_transactions = build_block_template(valid_transactions, mempool_txids=mempool_txids)
+    metrics.count('accepted', amount=len(block_transactions))
+    metrics.count('excluded', 'not_selected', len(valid_transactions) - len(block_transactions))
 
     #creating a coinbase transaction
     txid = b"\x00" * 32
     block_height = 10
-    fees = calculate_total_fees(valid_transaction_files)
-    subsidy = calculate_subsidy(block_height)
-    amount = fees + subsidy
-    mtx , coinbase_txid = create_coinbase_transaction(block_height ,amount ,address)
+    with metrics.stage('coinbase'):
+        fees, txids, wtxids = summarize_transactions(block_transactions)
+        subsidy = calculate_subsidy(block_height)
+        amount = fees + subsidy
+        mtx , coinbase_txid = create_coinbase_transaction(block_height ,amount ,address)
+    metrics.set('block_fees', fees)
 
     #constructing the block header
     target = "0000ffff00000000000000000000000000000000000000000000000000000000"
@@ -237,21 +722,26 @@ def main():
     previous_block = "0000000000000000000000000000000000000000000000000000000000000000"
     unix_time = int(time.time()) + 50 
     bits = 520159231
-    txids = get_txids(valid_transaction_files)
-    wtxids = get_wtxids(valid_transaction_files)
     txids.insert(0, coinbase_txid)
     wtxids.insert(0, txid.hex())
 
-    merkle_root = generate_merkle_root(txids)
-    witness_root_hash = generate_merkle_root(wtxids)
-    coinbase_tx = add_witness_commitment(mtx, witness_root_hash)
-    block_header = construct_block_header(version, previous_block, merkle_root, unix_time, bits, target)
+    #the trees keep their levels, so a new coinbase only rehashes the left-most path
+    with metrics.stage('merkle'):
+        txid_tree = MerkleTree.from_txids(txids)
+        wtxid_tree = MerkleTree.from_txids(wtxids)
+        merkle_root = txid_tree.root
+        witness_root_hash = wtxid_tree.root
+        coinbase_tx = add_witness_commitment(mtx, witness_root_hash)
+    with metrics.stage('nonce_search'):
+        block_header = construct_block_header(version, previous_block, merkle_root, unix_time, bits, target, workers,
+                                              metrics=metrics)
     
-    with open("/home/runner/work/2025-dev-week-3-mining-a-block-shahdhoss/2025-dev-week-3-mining-a-block-shahdhoss/out.txt", 'w') as file:
-        file.write(block_header + '\n')
-        file.write(coinbase_tx + '\n')
-        for txid in txids:
-            file.write(txid + '\n')
+    with metrics.stage('write_output'):
+        with open("/home/runner/work/2025-dev-week-3-mining-a-block-shahdhoss/2025-dev-week-3-mining-a-block-shahdhoss/out.txt", 'w') as file:
+            file.write(block_header + '\n')
+            file.write(coinbase_tx + '\n')
+            for txid in txids:
+                file.write(txid + '\n')
     print("out.txt file has been written to successfully.")
 
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+import json
+from pathlib import Path
+from txparser import parse_transaction, input_outpoints, read_varint, serialize_varint
+
+class TransactionRecord:
+    """
+    The part of a mempool transaction file the miner keeps once the file has been read.
+    The ASM strings, addresses, status and hex string of the JSON file are dropped,
+    the transaction is kept as raw bytes instead of hex and the outputs spent by its
+    inputs (needed to compute signature hashes) are kept serialized like transaction outputs.
+    """
+    __slots__ = ('txid', 'wtxid', 'fee', 'weight', 'raw', 'parents', 'prevouts')
+
+    def __init__(self, txid, wtxid, fee, weight, raw, parents, prevouts=b''):
+        """
+        :param txid: The transaction ID in hexadecimal format.
+        :param wtxid: The witness transaction ID in hexadecimal format.
+        :param fee: The transaction fee in satoshis.
+        :param weight: The transaction weight.
+        :param raw: The serialized transaction as a bytes object or a memoryview.
+        :param parents: A tuple of the distinct txids spent by the inputs.
+        :param prevouts: The outputs spent by the inputs, serialized as (value, script) transaction outputs.
+        """
+        self.txid = txid
+        self.wtxid = wtxid
+        self.fee = fee
+        self.weight = weight
+        self.raw = raw
+        self.parents = parents
+        self.prevouts = prevouts
+
+    def __reduce__(self):
+        #raw may be a memoryview over a snapshot mapping, which is copied only when sent to another process
+        return TransactionRecord, (self.txid, self.wtxid, self.fee, self.weight, bytes(self.raw), self.parents,
+                                   bytes(self.prevouts))
+
+    def __repr__(self):
+        return f"TransactionRecord(txid={self.txid!r}, fee={self.fee}, weight={self.weight})"
+
+class MalformedTransaction(ValueError):
+    """
+    A transaction file whose hex doesn't hold a well-formed transaction, e.g. because it is truncated.
+    """
+
+def serialize_prevouts(vin):
+    """
+    Serializes the outputs spent by the inputs of a transaction file.
+
+    :param vin: The 'vin' list of a transaction file.
+    :return: The concatenated 8-byte little-endian values and length-prefixed scriptPubKeys, as bytes.
+    """
+    prevouts = bytearray()
+    for tx_input in vin:
+        script = bytes.fromhex(tx_input['prevout']['scriptpubkey'])
+        prevouts += tx_input['prevout']['value'].to_bytes(8, 'little')
+        prevouts += serialize_varint(len(script)) + script
+    return bytes(prevouts)
+
+def iter_prevouts(prevouts):
+    """
+    Reads back the outputs serialized by serialize_prevouts.
+
+    :param prevouts: The serialized prevouts as bytes or a memoryview.
+    :return: A generator of (value in satoshis, scriptPubKey bytes) tuples.
+    """
+    view = memoryview(prevouts)
+    offset = 0
+    while offset < len(view):
+        value = int.from_bytes(view[offset:offset + 8], 'little')
+        script_length, offset = read_varint(view, offset + 8)
+        yield value, bytes(view[offset:offset + script_length])
+        offset += script_length
+
+def load_transaction_record(path):
+    """
+    Reads a mempool transaction file into a compact record.
+    The txid, wtxid, weight and parents come from parsing the raw transaction once; only the fee is taken from the JSON.
+
+    :param path: The path to the transaction file.
+    :return: A TransactionRecord, or None if the file doesn't hold a transaction.
+    :raises MalformedTransaction: If the hex can't be parsed as a transaction.
+    """
+    with open(path, 'rb') as file:
+        data = json.load(file)
+    if not isinstance(data, dict) or 'hex' not in data:
+        return None
+    try:
+        raw = bytes.fromhex(data['hex'])
+        tx = parse_transaction(raw)
+    except (ValueError, IndexError) as error:
+        raise MalformedTransaction(f"{path}: {error}") from error
+    parents = tuple(dict.fromkeys(txid for txid, _ in input_outpoints(raw, tx)))
+    return TransactionRecord(tx.txid, tx.wtxid, data['fee'], tx.weight, raw, parents, serialize_prevouts(data['vin']))
+
+def iter_transaction_records(paths, malformed=None):
+    """
+    Lazily reads transaction files one at a time, so only one parsed JSON file is in memory at once.
+
+    :param paths: An iterable of paths to transaction files.
+    :param malformed: An optional list receiving the txid of every malformed transaction skipped,
+                      taken from its file name since the hex can't be parsed
+    :return: A generator of TransactionRecord objects, skipping files that don't hold a transaction
+             and malformed transactions, which can't be valid.
+    """
+    for path in paths:
+        try:
+            record = load_transaction_record(path)
+        except MalformedTransaction as error:
+            print(f"skipping malformed transaction {error}")
+            if malformed is not None:
+                malformed.append(Path(path).stem)
+            continue
+        if record is not None:
+            yield record
@@ -0,0 +1,152 @@
+import hashlib
+import sha256d
+
+def hash_pair(left, right):
+    """
+    Computes the double SHA-256 hash of two concatenated Merkle tree nodes.
+
+    :param left: The left node as a bytes object.
+    :param right: The right node as a bytes object.
+    :return: The parent node as a bytes object.
+    """
+    return hashlib.sha256(hashlib.sha256(left + right).digest()).digest()
+
+def hash_level(level):
+    """
+    Computes the parents of a level of Merkle tree nodes.
+    With the numpy sha256d backend the level is joined and hashed in one batch, otherwise pair by pair.
+
+    :param level: A list of nodes as bytes objects, the last one is paired with itself if their number is odd.
+    :return: The list of parent nodes.
+    """
+    if sha256d.backend == "numpy":
+        return sha256d.hash_pairs(b''.join(level + level[-1:] if len(level) % 2 else level))
+    return [hash_pair(level[i], level[i + 1] if i + 1 < len(level) else level[i]) for i in range(0, len(level), 2)]
+
+class MerkleTree:
+    """
+    A Merkle tree that keeps every level in memory as raw bytes.
+    Changing or appending a leaf only rehashes the path from that leaf to the root,
+    so refreshing the coinbase or adding a transaction costs O(log n) hashes.
+    As in Bitcoin, the last node of a level with an odd number of nodes is paired with itself.
+    """
+
+    def __init__(self, leaves=()):
+        """
+        Builds the tree from its leaves.
+
+        :param leaves: The leaf hashes in internal byte order (bytes objects).
+        """
+        self.levels = [list(leaves)]
+        while len(self.levels[-1]) > 1:
+            self.levels.append(hash_level(self.levels[-1]))
+
+    @classmethod
+    def from_txids(cls, txids):
+        """
+        Builds the tree from transaction IDs in hexadecimal (display) format.
+
+        :param txids: A list of transaction IDs in hexadecimal format.
+        :return: A MerkleTree object.
+        """
+        return cls(bytes.fromhex(txid)[::-1] for txid in txids)
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    @property
+    def root(self):
+        """
+        The Merkle root as a bytes object, or None if the tree has no leaves.
+        """
+        return self.levels[-1][0] if self.levels[0] else None
+
+    def update(self, index, leaf):
+        """
+        Replaces a leaf and rehashes its path to the root.
+
+        :param index: The position of the leaf.
+        :param leaf: The new leaf hash in internal byte order.
+        """
+        self.levels[0][index] = leaf
+        self._rehash_path(index)
+
+    def append(self, leaf):
+        """
+        Adds a leaf at the end of the tree and rehashes its path to the root.
+
+        :param leaf: The leaf hash in internal byte order.
+        """
+        self.levels[0].append(leaf)
+        self._rehash_path(len(self.levels[0]) - 1)
+
+    def truncate(self, length):
+        """
+        Drops the leaves from position length onwards and rehashes the new right-most path.
+
+        :param length: The number of leaves to keep.
+        """
+        if length >= len(self):
+            return
+        levels = []
+        size = length
+        for level in self.levels:
+            del level[size:]
+            levels.append(level)
+            if size <= 1:
+                break
+            size = (size + 1) // 2
+        self.levels = levels
+        if length:
+            self._rehash_path(length - 1)
+
+    def branch(self, index):
+        """
+        Extracts the Merkle branch (proof) of a leaf: the sibling of each node on its path to the root.
+
+        :param index: The position of the leaf.
+        :return: A list of sibling hashes from the leaf level upwards.
+        """
+        branch = []
+        for level in self.levels[:-1]:
+            sibling = index ^ 1
+            branch.append(level[sibling] if sibling < len(level) else level[index])
+            index //= 2
+        return branch
+
+    def _rehash_path(self, index):
+        """
+        Recomputes the parents of the node at index on every level, growing the tree when needed.
+
+        :param index: The position of the changed leaf.
+        """
+        depth = 0
+        while len(self.levels[depth]) > 1:
+            level = self.levels[depth]
+            parent = index // 2
+            left = level[2 * parent]
+            right = level[2 * parent + 1] if 2 * parent + 1 < len(level) else left
+            if depth + 1 == len(self.levels):
+                self.levels.append([])
+            upper = self.levels[depth + 1]
+            if parent == len(upper):
+                upper.append(hash_pair(left, right))
+            else:
+                upper[parent] = hash_pair(left, right)
+            index = parent
+            depth += 1
+
+def merkle_root_from_branch(leaf, index, branch):
+    """
+    Computes the Merkle root from a leaf and its Merkle branch.
+
+    :param leaf: The leaf hash in internal byte order.
+    :param index: The position of the leaf.
+    :param branch: The Merkle branch of the leaf, as returned by MerkleTree.branch.
+    :return: The Merkle root as a bytes object.
+    """
+    node = leaf
+    for sibling in branch:
+        node = hash_pair(sibling, node) if index & 1 else hash_pair(node, sibling)
+        index //= 2
+    return node
@@ -0,0 +1,165 @@
+"""
+Instrumentation of the block assembly pipeline: wall-clock time per stage, transactions counted by outcome
+and rejection reason, named values such as the hash rate, and peak memory.
+
+The report is written as JSON, or in the Prometheus text format when the path ends in .prom.
+Per-stage memory peaks come from tracemalloc, which slows Python down noticeably, so it is optional;
+the peak resident set size of the miner and of its worker processes is always reported.
+"""
+import cProfile
+import io
+import json
+import pstats
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:
+    #not available on Windows, the resident set size is left out there
+    resource = None
+
+PROMETHEUS_PREFIX = "miner"
+
+class Metrics:
+    """
+    Collects the measurements of one run of the miner.
+    """
+
+    def __init__(self, trace_memory=False):
+        """
+        :param trace_memory: Whether to track the peak Python memory of each stage with tracemalloc.
+        """
+        self.stages = {}
+        self.stage_memory = {}
+        self.transactions = Counter()
+        self.values = {}
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times a stage of the pipeline. A stage entered several times accumulates its time.
+
+        :param name: The stage name.
+        """
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+            if self.trace_memory:
+                self.stage_memory[name] = max(self.stage_memory.get(name, 0), tracemalloc.get_traced_memory()[1])
+
+    def count(self, outcome, reason=None, amount=1):
+        """
+        Counts transactions by outcome, e.g. accepted, or rejected with a reason.
+
+        :param outcome: The outcome.
+        :param reason: The rejection reason, if any.
+        :param amount: The number of transactions.
+        """
+        self.transactions[(outcome, reason)] += amount
+
+    def set(self, name, value):
+        """
+        Records a named value, e.g. the hash rate.
+
+        :param name: The name, in snake case.
+        :param value: A number.
+        """
+        self.values[name] = value
+
+    def peak_memory(self):
+        """
+        :return: A dictionary of the peak memory in bytes by source.
+        """
+        peaks = {}
+        if resource is not None:
+            #ru_maxrss is in kilobytes on Linux
+            peaks['max_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            peaks['max_rss_workers'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+        if self.trace_memory:
+            peaks['tracemalloc'] = max(self.stage_memory.values(), default=tracemalloc.get_traced_memory()[1])
+        return peaks
+
+    def report(self):
+        """
+        :return: The measurements as a dictionary ready to be serialized to JSON.
+        """
+        transactions = {}
+        for (outcome, reason), amount in sorted(self.transactions.items(), key=lambda item: (item[0][0], item[0][1] or '')):
+            if reason is None:
+                transactions[outcome] = transactions.get(outcome, 0) + amount
+            else:
+                transactions.setdefault(outcome + '_by_reason', {})[reason] = amount
+                transactions[outcome] = transactions.get(outcome, 0) + amount
+        report = {'stages_seconds': dict(self.stages), 'transactions': transactions, 'values': dict(self.values),
+                  'peak_memory_bytes': self.peak_memory()}
+        if self.trace_memory:
+            report['stage_peak_memory_bytes'] = dict(self.stage_memory)
+        return report
+
+    def prometheus(self):
+        """
+        :return: The measurements in the Prometheus text exposition format.
+        """
+        lines = [f"# HELP {PROMETHEUS_PREFIX}_stage_seconds Wall-clock seconds spent in each stage of block assembly.",
+                 f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds gauge"]
+        lines += [f'{PROMETHEUS_PREFIX}_stage_seconds{{stage="{name}"}} {seconds:.6f}' for name, seconds in self.stages.items()]
+        lines += [f"# HELP {PROMETHEUS_PREFIX}_transactions Transactions by outcome and rejection reason.",
+                  f"# TYPE {PROMETHEUS_PREFIX}_transactions gauge"]
+        for (outcome, reason), amount in sorted(self.transactions.items(), key=lambda item: (item[0][0], item[0][1] or '')):
+            labels = f'outcome="{outcome}"' + (f',reason="{reason}"' if reason is not None else '')
+            lines.append(f"{PROMETHEUS_PREFIX}_transactions{{{labels}}} {amount}")
+        lines += [f"# HELP {PROMETHEUS_PREFIX}_peak_memory_bytes Peak memory by source.",
+                  f"# TYPE {PROMETHEUS_PREFIX}_peak_memory_bytes gauge"]
+        lines += [f'{PROMETHEUS_PREFIX}_peak_memory_bytes{{source="{source}"}} {peak}' for source, peak in self.peak_memory().items()]
+        if self.trace_memory:
+            lines += [f"# TYPE {PROMETHEUS_PREFIX}_stage_peak_memory_bytes gauge"]
+            lines += [f'{PROMETHEUS_PREFIX}_stage_peak_memory_bytes{{stage="{name}"}} {peak}'
+                      for name, peak in self.stage_memory.items()]
+        for name, value in self.values.items():
+            lines += [f"# TYPE {PROMETHEUS_PREFIX}_{name} gauge", f"{PROMETHEUS_PREFIX}_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Writes the report, in the Prometheus text format if path ends in .prom and as JSON otherwise.
+
+        :param path: The output path.
+        """
+        path = str(path)
+        with open(path, 'w') as file:
+            if path.endswith('.prom'):
+                file.write(self.prometheus())
+            else:
+                json.dump(self.report(), file, indent=2)
+
+@contextmanager
+def profiled(path, top=20):
+    """
+    Profiles the enclosed code with cProfile when a path is given, dumps the stats to it
+    and prints the functions with the highest cumulative time.
+
+    :param path: The path of the pstats dump, or None to not profile.
+    :param top: The number of functions printed.
+    """
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(top)
+        print(output.getvalue())
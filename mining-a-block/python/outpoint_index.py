@@ -0,0 +1,207 @@
+from block_template import collect_ancestors
+from mempool_loader import iter_prevouts
+from txparser import parse_transaction
+
+#reasons a transaction is rejected by the contextual checks
+REJECT_DOUBLE_SPEND = 'double-spend'
+REJECT_INSUFFICIENT_INPUTS = 'outputs exceed inputs'
+REJECT_MISSING_OUTPUT = 'spends a missing mempool output'
+REJECT_PREVOUT_MISMATCH = 'prevout does not match the mempool output'
+REJECT_PARENT_REJECTED = 'parent rejected'
+
+def outpoint_key(txid, vout):
+    """
+    Builds the compact key of an outpoint, the 36 bytes it is serialized as in a transaction input.
+
+    :param txid: The transaction ID in hexadecimal format.
+    :param vout: The output index.
+    :return: The internal byte order txid followed by the 4-byte little-endian output index.
+    """
+    return bytes.fromhex(txid)[::-1] + vout.to_bytes(4, 'little')
+
+class OutpointIndex:
+    """
+    An in-memory index of the outputs created and spent by a set of mempool transactions.
+    Keys are 36-byte outpoints sliced straight out of the serialized transactions, so no
+    hex strings or tuples are built per input and every lookup is a single dict access.
+    """
+
+    def __init__(self):
+        #outpoint -> value in satoshis, for the outputs of indexed transactions
+        self.outputs = {}
+        #outpoint -> txid of the transaction spending it
+        self.spenders = {}
+        #internal byte order txid -> number of outputs, for the indexed transactions
+        self.output_counts = {}
+
+    def __len__(self):
+        return len(self.spenders)
+
+    def add_outputs(self, record, tx):
+        """
+        Indexes the outputs created by a transaction, so that its children can be checked against them.
+
+        :param record: A TransactionRecord.
+        :param tx: The ParsedTransaction of record.raw.
+        :return: The total value of the outputs in satoshis.
+        """
+        view = memoryview(record.raw)
+        txid = bytes.fromhex(record.txid)[::-1]
+        total = 0
+        for vout, (start, _) in enumerate(tx.outputs):
+            value = int.from_bytes(view[start:start + 8], 'little')
+            self.outputs[txid + vout.to_bytes(4, 'little')] = value
+            total += value
+        self.output_counts[txid] = len(tx.outputs)
+        return total
+
+    def check_inputs(self, record, tx, output_value):
+        """
+        Checks the inputs of a transaction against the indexed outputs and its declared prevouts.
+        Inputs spending an indexed transaction must name one of its outputs with the same value,
+        and the inputs must be worth at least the outputs.
+
+        :param record: A TransactionRecord with the outputs spent by its inputs.
+        :param tx: The ParsedTransaction of record.raw.
+        :param output_value: The total value of the transaction's outputs in satoshis.
+        :return: None if the inputs are consistent, otherwise the rejection reason.
+        """
+        view = memoryview(record.raw)
+        input_value = 0
+        for (start, _), (value, _) in zip(tx.inputs, iter_prevouts(record.prevouts)):
+            outpoint = bytes(view[start:start + 36])
+            if outpoint[:32] in self.output_counts:
+                if outpoint not in self.outputs:
+                    return REJECT_MISSING_OUTPUT
+                if self.outputs[outpoint] != value:
+                    return REJECT_PREVOUT_MISMATCH
+            input_value += value
+        if input_value < output_value:
+            return REJECT_INSUFFICIENT_INPUTS
+        return None
+
+    def claim_inputs(self, package):
+        """
+        Marks the outpoints spent by a package of transactions, unless one of them is already spent.
+
+        :param package: A list of (TransactionRecord, ParsedTransaction) tuples.
+        :return: None if the outpoints were claimed, otherwise the first record of the package spending an outpoint
+                 already spent by an indexed transaction or by an earlier transaction of the package.
+        """
+        claimed = {}
+        for record, tx in package:
+            view = memoryview(record.raw)
+            for start, _ in tx.inputs:
+                outpoint = bytes(view[start:start + 36])
+                if outpoint in self.spenders or outpoint in claimed:
+                    return record
+                claimed[outpoint] = record.txid
+        self.spenders.update(claimed)
+        return None
+
+    def spender(self, txid, vout):
+        """
+        :param txid: The transaction ID in hexadecimal format.
+        :param vout: The output index.
+        :return: The txid of the indexed transaction spending the outpoint, or None if it is unspent.
+        """
+        return self.spenders.get(outpoint_key(txid, vout))
+
+    def output_value(self, txid, vout):
+        """
+        :param txid: The transaction ID in hexadecimal format.
+        :param vout: The output index.
+        :return: The value of an output of an indexed transaction in satoshis, or None if there is no such output.
+        """
+        return self.outputs.get(outpoint_key(txid, vout))
+
+def reject_descendants(rejected, children, txids):
+    """
+    Rejects every descendant of the given transactions that isn't rejected yet.
+
+    :param rejected: The dictionary mapping each rejected txid to its rejection reason, updated in place.
+    :param children: A dictionary mapping a txid to the txids spending its outputs.
+    :param txids: The txids of the newly rejected transactions.
+    """
+    stack = list(txids)
+    while stack:
+        for child in children.get(stack.pop(), ()):
+            if child not in rejected:
+                rejected[child] = REJECT_PARENT_REJECTED
+                stack.append(child)
+
+def unaccepted_package(txid, parents, accepted):
+    """
+    Collects a transaction with its ancestors that aren't accepted yet, parents first.
+
+    :param txid: The transaction ID.
+    :param parents: A dictionary mapping each txid that has parents among the transactions to those parents.
+    :param accepted: The set of accepted txids.
+    :return: A list of txids.
+    """
+    ordered = []
+    visited = set()
+    stack = [(txid, False)]
+    while stack:
+        current, expanded = stack.pop()
+        if expanded:
+            ordered.append(current)
+            continue
+        if current in visited:
+            continue
+        visited.add(current)
+        stack.append((current, True))
+        stack.extend((parent, False) for parent in parents.get(current, ()) if parent not in accepted)
+    return ordered
+
+def select_consistent_transactions(records):
+    """
+    Drops the transactions that can't be mined together with the others.
+    The outputs of every transaction are indexed first, then each transaction's inputs are checked
+    against them and the descendants of the failing ones are rejected, before any conflict is resolved.
+    The survivors then claim their outpoints from the highest ancestor package fee rate down, each together
+    with its ancestors that aren't accepted yet. Of two transactions spending the same outpoint the one whose
+    package pays more per weight unit is kept, and an accepted transaction is never dropped afterwards,
+    so no transaction loses an outpoint to one that isn't mined.
+
+    :param records: A list of TransactionRecord objects with the outputs spent by their inputs.
+    :return: A tuple of the kept records in their original order, the index built over them, and a dictionary
+             mapping each rejected txid to its rejection reason.
+    """
+    index = OutpointIndex()
+    by_txid = {record.txid: record for record in records}
+    parsed = {record.txid: parse_transaction(record.raw) for record in records}
+    rejected = {}
+    output_values = [index.add_outputs(record, parsed[record.txid]) for record in records]
+    for record, output_value in zip(records, output_values):
+        reason = index.check_inputs(record, parsed[record.txid], output_value)
+        if reason is not None:
+            rejected[record.txid] = reason
+    parents = {}
+    children = {}
+    for record in records:
+        in_set = [parent for parent in record.parents if parent in by_txid]
+        if in_set:
+            parents[record.txid] = in_set
+        for parent in in_set:
+            children.setdefault(parent, []).append(record.txid)
+    reject_descendants(rejected, children, list(rejected))
+
+    ancestors = {}
+    def package_fee_rate(record):
+        members = [by_txid[member] for member in collect_ancestors(record.txid, parents, ancestors)] + [record]
+        return sum(member.fee for member in members) / sum(member.weight for member in members)
+    order = sorted((record for record in records if record.txid not in rejected),
+                   key=lambda record: (-package_fee_rate(record), record.txid))
+    accepted = set()
+    for record in order:
+        if record.txid in rejected or record.txid in accepted:
+            continue
+        package = unaccepted_package(record.txid, parents, accepted)
+        loser = index.claim_inputs([(by_txid[member], parsed[member]) for member in package])
+        if loser is None:
+            accepted.update(package)
+        else:
+            rejected[loser.txid] = REJECT_DOUBLE_SPEND
+            reject_descendants(rejected, children, [loser.txid])
+    return [record for record in records if record.txid not in rejected], index, rejected
@@ -0,0 +1,320 @@
+import secrets
+from sighash import tagged_hash
+try:
+    #bitcoinlib installs fastecdsa (except on Windows), which verifies ECDSA signatures about twice as fast as ecdsa_verify
+    from fastecdsa import _ecdsa as fastecdsa
+except ImportError:
+    fastecdsa = None
+
+#secp256k1 field size, group order and generator
+P = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEFFFFFC2F
+N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+G = (0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798,
+     0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8)
+#the curve y^2 = x^3 + 7 as passed to fastecdsa: field size, a, b, order and generator
+CURVE_PARAMETERS = tuple(str(value) for value in (P, 0, 7, N, G[0], G[1]))
+#a failed batch larger than this is split in halves before falling back to single verification
+BISECT_THRESHOLD = 32
+
+def lift_x(x):
+    """
+    Finds the point with the given x coordinate and an even y coordinate (BIP340).
+
+    :param x: The x coordinate as an integer.
+    :return: The affine point as an (x, y) tuple, or None if there is no such point.
+    """
+    if x >= P:
+        return None
+    y_squared = (pow(x, 3, P) + 7) % P
+    y = pow(y_squared, (P + 1) // 4, P)
+    if y * y % P != y_squared:
+        return None
+    return x, y if y % 2 == 0 else P - y
+
+def jacobian_double(point):
+    """
+    Doubles a point in Jacobian coordinates.
+
+    :param point: An (X, Y, Z) tuple, or None for the point at infinity.
+    :return: The doubled point in Jacobian coordinates.
+    """
+    if point is None:
+        return None
+    x, y, z = point
+    if y == 0:
+        return None
+    y_squared = y * y % P
+    s = 4 * x * y_squared % P
+    m = 3 * x * x % P
+    x3 = (m * m - 2 * s) % P
+    return x3, (m * (s - x3) - 8 * y_squared * y_squared) % P, 2 * y * z % P
+
+def jacobian_add(first, second):
+    """
+    Adds two points in Jacobian coordinates.
+
+    :param first: An (X, Y, Z) tuple, or None for the point at infinity.
+    :param second: An (X, Y, Z) tuple, or None for the point at infinity.
+    :return: The sum in Jacobian coordinates.
+    """
+    if first is None:
+        return second
+    if second is None:
+        return first
+    x1, y1, z1 = first
+    x2, y2, z2 = second
+    z1_squared = z1 * z1 % P
+    z2_squared = z2 * z2 % P
+    u1 = x1 * z2_squared % P
+    u2 = x2 * z1_squared % P
+    s1 = y1 * z2_squared * z2 % P
+    s2 = y2 * z1_squared * z1 % P
+    h = (u2 - u1) % P
+    r = (s2 - s1) % P
+    if h == 0:
+        return jacobian_double(first) if r == 0 else None
+    h_squared = h * h % P
+    h_cubed = h * h_squared % P
+    u1_h_squared = u1 * h_squared % P
+    x3 = (r * r - h_cubed - 2 * u1_h_squared) % P
+    return x3, (r * (u1_h_squared - x3) - s1 * h_cubed) % P, h * z1 * z2 % P
+
+def jacobian_add_affine(first, second):
+    """
+    Adds an affine point to a point in Jacobian coordinates (mixed addition, cheaper than jacobian_add).
+
+    :param first: An (X, Y, Z) tuple, or None for the point at infinity.
+    :param second: An affine (x, y) tuple.
+    :return: The sum in Jacobian coordinates.
+    """
+    if first is None:
+        return second[0], second[1], 1
+    x1, y1, z1 = first
+    z1_squared = z1 * z1 % P
+    u2 = second[0] * z1_squared % P
+    s2 = second[1] * z1_squared * z1 % P
+    h = (u2 - x1) % P
+    r = (s2 - y1) % P
+    if h == 0:
+        return jacobian_double(first) if r == 0 else None
+    h_squared = h * h % P
+    h_cubed = h * h_squared % P
+    x1_h_squared = x1 * h_squared % P
+    x3 = (r * r - h_cubed - 2 * x1_h_squared) % P
+    return x3, (r * (x1_h_squared - x3) - y1 * h_cubed) % P, z1 * h % P
+
+def to_affine(point):
+    """
+    Converts a point from Jacobian to affine coordinates.
+
+    :param point: An (X, Y, Z) tuple, or None for the point at infinity.
+    :return: An (x, y) tuple, or None for the point at infinity.
+    """
+    if point is None:
+        return None
+    x, y, z = point
+    z_inverse = pow(z, -1, P)
+    z_inverse_squared = z_inverse * z_inverse % P
+    return x * z_inverse_squared % P, y * z_inverse_squared * z_inverse % P
+
+def double_scalar_multiply(first_scalar, first_point, second_scalar, second_point):
+    """
+    Computes k1*P1 + k2*P2 with Shamir's trick: both scalars share the same 256 doublings.
+
+    :param first_scalar: The first scalar.
+    :param first_point: The first affine point.
+    :param second_scalar: The second scalar.
+    :param second_point: The second affine point.
+    :return: The result in Jacobian coordinates.
+    """
+    both = to_affine(jacobian_add_affine(jacobian_add_affine(None, first_point), second_point))
+    result = None
+    for bit in range(max(first_scalar.bit_length(), second_scalar.bit_length()) - 1, -1, -1):
+        result = jacobian_double(result)
+        first_bit = first_scalar >> bit & 1
+        second_bit = second_scalar >> bit & 1
+        if first_bit and second_bit:
+            if both is None:
+                continue
+            result = jacobian_add_affine(result, both)
+        elif first_bit:
+            result = jacobian_add_affine(result, first_point)
+        elif second_bit:
+            result = jacobian_add_affine(result, second_point)
+    return result
+
+def multi_scalar_multiply(pairs):
+    """
+    Computes the sum of k_i*P_i with Pippenger's bucket method.
+    Each window of c scalar bits costs one addition per point plus 2^(c+1) bucket additions,
+    and the 256 doublings are shared by all points.
+
+    :param pairs: A list of (scalar, affine point) tuples.
+    :return: The sum in Jacobian coordinates.
+    """
+    #a window of c bits costs about len(pairs) mixed additions and 2^(c+1) full additions (worth two mixed ones)
+    window = min(range(1, 17), key=lambda bits: -(-256 // bits) * (len(pairs) + (1 << (bits + 2))))
+    mask = (1 << window) - 1
+    result = None
+    for shift in range((255 // window) * window, -1, -window):
+        for _ in range(window):
+            result = jacobian_double(result)
+        buckets = [None] * (mask + 1)
+        for scalar, point in pairs:
+            digit = scalar >> shift & mask
+            if digit:
+                buckets[digit] = jacobian_add_affine(buckets[digit], point)
+        running = None
+        total = None
+        for digit in range(mask, 0, -1):
+            running = jacobian_add(running, buckets[digit])
+            total = jacobian_add(total, running)
+        result = jacobian_add(result, total)
+    return result
+
+def parse_signature(pubkey, message, signature):
+    """
+    Decodes a BIP340 signature and computes its challenge.
+
+    :param pubkey: The 32-byte x-only public key.
+    :param message: The 32-byte message.
+    :param signature: The 64-byte signature.
+    :return: A tuple of the public key point, r, s and the challenge e, or None if the encoding is invalid.
+    """
+    point = lift_x(int.from_bytes(pubkey, 'big'))
+    r = int.from_bytes(signature[:32], 'big')
+    s = int.from_bytes(signature[32:], 'big')
+    if point is None or r >= P or s >= N:
+        return None
+    e = int.from_bytes(tagged_hash("BIP0340/challenge", bytes(signature[:32]) + bytes(pubkey) + bytes(message)), 'big') % N
+    return point, r, s, e
+
+def schnorr_verify(pubkey, message, signature):
+    """
+    Verifies a single BIP340 signature.
+
+    :param pubkey: The 32-byte x-only public key.
+    :param message: The 32-byte message.
+    :param signature: The 64-byte signature.
+    :return: True if the signature is valid, otherwise False.
+    """
+    parsed = parse_signature(pubkey, message, signature)
+    if parsed is None:
+        return False
+    point, r, s, e = parsed
+    nonce_point = to_affine(double_scalar_multiply(s, G, N - e, point))
+    return nonce_point is not None and nonce_point[1] % 2 == 0 and nonce_point[0] == r
+
+def schnorr_batch_verify(signatures):
+    """
+    Verifies many BIP340 signatures at once (BIP340 batch verification).
+    With random a_1 = 1, a_2..a_u it checks (sum a_i*s_i)*G == sum a_i*R_i + sum a_i*e_i*P_i
+    with a single multi-scalar multiplication instead of two scalar multiplications per signature.
+
+    :param signatures: A list of (pubkey, message, signature) tuples.
+    :return: True if every signature is valid, otherwise False (some signature is invalid).
+    """
+    pairs = []
+    generator_scalar = 0
+    for index, (pubkey, message, signature) in enumerate(signatures):
+        parsed = parse_signature(pubkey, message, signature)
+        if parsed is None:
+            return False
+        point, r, s, e = parsed
+        nonce_point = lift_x(r)
+        if nonce_point is None:
+            return False
+        a = 1 if index == 0 else secrets.randbelow(N - 1) + 1
+        generator_scalar = (generator_scalar + a * s) % N
+        pairs.append((a, nonce_point))
+        pairs.append((a * e % N, point))
+    pairs.append(((N - generator_scalar) % N, G))
+    return multi_scalar_multiply(pairs) is None
+
+def verify_schnorr_signatures(signatures, batch=True):
+    """
+    Verifies BIP340 signatures, in a batch or one by one.
+    When a batch fails it is split in halves that are batch verified again, so a few invalid signatures
+    only cost a few extra batches; batches of BISECT_THRESHOLD signatures or less are checked one by one.
+
+    :param signatures: A list of (pubkey, message, signature) tuples.
+    :param batch: Whether to try batch verification first.
+    :return: A list with True or False for each signature.
+    """
+    if not signatures:
+        return []
+    if batch:
+        if schnorr_batch_verify(signatures):
+            return [True] * len(signatures)
+        if len(signatures) > BISECT_THRESHOLD:
+            middle = len(signatures) // 2
+            return verify_schnorr_signatures(signatures[:middle]) + verify_schnorr_signatures(signatures[middle:])
+    return [schnorr_verify(*signature) for signature in signatures]
+
+def decode_public_key(pubkey):
+    """
+    Decodes a SEC1 encoded ECDSA public key, compressed or uncompressed.
+
+    :param pubkey: The 33 or 65-byte public key.
+    :return: The affine point as an (x, y) tuple, or None if the encoding is invalid.
+    """
+    if len(pubkey) == 33 and pubkey[0] in (2, 3):
+        point = lift_x(int.from_bytes(pubkey[1:], 'big'))
+        if point is None:
+            return None
+        return point if pubkey[0] == 2 else (point[0], P - point[1])
+    if len(pubkey) == 65 and pubkey[0] == 4:
+        x = int.from_bytes(pubkey[1:33], 'big')
+        y = int.from_bytes(pubkey[33:], 'big')
+        if x >= P or y >= P or (y * y - pow(x, 3, P) - 7) % P:
+            return None
+        return x, y
+    return None
+
+def parse_der_signature(signature):
+    """
+    Decodes a strictly DER encoded ECDSA signature (BIP66).
+
+    :param signature: The signature without its sighash type byte.
+    :return: An (r, s) tuple, or None if the encoding is invalid.
+    """
+    if not 8 <= len(signature) <= 72 or signature[0] != 0x30 or signature[1] != len(signature) - 2:
+        return None
+    values = []
+    offset = 2
+    for _ in range(2):
+        if offset + 2 > len(signature) or signature[offset] != 0x02:
+            return None
+        length = signature[offset + 1]
+        value = signature[offset + 2:offset + 2 + length]
+        #integers are positive and minimally encoded
+        if not length or len(value) != length or value[0] & 0x80 or (length > 1 and not value[0] and not value[1] & 0x80):
+            return None
+        values.append(int.from_bytes(value, 'big'))
+        offset += 2 + length
+    if offset != len(signature):
+        return None
+    return values[0], values[1]
+
+def ecdsa_verify(pubkey, message, signature):
+    """
+    Verifies an ECDSA signature, with fastecdsa when it is installed.
+
+    :param pubkey: The SEC1 encoded public key.
+    :param message: The 32-byte signature hash.
+    :param signature: The DER encoded signature without its sighash type byte.
+    :return: True if the signature is valid, otherwise False.
+    """
+    point = decode_public_key(pubkey)
+    parsed = parse_der_signature(signature)
+    if point is None or parsed is None:
+        return False
+    r, s = parsed
+    if not 0 < r < N or not 0 < s < N:
+        return False
+    if fastecdsa is not None:
+        return fastecdsa.verify(str(r), str(s), bytes(message).hex(), str(point[0]), str(point[1]), *CURVE_PARAMETERS)
+    s_inverse = pow(s, -1, N)
+    nonce_point = to_affine(double_scalar_multiply(int.from_bytes(message, 'big') * s_inverse % N, G,
+                                                   r * s_inverse % N, point))
+    return nonce_point is not None and nonce_point[0] % N == r
@@ -0,0 +1,408 @@
+"""
+A long-running miner that keeps out.txt up to date while the mempool folder changes.
+
+The folder is polled (a poll that finds the folder's modification time unchanged costs a single stat),
+only newly arrived transaction files are validated on a process pool, and the block template is
+updated in place: a new transaction is appended with its missing ancestors, evicting the lowest
+fee rate transactions at the end of the template when the block is full. Every appended transaction
+has its inputs checked against the outputs of the pool, like in a full rebuild. Removed transactions
+and conflicting spends trigger a full rebuild, which runs in a thread so the event loop keeps polling. Each new block is written to a temporary file
+and moved over out.txt, so readers never see a partially written block.
+
+Usage: python service.py [mempool folder] [out.txt path] [poll interval in seconds]
+"""
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from block_template import build_block_template, MAX_BLOCK_WEIGHT, COINBASE_WEIGHT_RESERVE
+from merkle import MerkleTree
+from outpoint_index import OutpointIndex, select_consistent_transactions
+from txparser import parse_transaction
+from validation_cache import ValidationCache
+from main import (get_payout_address, calculate_subsidy, create_coinbase_transaction,
+                  add_witness_commitment, construct_block_header, init_validation_worker, validate_shard,
+                  resolve_deferred_signatures, VALIDATION_RULES_VERSION)
+
+BLOCK_HEIGHT = 10
+VERSION = 4
+PREVIOUS_BLOCK = "0000000000000000000000000000000000000000000000000000000000000000"
+BITS = 520159231
+TARGET = "0000ffff00000000000000000000000000000000000000000000000000000000"
+#the wtxid of the coinbase is always zero, and its txid leaf is zero until a coinbase is built
+ZERO_HASH = b"\x00" * 32
+
+def validate_files(paths):
+    """
+    Validates a shard of newly arrived transaction files in a worker, taproot signatures included.
+
+    :param paths: A list of paths to transaction files.
+    :return: A tuple of the valid transaction records, the new (wtxid, valid) results, the cache hits
+             and the txids of every transaction read.
+    """
+    valid_records, deferred, new_results, hits, *_, txids = validate_shard(paths)
+    resolved, _, _ = resolve_deferred_signatures(deferred)
+    for record, valid in resolved:
+        new_results.append((record.wtxid, valid))
+        if valid:
+            valid_records.append(record)
+    return valid_records, new_results, hits, txids
+
+def scan_folder(folder_path):
+    """
+    Lists the transaction files of the mempool folder.
+
+    :param folder_path: The mempool folder.
+    :return: A set of file names.
+    """
+    with os.scandir(folder_path) as entries:
+        return {entry.name for entry in entries if entry.name.endswith('.json')}
+
+def write_atomically(path, text):
+    """
+    Writes a file through a temporary file in the same folder that is then renamed over it.
+
+    :param path: The path to the file.
+    :param text: The new contents of the file.
+    """
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'w') as file:
+        file.write(text)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+
+class IncrementalTemplate:
+    """
+    The transactions of the block being mined, in block order, together with the Merkle trees of their
+    txids and wtxids (leaf 0 is the coinbase). Appending or evicting a transaction only rehashes
+    one path of each tree, so a change costs time proportional to its size, not to the mempool's.
+    """
+
+    def __init__(self, max_weight=MAX_BLOCK_WEIGHT - COINBASE_WEIGHT_RESERVE):
+        """
+        :param max_weight: The maximum total weight of the selected transactions.
+        """
+        self.max_weight = max_weight
+        self.pool = {}
+        self.mempool_txids = set()
+        #outputs of the pool transactions, to check the inputs of a package before it is appended
+        self.outpoints = OutpointIndex()
+        self.reset([])
+
+    def reset(self, records):
+        """
+        Replaces the selected transactions.
+
+        :param records: The selected transaction records in block order.
+        """
+        self.records = list(records)
+        self.included = {record.txid for record in self.records}
+        self.weight = sum(record.weight for record in self.records)
+        self.fees = sum(record.fee for record in self.records)
+        self.txid_tree = MerkleTree([ZERO_HASH] + [bytes.fromhex(record.txid)[::-1] for record in self.records])
+        self.wtxid_tree = MerkleTree([ZERO_HASH] + [bytes.fromhex(record.wtxid)[::-1] for record in self.records])
+        #outpoints spent by the selected transactions, to spot a new transaction that conflicts with them
+        self.spent = set()
+        self.spent_by = {}
+        #parents of the selected transactions, they were confirmed or missing when their children were selected
+        self.selected_parents = set()
+        for record in self.records:
+            self.claim(record)
+
+    def claim(self, record):
+        """
+        Marks the outpoints spent by a selected transaction.
+
+        :param record: A TransactionRecord.
+        """
+        view = memoryview(record.raw)
+        outpoints = [bytes(view[start:start + 36]) for start, _ in parse_transaction(record.raw).inputs]
+        self.spent.update(outpoints)
+        self.spent_by[record.txid] = outpoints
+        self.selected_parents.update(record.parents)
+
+    def conflicts(self, record):
+        """
+        :param record: A TransactionRecord.
+        :return: True if the transaction spends an outpoint already spent by the template.
+        """
+        view = memoryview(record.raw)
+        return any(bytes(view[start:start + 36]) in self.spent for start, _ in parse_transaction(record.raw).inputs)
+
+    def rebuild(self):
+        """
+        Selects the transactions of the block from scratch out of the whole valid pool.
+        """
+        consistent, self.outpoints, _ = select_consistent_transactions(list(self.pool.values()))
+        self.reset(build_block_template(consistent, self.max_weight, self.mempool_txids))
+
+    def package(self, record):
+        """
+        Collects a transaction with its in-mempool ancestors that aren't selected yet, parents first.
+
+        :param record: A TransactionRecord in the pool.
+        :return: A list of TransactionRecord objects, or None if an ancestor isn't valid.
+        """
+        ordered = []
+        visited = set()
+        stack = [(record, False)]
+        while stack:
+            current, expanded = stack.pop()
+            if expanded:
+                ordered.append(current)
+                continue
+            if current.txid in visited:
+                continue
+            visited.add(current.txid)
+            stack.append((current, True))
+            for parent in current.parents:
+                if parent in self.included or parent in visited:
+                    continue
+                if parent in self.pool:
+                    stack.append((self.pool[parent], False))
+                elif parent in self.mempool_txids:
+                    return None
+        return ordered
+
+    def add(self, record):
+        """
+        Tries to add a newly validated transaction (already in the pool) to the block.
+        Every member of its package must spend existing outputs of its parents with the declared values
+        and its inputs must cover its outputs. When it doesn't fit, transactions at the end of the block
+        with a lower fee rate than its package are evicted, as long as none of them is a parent of the package.
+
+        :param record: A TransactionRecord.
+        :return: The number of transactions evicted, or None if the transaction wasn't added.
+        """
+        if record.txid in self.included:
+            return None
+        members = self.package(record)
+        if members is None or any(self.conflicts(member) for member in members):
+            return None
+        #members come parents first, so each one is checked against the outputs of the ones before it
+        for member in members:
+            tx = parse_transaction(member.raw)
+            if self.outpoints.check_inputs(member, tx, self.outpoints.add_outputs(member, tx)) is not None:
+                return None
+        package_fee = sum(member.fee for member in members)
+        package_weight = sum(member.weight for member in members)
+        parents = {parent for member in members for parent in member.parents}
+        keep = len(self.records)
+        weight = self.weight
+        while weight + package_weight > self.max_weight and keep:
+            tail = self.records[keep - 1]
+            if tail.txid in parents or tail.fee * package_weight >= package_fee * tail.weight:
+                return None
+            weight -= tail.weight
+            keep -= 1
+        if weight + package_weight > self.max_weight:
+            return None
+        evicted = self.records[keep:]
+        if evicted:
+            self.evict(keep)
+        for member in members:
+            self.records.append(member)
+            self.included.add(member.txid)
+            self.weight += member.weight
+            self.fees += member.fee
+            self.claim(member)
+            self.txid_tree.append(bytes.fromhex(member.txid)[::-1])
+            self.wtxid_tree.append(bytes.fromhex(member.wtxid)[::-1])
+        return len(evicted)
+
+    def evict(self, keep):
+        """
+        Drops the selected transactions from position keep onwards.
+
+        :param keep: The number of selected transactions to keep.
+        """
+        for record in self.records[keep:]:
+            self.included.discard(record.txid)
+            self.weight -= record.weight
+            self.fees -= record.fee
+            self.spent.difference_update(self.spent_by.pop(record.txid))
+        del self.records[keep:]
+        self.txid_tree.truncate(keep + 1)
+        self.wtxid_tree.truncate(keep + 1)
+
+    def assemble(self, address, workers=1):
+        """
+        Builds the coinbase transaction for the current fees and mines the block header.
+
+        :param address: The address receiving the block reward.
+        :param workers: The number of worker processes searching nonces.
+        :return: The contents of out.txt.
+        """
+        mtx, coinbase_txid = create_coinbase_transaction(BLOCK_HEIGHT, self.fees + calculate_subsidy(BLOCK_HEIGHT), address)
+        coinbase_tx = add_witness_commitment(mtx, self.wtxid_tree.root)
+        self.txid_tree.update(0, bytes.fromhex(coinbase_txid)[::-1])
+        block_header = construct_block_header(VERSION, PREVIOUS_BLOCK, self.txid_tree.root, int(time.time()) + 50,
+                                              BITS, TARGET, workers)
+        txids = [coinbase_txid] + [record.txid for record in self.records]
+        return '\n'.join([block_header, coinbase_tx] + txids) + '\n'
+
+class MiningService:
+    """
+    Watches the mempool folder and keeps out.txt holding a block mined from its best transactions.
+    """
+
+    def __init__(self, folder_path, out_path, address, workers=1, poll_interval=1.0, shard_size=64, cache=None):
+        """
+        :param folder_path: The mempool folder.
+        :param out_path: The path of the out.txt file to keep up to date.
+        :param address: The address receiving the block reward.
+        :param workers: The number of worker processes validating transactions and searching nonces.
+        :param poll_interval: The seconds between two polls of the folder.
+        :param shard_size: The number of transaction files handed to a worker at once.
+        :param cache: An optional ValidationCache consulted before verifying signatures and updated afterwards.
+        """
+        self.folder_path = Path(folder_path)
+        self.out_path = Path(out_path)
+        self.address = address
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.shard_size = shard_size
+        self.cache = cache
+        self.template = IncrementalTemplate()
+        self.files = set()
+        self.records_by_file = {}
+        self.folder_mtime = None
+        #files that couldn't be read yet; completing a file doesn't change the folder's mtime, so they are
+        #rescanned on every poll until they are read
+        self.failed = set()
+
+    async def validate(self, executor, names):
+        """
+        Validates new transaction files on the process pool.
+        A file that can't be read (it may still be being written) fails its whole shard, so the files of a
+        failed shard are validated again one at a time; the ones that still fail are retried on the next poll.
+
+        :param executor: The validation process pool.
+        :param names: A sorted list of new file names.
+        :return: A tuple of the valid records, the names of the files that were read, the txids they hold
+                 and the names of the files that couldn't be read.
+        """
+        loop = asyncio.get_running_loop()
+
+        async def validate_shards(shards):
+            outcomes = await asyncio.gather(*(loop.run_in_executor(executor, validate_files, [self.folder_path / name for name in shard])
+                                              for shard in shards), return_exceptions=True)
+            return list(zip(shards, outcomes))
+
+        results = await validate_shards([names[i:i + self.shard_size] for i in range(0, len(names), self.shard_size)])
+        retried = [[name] for shard, outcome in results if isinstance(outcome, Exception) and len(shard) > 1 for name in shard]
+        if retried:
+            results += await validate_shards(retried)
+        valid_records = []
+        read = []
+        txids = []
+        failed = []
+        for shard, outcome in results:
+            if isinstance(outcome, Exception):
+                if len(shard) == 1:
+                    print(f"could not validate {shard[0]}, retrying on the next poll: {outcome}")
+                    failed.extend(shard)
+                continue
+            shard_valid, new_results, hits, shard_txids = outcome
+            valid_records.extend(shard_valid)
+            read.extend(shard)
+            txids.extend(shard_txids)
+            if self.cache is not None:
+                self.cache.update(new_results, hits)
+        return valid_records, read, txids, failed
+
+    async def refresh(self, executor):
+        """
+        Applies the changes of the mempool folder since the last poll to the template.
+
+        :param executor: The validation process pool.
+        :return: True if the template changed.
+        """
+        folder_mtime = os.stat(self.folder_path).st_mtime_ns
+        if folder_mtime == self.folder_mtime and not self.failed:
+            return False
+        self.folder_mtime = folder_mtime
+        files = scan_folder(self.folder_path)
+        added = sorted(files - self.files)
+        removed = self.files - files
+        if not added and not removed:
+            #failed files are always new, so none is left
+            self.failed = set()
+            return False
+        start = time.perf_counter()
+        template = self.template
+        valid_records, read, txids, failed = await self.validate(executor, added)
+        self.failed = set(failed)
+        if not read and not removed:
+            return False
+        self.files = (self.files - removed) | set(read)
+        #transaction files are named after their txid, files that aren't transactions (mempool.json) hold none
+        template.mempool_txids = (template.mempool_txids - {Path(name).stem for name in removed}) | set(txids)
+        for name in removed:
+            record = self.records_by_file.pop(name, None)
+            if record is not None:
+                del template.pool[record.txid]
+        for record in valid_records:
+            template.pool[record.txid] = record
+            self.records_by_file[f"{record.txid}.json"] = record
+        first_load = not template.records
+        #a parent arriving after its child was selected must go before it (or take it out of the block if invalid)
+        late_parent = not template.selected_parents.isdisjoint(txids)
+        if removed or first_load or late_parent or any(template.conflicts(record) for record in valid_records):
+            await asyncio.to_thread(template.rebuild)
+            summary = "full rebuild"
+        else:
+            added_count = 0
+            evicted_count = 0
+            for record in valid_records:
+                evicted = template.add(record)
+                if evicted is not None:
+                    added_count += 1
+                    evicted_count += evicted
+            summary = f"{added_count} added, {evicted_count} evicted"
+        print(f"{len(read)} new and {len(removed)} removed files, template of {len(template.records)} transactions "
+              f"refreshed in {1000 * (time.perf_counter() - start):.1f}ms ({summary})")
+        return True
+
+    async def publish(self):
+        """
+        Mines a block from the current template and writes it over out.txt.
+        """
+        block = await asyncio.to_thread(self.template.assemble, self.address, self.workers)
+        write_atomically(self.out_path, block)
+        print(f"{self.out_path} updated with {len(self.template.records)} transactions")
+
+    async def run(self):
+        """
+        Polls the folder forever, publishing a new block whenever the template changes.
+        """
+        known_results = self.cache.load() if self.cache is not None else {}
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=init_validation_worker,
+                                 initargs=(known_results, None, True)) as executor:
+            while True:
+                if await self.refresh(executor):
+                    await self.publish()
+                await asyncio.sleep(self.poll_interval)
+
+def main():
+    root = Path(__file__).parent.parent
+    folder_path = sys.argv[1] if len(sys.argv) > 1 else root / "mempool"
+    out_path = sys.argv[2] if len(sys.argv) > 2 else root / "out.txt"
+    poll_interval = float(sys.argv[3]) if len(sys.argv) > 3 else 1.0
+    workers = int(os.environ.get("MINER_WORKERS", os.cpu_count() or 1))
+    address = get_payout_address("mywallet")
+    cache = ValidationCache(os.environ.get("MINER_CACHE", Path(__file__).parent / "validation-cache.sqlite3"),
+                            rules_version=VALIDATION_RULES_VERSION)
+    service = MiningService(folder_path, out_path, address, workers, poll_interval, cache=cache)
+    try:
+        asyncio.run(service.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cache.close()
+
+if __name__ == "__main__":
+    main()
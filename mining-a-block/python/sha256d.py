@@ -0,0 +1,174 @@
+"""
+Double SHA-256 of many fixed-size messages at once.
+
+Two shapes of message matter to the miner: 64-byte Merkle node pairs (hash_pairs) and 80-byte block
+headers that only differ by their nonce (search_nonces, which starts every lane from the midstate of
+the first 64 bytes). With the numpy backend every message is a lane of uint32 arrays and the 64 rounds
+of a SHA-256 compression run once for all lanes, so the Python overhead is paid per batch instead of
+per message. The hashlib backend hashes one message at a time in a tight loop.
+
+hashlib is the default: OpenSSL's SHA-256 uses the CPU's SHA extensions where there are some, and
+numpy lanes only about match it on nonces and are half as fast on Merkle pairs. MINER_SHA256D=numpy
+selects the lanes, which can win on CPUs without SHA extensions.
+"""
+import hashlib
+import os
+import struct
+
+#imported by set_backend, as it takes a while and only the numpy backend needs it
+numpy = None
+
+K = (0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+     0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+     0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+     0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+     0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+     0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+     0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+     0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2)
+INITIAL_STATE = (0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19)
+MASK = 0xffffffff
+#lanes hashed per numpy call, large enough to amortize the Python overhead and small enough to stay in cache
+BATCH_SIZE = 1 << 15
+#below this many messages hashlib is faster than setting up the lanes
+MIN_BATCH = 256
+SHA256D_BACKENDS = ("hashlib", "numpy")
+backend = "hashlib"
+
+def set_backend(name):
+    """
+    Selects the backend hashing batches of messages.
+
+    :param name: One of SHA256D_BACKENDS.
+    :return: The backend in use, hashlib when numpy isn't installed.
+    """
+    global backend, numpy
+    if name not in SHA256D_BACKENDS:
+        raise ValueError(f"unknown backend {name}, expected one of {SHA256D_BACKENDS}")
+    if name == "numpy" and numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            name = "hashlib"
+    backend = name
+    return backend
+
+def rotr(x, n):
+    return (x >> n | x << (32 - n)) & MASK
+
+def compress_scalar(state, block):
+    """
+    Runs the SHA-256 compression function on one block, in pure Python.
+    Only used for midstates, which hashlib doesn't expose.
+
+    :param state: The eight state words.
+    :param block: A 64-byte block.
+    :return: The new state words.
+    """
+    w = list(struct.unpack('>16I', block))
+    for i in range(16, 64):
+        s0 = rotr(w[i - 15], 7) ^ rotr(w[i - 15], 18) ^ w[i - 15] >> 3
+        s1 = rotr(w[i - 2], 17) ^ rotr(w[i - 2], 19) ^ w[i - 2] >> 10
+        w.append((w[i - 16] + s0 + w[i - 7] + s1) & MASK)
+    a, b, c, d, e, f, g, h = state
+    for i in range(64):
+        t1 = (h + (rotr(e, 6) ^ rotr(e, 11) ^ rotr(e, 25)) + (e & f ^ ~e & g) + K[i] + w[i]) & MASK
+        t2 = ((rotr(a, 2) ^ rotr(a, 13) ^ rotr(a, 22)) + (a & b ^ a & c ^ b & c)) & MASK
+        a, b, c, d, e, f, g, h = (t1 + t2) & MASK, a, b, c, (d + t1) & MASK, e, f, g
+    return tuple((x + y) & MASK for x, y in zip(state, (a, b, c, d, e, f, g, h)))
+
+def compress_lanes(state, words):
+    """
+    Runs the SHA-256 compression function on one block per lane.
+
+    :param state: The eight state words, each a uint32 array of the lanes or a number shared by all lanes.
+    :param words: The sixteen message words, each a uint32 array of the lanes or a number shared by all lanes.
+    :return: The list of the eight new state words as uint32 arrays.
+    """
+    uint32 = numpy.uint32
+    w = [numpy.asarray(word, dtype=uint32) for word in words]
+    #words shared by all lanes are 0-d arrays, whose additions warn when they wrap around
+    with numpy.errstate(over='ignore'):
+        for i in range(16, 64):
+            x, y = w[i - 15], w[i - 2]
+            s0 = (x >> 7 | x << 25) ^ (x >> 18 | x << 14) ^ x >> 3
+            s1 = (y >> 17 | y << 15) ^ (y >> 19 | y << 13) ^ y >> 10
+            w.append(w[i - 16] + s0 + w[i - 7] + s1)
+        a, b, c, d, e, f, g, h = (numpy.asarray(word, dtype=uint32) for word in state)
+        for i in range(64):
+            t1 = h + ((e >> 6 | e << 26) ^ (e >> 11 | e << 21) ^ (e >> 25 | e << 7)) + (e & f ^ ~e & g) + uint32(K[i]) + w[i]
+            t2 = ((a >> 2 | a << 30) ^ (a >> 13 | a << 19) ^ (a >> 22 | a << 10)) + (a & b ^ a & c ^ b & c)
+            a, b, c, d, e, f, g, h = t1 + t2, a, b, c, d + t1, e, f, g
+        return [numpy.asarray(x, dtype=uint32) + y for x, y in zip(state, (a, b, c, d, e, f, g, h))]
+
+def hash_digests_lanes(state):
+    """
+    Hashes the 32-byte digests given by their state words once more.
+
+    :param state: The eight state words of the first hash, as uint32 arrays.
+    :return: The eight state words of the double hash, as uint32 arrays.
+    """
+    #a 32-byte message is padded with a 1 bit, zeros and its length of 256 bits
+    return compress_lanes(INITIAL_STATE, list(state) + [0x80000000, 0, 0, 0, 0, 0, 0, 256])
+
+def to_bytes(state):
+    """
+    :param state: The eight state words of the lanes, as uint32 arrays.
+    :return: An array of one 32-byte digest per lane.
+    """
+    return numpy.stack(state, axis=1).astype('>u4').view(numpy.uint8).reshape(-1, 32)
+
+def hash_pairs(pairs):
+    """
+    Computes the double SHA-256 of 64-byte messages, e.g. the concatenated children of Merkle nodes.
+
+    :param pairs: A bytes object of the messages one after another.
+    :return: A list of the 32-byte digests.
+    """
+    count = len(pairs) // 64
+    if backend != "numpy" or count < MIN_BATCH:
+        sha256 = hashlib.sha256
+        return [sha256(sha256(pairs[i:i + 64]).digest()).digest() for i in range(0, len(pairs), 64)]
+    digests = []
+    for start in range(0, count, BATCH_SIZE):
+        words = numpy.frombuffer(pairs, dtype='>u4', count=16 * min(BATCH_SIZE, count - start),
+                                 offset=64 * start).reshape(-1, 16).astype(numpy.uint32)
+        state = compress_lanes(INITIAL_STATE, list(words.T))
+        #the second block of a 64-byte message is all padding: a 1 bit, zeros and its length of 512 bits
+        state = compress_lanes(state, [0x80000000] + [0] * 14 + [512])
+        digest_bytes = to_bytes(hash_digests_lanes(state)).tobytes()
+        digests.extend(digest_bytes[i:i + 32] for i in range(0, len(digest_bytes), 32))
+    return digests
+
+def search_nonces(header_prefix, start, count, target_bytes):
+    """
+    Searches a range of nonces for a block header hash below the target, in batches of lanes
+    starting from the midstate of the first 64 bytes of the header. Needs the numpy backend.
+
+    :param header_prefix: The first 76 bytes of the block header (everything but the nonce).
+    :param start: The first nonce to try.
+    :param count: The number of nonces to try.
+    :param target_bytes: The target as 32 big-endian bytes.
+    :return: A tuple of the first nonce that meets the target (None if there is none) and the number of hashes computed,
+             which counts every lane of the batch the nonce was found in.
+    """
+    midstate = compress_scalar(INITIAL_STATE, header_prefix[:64])
+    tail = struct.unpack('>3I', header_prefix[64:76])
+    #the hash is compared in reverse byte order, so its last word decides first; lanes whose byte swapped
+    #last word exceeds the target's first word can't meet it, the others are checked exactly
+    target_word = int.from_bytes(target_bytes[:4], 'big')
+    for batch_start in range(start, start + count, BATCH_SIZE):
+        batch_end = min(batch_start + BATCH_SIZE, start + count)
+        nonces = numpy.arange(batch_start, batch_end, dtype=numpy.uint64)
+        nonces = nonces.astype(numpy.uint32).byteswap()
+        #an 80-byte header ends with the nonce, a 1 bit, zeros and its length of 640 bits
+        state = compress_lanes(midstate, list(tail) + [nonces, 0x80000000] + [0] * 10 + [640])
+        last_word = hash_digests_lanes(state)[7].byteswap()
+        for lane in numpy.flatnonzero(last_word <= target_word):
+            nonce = batch_start + int(lane)
+            header = header_prefix + nonce.to_bytes(4, byteorder='little')
+            if hashlib.sha256(hashlib.sha256(header).digest()).digest()[::-1] < target_bytes:
+                return nonce, batch_end - start
+    return None, count
+
+set_backend(os.environ.get("MINER_SHA256D", "hashlib"))
@@ -0,0 +1,187 @@
+import hashlib
+from functools import cached_property
+from txparser import serialize_varint
+
+SIGHASH_DEFAULT = 0x00
+SIGHASH_ALL = 0x01
+SIGHASH_NONE = 0x02
+SIGHASH_SINGLE = 0x03
+SIGHASH_ANYONECANPAY = 0x80
+
+def sha256(data):
+    """
+    Computes the SHA-256 hash of the given bytes object.
+
+    :param data: A bytes-like object
+    :return: The SHA-256 hash as a bytes object
+    """
+    return hashlib.sha256(data).digest()
+
+def tagged_hash(tag, data):
+    """
+    Computes a BIP340 tagged hash.
+
+    :param tag: The tag as a string.
+    :param data: The message as a bytes object.
+    :return: SHA-256(SHA-256(tag) || SHA-256(tag) || data) as a bytes object.
+    """
+    tag_hash = sha256(tag.encode())
+    return sha256(tag_hash + tag_hash + data)
+
+def p2wpkh_script_code(pubkey_hash):
+    """
+    Builds the BIP143 scriptCode of a P2WPKH input.
+
+    :param pubkey_hash: The 20-byte public key hash of the witness program.
+    :return: The length-prefixed P2PKH script as bytes.
+    """
+    return b'\x19\x76\xa9\x14' + pubkey_hash + b'\x88\xac'
+
+class SighashCache:
+    """
+    Computes the signature hashes of every input of a transaction.
+    The hashes of all prevouts, sequences, amounts, scriptPubKeys and outputs (BIP143 for segwit v0,
+    BIP341 for taproot) are the same for every input signing with SIGHASH_ALL, so each one is computed
+    on first use and reused: signing or verifying all N inputs of a transaction is linear in N instead of quadratic.
+    """
+
+    def __init__(self, raw, tx, prevouts):
+        """
+        :param raw: The serialized transaction.
+        :param tx: The ParsedTransaction of raw.
+        :param prevouts: A list of (value in satoshis, scriptPubKey bytes) of the outputs spent by each input.
+        """
+        self.view = memoryview(raw)
+        self.tx = tx
+        self.prevouts = prevouts
+
+    def outpoint(self, index):
+        """
+        :param index: The position of the input.
+        :return: The 36-byte outpoint spent by the input.
+        """
+        start = self.tx.inputs[index][0]
+        return self.view[start:start + 36]
+
+    def sequence(self, index):
+        """
+        :param index: The position of the input.
+        :return: The 4-byte sequence of the input.
+        """
+        start, length = self.tx.inputs[index]
+        return self.view[start + length - 4:start + length]
+
+    def output(self, index):
+        """
+        :param index: The position of the output.
+        :return: The serialized output.
+        """
+        start, length = self.tx.outputs[index]
+        return self.view[start:start + length]
+
+    @cached_property
+    def serialized_prevouts(self):
+        return b''.join(self.outpoint(index) for index in range(len(self.tx.inputs)))
+
+    @cached_property
+    def serialized_sequences(self):
+        return b''.join(self.sequence(index) for index in range(len(self.tx.inputs)))
+
+    @cached_property
+    def serialized_outputs(self):
+        #outputs are serialized back to back, so they are a single slice of the transaction
+        if not self.tx.outputs:
+            return b''
+        start = self.tx.outputs[0][0]
+        end = self.tx.outputs[-1][0] + self.tx.outputs[-1][1]
+        return self.view[start:end]
+
+    @cached_property
+    def hash_prevouts(self):
+        return sha256(self.sha_prevouts)
+
+    @cached_property
+    def hash_sequence(self):
+        return sha256(self.sha_sequences)
+
+    @cached_property
+    def hash_outputs(self):
+        return sha256(self.sha_outputs)
+
+    @cached_property
+    def sha_prevouts(self):
+        return sha256(self.serialized_prevouts)
+
+    @cached_property
+    def sha_sequences(self):
+        return sha256(self.serialized_sequences)
+
+    @cached_property
+    def sha_outputs(self):
+        return sha256(self.serialized_outputs)
+
+    @cached_property
+    def sha_amounts(self):
+        return sha256(b''.join(value.to_bytes(8, 'little') for value, _ in self.prevouts))
+
+    @cached_property
+    def sha_scriptpubkeys(self):
+        return sha256(b''.join(serialize_varint(len(script)) + script for _, script in self.prevouts))
+
+    def segwit_v0(self, index, script_code, amount, hashtype=SIGHASH_ALL):
+        """
+        Computes the BIP143 signature hash of a segwit v0 input.
+
+        :param index: The position of the input.
+        :param script_code: The length-prefixed scriptCode (the witness script, or the P2PKH script for P2WPKH).
+        :param amount: The value of the spent output in satoshis.
+        :param hashtype: The sighash type.
+        :return: The signature hash as a bytes object.
+        """
+        anyone_can_pay = hashtype & SIGHASH_ANYONECANPAY
+        base_type = hashtype & 0x1f
+        zero = bytes(32)
+        hash_prevouts = zero if anyone_can_pay else self.hash_prevouts
+        hash_sequence = zero if anyone_can_pay or base_type in (SIGHASH_NONE, SIGHASH_SINGLE) else self.hash_sequence
+        if base_type not in (SIGHASH_NONE, SIGHASH_SINGLE):
+            hash_outputs = self.hash_outputs
+        elif base_type == SIGHASH_SINGLE and index < len(self.tx.outputs):
+            hash_outputs = sha256(sha256(self.output(index)))
+        else:
+            hash_outputs = zero
+        preimage = b''.join([
+            self.tx.version.to_bytes(4, 'little'), hash_prevouts, hash_sequence, self.outpoint(index),
+            script_code, amount.to_bytes(8, 'little'), self.sequence(index), hash_outputs,
+            self.tx.locktime.to_bytes(4, 'little'), hashtype.to_bytes(4, 'little')])
+        return sha256(sha256(preimage))
+
+    def taproot_key_path(self, index, hashtype=SIGHASH_DEFAULT, annex=None):
+        """
+        Computes the BIP341 signature hash of a taproot key path input.
+
+        :param index: The position of the input.
+        :param hashtype: The sighash type, SIGHASH_DEFAULT for a 64-byte signature.
+        :param annex: The annex of the input's witness (including its 0x50 prefix), if it has one.
+        :return: The signature hash as a bytes object.
+        """
+        anyone_can_pay = hashtype & SIGHASH_ANYONECANPAY
+        output_type = hashtype & 0x03 if hashtype != SIGHASH_DEFAULT else SIGHASH_ALL
+        parts = [b'\x00', bytes([hashtype]), self.tx.version.to_bytes(4, 'little'), self.tx.locktime.to_bytes(4, 'little')]
+        if not anyone_can_pay:
+            parts += [self.sha_prevouts, self.sha_amounts, self.sha_scriptpubkeys, self.sha_sequences]
+        if output_type not in (SIGHASH_NONE, SIGHASH_SINGLE):
+            parts.append(self.sha_outputs)
+        parts.append(bytes([1 if annex is not None else 0]))
+        if anyone_can_pay:
+            value, script = self.prevouts[index]
+            parts += [self.outpoint(index), value.to_bytes(8, 'little'), serialize_varint(len(script)) + script,
+                      self.sequence(index)]
+        else:
+            parts.append(index.to_bytes(4, 'little'))
+        if annex is not None:
+            parts.append(sha256(serialize_varint(len(annex)) + annex))
+        if output_type == SIGHASH_SINGLE:
+            if index >= len(self.tx.outputs):
+                raise ValueError("SIGHASH_SINGLE without a matching output")
+            parts.append(sha256(self.output(index)))
+        return tagged_hash("TapSighash", b''.join(parts))
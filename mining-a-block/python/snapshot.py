@@ -0,0 +1,204 @@
+"""
+Compiles the mempool folder into a single indexed binary snapshot and reads it back through mmap.
+
+Layout (little-endian, every section starts on an 8 byte boundary):
+    header          magic (8 bytes), number of transactions n (uint32), number of parent txids p (uint32),
+                    size of the prevouts section (uint64)
+    txid index      n * 32 bytes, txids in display byte order, sorted
+    wtxid column    n * 32 bytes
+    fee column      n * uint64
+    weight column   n * uint32
+    parent offsets  (n + 1) * uint32, the parents of transaction i are parents[offsets[i]:offsets[i + 1]]
+    parents         p * 32 bytes
+    prevout offsets (n + 1) * uint64, the prevouts of transaction i are prevouts[offsets[i]:offsets[i + 1]]
+    raw offsets     (n + 1) * uint64, transaction i is raw[offsets[i]:offsets[i + 1]]
+    prevouts        the serialized prevouts of every transaction back to back
+    raw             the serialized transactions back to back
+
+Usage: python snapshot.py <mempool folder> <snapshot file>
+"""
+import mmap
+import struct
+import sys
+from bisect import bisect_left
+from pathlib import Path
+from mempool_loader import TransactionRecord, iter_transaction_records
+
+MAGIC = b'MPSNAP02'
+HEADER = struct.Struct('<8sIIQ')
+
+def align(offset):
+    """
+    Rounds an offset up to the next multiple of 8.
+
+    :param offset: The offset in bytes.
+    :return: The aligned offset.
+    """
+    return (offset + 7) & ~7
+
+def section_offsets(count, parent_count, prevouts_size):
+    """
+    Computes where each section of a snapshot starts.
+
+    :param count: The number of transactions.
+    :param parent_count: The total number of parent txids.
+    :param prevouts_size: The size of the prevouts section in bytes.
+    :return: A dictionary mapping each section name to its offset, plus the 'raw' section offset.
+    """
+    sizes = [('txids', 32 * count), ('wtxids', 32 * count), ('fees', 8 * count), ('weights', 4 * count),
+             ('parent_offsets', 4 * (count + 1)), ('parents', 32 * parent_count), ('prevout_offsets', 8 * (count + 1)),
+             ('raw_offsets', 8 * (count + 1)), ('prevouts', prevouts_size)]
+    offsets = {}
+    offset = align(HEADER.size)
+    for name, size in sizes:
+        offsets[name] = offset
+        offset = align(offset + size)
+    offsets['raw'] = offset
+    return offsets
+
+def compile_snapshot(folder_path, snapshot_path):
+    """
+    Reads every transaction file of the mempool folder and writes them into one snapshot file.
+
+    :param folder_path: The folder path to where the transaction files are located.
+    :param snapshot_path: The path of the snapshot file to write.
+    :return: The number of transactions written.
+    """
+    records = sorted(iter_transaction_records(sorted(Path(folder_path).iterdir())), key=lambda record: record.txid)
+    count = len(records)
+    parent_count = sum(len(record.parents) for record in records)
+    raw_offsets = [0]
+    parent_offsets = [0]
+    prevout_offsets = [0]
+    for record in records:
+        raw_offsets.append(raw_offsets[-1] + len(record.raw))
+        parent_offsets.append(parent_offsets[-1] + len(record.parents))
+        prevout_offsets.append(prevout_offsets[-1] + len(record.prevouts))
+    offsets = section_offsets(count, parent_count, prevout_offsets[-1])
+    columns = {
+        'txids': b''.join(bytes.fromhex(record.txid) for record in records),
+        'wtxids': b''.join(bytes.fromhex(record.wtxid) for record in records),
+        'fees': struct.pack(f'<{count}Q', *(record.fee for record in records)),
+        'weights': struct.pack(f'<{count}I', *(record.weight for record in records)),
+        'parent_offsets': struct.pack(f'<{count + 1}I', *parent_offsets),
+        'parents': b''.join(bytes.fromhex(parent) for record in records for parent in record.parents),
+        'prevout_offsets': struct.pack(f'<{count + 1}Q', *prevout_offsets),
+        'raw_offsets': struct.pack(f'<{count + 1}Q', *raw_offsets),
+        'prevouts': b''.join(record.prevouts for record in records),
+    }
+    with open(snapshot_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, count, parent_count, prevout_offsets[-1]))
+        for name, data in columns.items():
+            file.write(b'\x00' * (offsets[name] - file.tell()))
+            file.write(data)
+        file.write(b'\x00' * (offsets['raw'] - file.tell()))
+        for record in records:
+            file.write(record.raw)
+    return count
+
+class MempoolSnapshot:
+    """
+    Read-only access to a mempool snapshot through mmap.
+    Columns are memoryviews over the mapping and raw transactions are returned as
+    memoryview slices, so nothing is copied or parsed when the snapshot is opened.
+    """
+
+    def __init__(self, path):
+        """
+        Maps a snapshot file into memory.
+
+        :param path: The path to the snapshot file.
+        """
+        self.path = str(path)
+        with open(path, 'rb') as file:
+            self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, parent_count, prevouts_size = HEADER.unpack_from(self.mapping, 0)
+        if magic != MAGIC:
+            self.mapping.close()
+            raise ValueError(f"{path} is not a mempool snapshot of this version, recompile it with snapshot.py")
+        self.count = count
+        offsets = section_offsets(count, parent_count, prevouts_size)
+        self.view = memoryview(self.mapping)
+        self.txid_index = self.view[offsets['txids']:offsets['txids'] + 32 * count]
+        self.wtxids = self.view[offsets['wtxids']:offsets['wtxids'] + 32 * count]
+        self.fees = self.view[offsets['fees']:offsets['fees'] + 8 * count].cast('Q')
+        self.weights = self.view[offsets['weights']:offsets['weights'] + 4 * count].cast('I')
+        self.raw_offsets = self.view[offsets['raw_offsets']:offsets['raw_offsets'] + 8 * (count + 1)].cast('Q')
+        self.parent_offsets = self.view[offsets['parent_offsets']:offsets['parent_offsets'] + 4 * (count + 1)].cast('I')
+        self.parents = self.view[offsets['parents']:offsets['parents'] + 32 * parent_count]
+        self.prevout_offsets = self.view[offsets['prevout_offsets']:offsets['prevout_offsets'] + 8 * (count + 1)].cast('Q')
+        self.prevouts = self.view[offsets['prevouts']:offsets['prevouts'] + prevouts_size]
+        self.raw = self.view[offsets['raw']:]
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def txid(self, index):
+        """
+        :param index: The position of the transaction in the snapshot.
+        :return: The txid in hexadecimal format.
+        """
+        return self.txid_index[32 * index:32 * index + 32].hex()
+
+    def txids(self):
+        """
+        :return: A list of every txid of the snapshot in hexadecimal format, sorted.
+        """
+        return [self.txid(index) for index in range(self.count)]
+
+    def raw_transaction(self, index):
+        """
+        :param index: The position of the transaction in the snapshot.
+        :return: The serialized transaction as a memoryview over the mapping.
+        """
+        return self.raw[self.raw_offsets[index]:self.raw_offsets[index + 1]]
+
+    def find(self, txid):
+        """
+        Looks a transaction up by binary search on the txid index.
+
+        :param txid: The transaction ID in hexadecimal format.
+        :return: The position of the transaction, or None if it isn't in the snapshot.
+        """
+        key = bytes.fromhex(txid)
+        index = bisect_left(range(self.count), key, key=lambda i: bytes(self.txid_index[32 * i:32 * i + 32]))
+        if index < self.count and self.txid_index[32 * index:32 * index + 32] == key:
+            return index
+        return None
+
+    def record(self, index):
+        """
+        Builds the compact record of a transaction, with its raw bytes and prevouts left in the mapping.
+
+        :param index: The position of the transaction in the snapshot.
+        :return: A TransactionRecord.
+        """
+        first, last = self.parent_offsets[index], self.parent_offsets[index + 1]
+        parents = tuple(self.parents[32 * i:32 * i + 32].hex() for i in range(first, last))
+        prevouts = self.prevouts[self.prevout_offsets[index]:self.prevout_offsets[index + 1]]
+        return TransactionRecord(self.txid(index), self.wtxids[32 * index:32 * index + 32].hex(),
+                                 self.fees[index], self.weights[index], self.raw_transaction(index), parents, prevouts)
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self.record(index)
+
+    def close(self):
+        """
+        Releases the column views and unmaps the file.
+        Records handed out keep a view on the mapping, so they must be dropped before closing.
+        """
+        for name in ('txid_index', 'wtxids', 'fees', 'weights', 'raw_offsets', 'parent_offsets', 'parents', 'prevout_offsets', 'prevouts', 'raw',
+                     'view'):
+            getattr(self, name).release()
+        self.mapping.close()
+
+if __name__ == "__main__":
+    written = compile_snapshot(sys.argv[1], sys.argv[2])
+    print(f"{written} transactions written to {sys.argv[2]}")
@@ -0,0 +1,443 @@
+"""
+A local work server that hands out block templates to external hashers, in the spirit of stratum v1.
+
+The server validates the mempool once, selects the block's transactions and sends every connected hasher
+a job: the previous block hash, the coinbase split around its extranonce, the Merkle branch from the coinbase
+to the root, the version, the bits and the time. Each connection gets its own extranonce1 and picks its own
+extranonce2, so hashers never search the same headers. Submitted shares are checked against the share
+target; the first one that also meets the block target is assembled into out.txt, which ends the run.
+
+Messages are JSON objects, one per line:
+    -> {"id": 1, "method": "mining.subscribe", "params": []}
+    <- {"id": 1, "result": [[["mining.notify", "<subscription>"]], "<extranonce1>", 4], "error": null}
+    -> {"id": 2, "method": "mining.authorize", "params": ["<worker>", "<password>"]}
+    <- {"id": null, "method": "mining.set_target", "params": ["<share target>"]}
+    <- {"id": null, "method": "mining.notify",
+        "params": ["<job id>", "<previous block>", "<coinbase 1>", "<coinbase 2>", ["<branch hash>", ...],
+                   "<version>", "<bits>", "<time>", true]}
+    -> {"id": 3, "method": "mining.submit", "params": ["<worker>", "<job id>", "<extranonce2>", "<time>", "<nonce>"]}
+Bytes are hex encoded. Unlike stratum v1, the previous block hash is in display order and the Merkle branch
+hashes are in internal byte order, as they are hashed. Version, bits, time and nonce are big-endian hex
+numbers. The coinbase halves are its serialization without witness.
+
+Usage:
+    python stratum.py serve [mempool folder] [out.txt path] [port]    serves jobs until a block is found
+    python stratum.py mine [host] [port] [processes]                  hashes jobs from a server
+    python stratum.py local [mempool folder] [out.txt path] [clients] runs a server and clients in one process
+"""
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from merkle import merkle_root_from_branch
+from outpoint_index import select_consistent_transactions
+from service import IncrementalTemplate, write_atomically, BLOCK_HEIGHT, VERSION, PREVIOUS_BLOCK, BITS, TARGET
+from validation_cache import ValidationCache
+from main import (hash256, get_payout_address, get_valid_transactions, calculate_subsidy, create_coinbase_transaction,
+                  add_witness_commitment, search_nonce_range, nonce_chunks, VALIDATION_RULES_VERSION)
+
+DEFAULT_PORT = 3333
+EXTRANONCE1_SIZE = 4
+EXTRANONCE2_SIZE = 4
+#shares are 16 times easier than blocks, so hashers report their progress before the block is found
+SHARE_TARGET = "000ffff000000000000000000000000000000000000000000000000000000000"
+#how far a hasher may roll the time of a job forward, in seconds
+MAX_TIME_ROLL = 7200
+#nonces searched by a hasher process at once
+NONCE_CHUNK = 1 << 16
+
+Job = namedtuple('Job', ['job_id', 'previous_block', 'coinbase1', 'coinbase2', 'branch', 'version', 'bits', 'time'])
+
+def make_job(job_id, template, address):
+    """
+    Splits the coinbase of a template around its extranonce and extracts the Merkle branch of the coinbase.
+    Neither depends on the coinbase itself: its witness commitment only covers the other transactions.
+
+    :param job_id: The job ID.
+    :param template: An IncrementalTemplate holding the block's transactions.
+    :param address: The address receiving the block reward.
+    :return: A Job.
+    """
+    extranonce = bytes(EXTRANONCE1_SIZE + EXTRANONCE2_SIZE)
+    mtx, _ = create_coinbase_transaction(BLOCK_HEIGHT, template.fees + calculate_subsidy(BLOCK_HEIGHT), address, extranonce)
+    add_witness_commitment(mtx, template.wtxid_tree.root)
+    raw = mtx.serialize(params={'include_witness': False})
+    #version, input count, outpoint and script length come before the scriptSig, which ends with the extranonce
+    end = 4 + 1 + 36 + 1 + len(mtx.vin[0].scriptSig)
+    return Job(job_id, PREVIOUS_BLOCK, raw[:end - len(extranonce)], raw[end:], template.txid_tree.branch(0), VERSION,
+               BITS, int(time.time()) + 50)
+
+def notify_params(job, clean=True):
+    """
+    :param job: A Job.
+    :param clean: Whether hashers should drop the previous jobs.
+    :return: The params of the mining.notify message of the job.
+    """
+    return [job.job_id, job.previous_block, job.coinbase1.hex(), job.coinbase2.hex(), [node.hex() for node in job.branch],
+            f"{job.version:08x}", f"{job.bits:08x}", f"{job.time:08x}", clean]
+
+def job_from_notify(params):
+    """
+    :param params: The params of a mining.notify message.
+    :return: The Job.
+    """
+    job_id, previous_block, coinbase1, coinbase2, branch, version, bits, ntime, _ = params
+    return Job(job_id, previous_block, bytes.fromhex(coinbase1), bytes.fromhex(coinbase2),
+               [bytes.fromhex(node) for node in branch], int(version, 16), int(bits, 16), int(ntime, 16))
+
+def header_prefix(job, extranonce, ntime):
+    """
+    Builds the coinbase of a job for an extranonce and the first 76 bytes of the block header.
+
+    :param job: A Job.
+    :param extranonce: extranonce1 followed by extranonce2 (bytes).
+    :param ntime: The header time.
+    :return: A tuple of the coinbase serialized without witness and the header without its nonce.
+    """
+    coinbase = job.coinbase1 + extranonce + job.coinbase2
+    merkle_root = merkle_root_from_branch(hash256(coinbase), 0, job.branch)
+    prefix = (job.version.to_bytes(4, byteorder='little') + bytes.fromhex(job.previous_block)[::-1] + merkle_root +
+              ntime.to_bytes(4, byteorder='little') + job.bits.to_bytes(4, byteorder='little'))
+    return coinbase, prefix
+
+def add_coinbase_witness(coinbase):
+    """
+    :param coinbase: The coinbase serialized without witness.
+    :return: The coinbase with the segwit marker and its 32 zero bytes witness reserved value.
+    """
+    return coinbase[:4] + b'\x00\x01' + coinbase[4:-4] + b'\x01\x20' + bytes(32) + coinbase[-4:]
+
+class StratumError(Exception):
+    """
+    A request the server refuses, reported to the hasher as [code, message].
+    """
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+class WorkServer:
+    """
+    Serves one block template to any number of hashers until one of them finds the block.
+    """
+
+    def __init__(self, template, address, out_path, share_target=SHARE_TARGET, target=TARGET):
+        """
+        :param template: An IncrementalTemplate holding the block's transactions.
+        :param address: The address receiving the block reward.
+        :param out_path: Where the block is written once found.
+        :param share_target: The target a share must meet, as a hexadecimal string.
+        :param target: The block target, as a hexadecimal string.
+        """
+        self.template = template
+        self.address = address
+        self.out_path = Path(out_path)
+        self.share_target = share_target
+        self.target_bytes = bytes.fromhex(target)
+        self.share_target_bytes = bytes.fromhex(share_target)
+        self.extranonces = itertools.count(1)
+        self.job_ids = itertools.count(1)
+        self.jobs = {}
+        self.job = None
+        self.writers = set()
+        self.handlers = set()
+        self.seen_shares = set()
+        self.shares = {}
+        self.block = None
+        self.found = asyncio.Event()
+        self.start = time.perf_counter()
+        self.new_job()
+
+    def new_job(self):
+        """
+        Makes a job of the current template, replacing the previous ones.
+
+        :return: The Job.
+        """
+        self.job = make_job(f"{next(self.job_ids):x}", self.template, self.address)
+        self.jobs = {self.job.job_id: self.job}
+        return self.job
+
+    def check_share(self, extranonce1, params):
+        """
+        Checks a submitted share and assembles the block when it meets the block target.
+
+        :param extranonce1: The extranonce1 of the connection (bytes).
+        :param params: The params of the mining.submit message.
+        :return: True if the share is accepted.
+        """
+        worker, job_id, extranonce2, ntime, nonce = params
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise StratumError(21, "stale job")
+        if len(extranonce2) != 2 * EXTRANONCE2_SIZE or len(nonce) != 8:
+            raise StratumError(20, "malformed share")
+        ntime = int(ntime, 16)
+        if not job.time <= ntime <= job.time + MAX_TIME_ROLL:
+            raise StratumError(20, "time out of range")
+        share = (job_id, extranonce1, extranonce2, ntime, nonce)
+        if share in self.seen_shares:
+            raise StratumError(22, "duplicate share")
+        coinbase, prefix = header_prefix(job, extranonce1 + bytes.fromhex(extranonce2), ntime)
+        header = prefix + int(nonce, 16).to_bytes(4, byteorder='little')
+        block_hash = hash256(header)[::-1]
+        if block_hash >= self.share_target_bytes:
+            raise StratumError(23, "low difficulty share")
+        self.seen_shares.add(share)
+        self.shares[worker] = self.shares.get(worker, 0) + 1
+        if block_hash < self.target_bytes and self.block is None:
+            txids = [hash256(coinbase)[::-1].hex()] + [record.txid for record in self.template.records]
+            self.block = '\n'.join([header.hex(), add_coinbase_witness(coinbase).hex()] + txids) + '\n'
+            write_atomically(self.out_path, self.block)
+            self.report(worker, block_hash)
+            self.found.set()
+        return True
+
+    def report(self, worker, block_hash):
+        """
+        Prints the block found and the hash rate of every worker since the server started, estimated from its shares.
+        """
+        elapsed = time.perf_counter() - self.start
+        hashes_per_share = (1 << 256) / (int.from_bytes(self.share_target_bytes, 'big') + 1)
+        print(f"block {block_hash.hex()} found by {worker} after {elapsed:.1f}s, written to {self.out_path}")
+        for name, count in sorted(self.shares.items()):
+            print(f"{name}: {count} shares (~{count * hashes_per_share / elapsed:.0f} H/s)")
+
+    async def handle(self, reader, writer):
+        """
+        Serves the requests of one hasher.
+        """
+        extranonce1 = next(self.extranonces).to_bytes(EXTRANONCE1_SIZE, 'big')
+        self.writers.add(writer)
+        self.handlers.add(asyncio.current_task())
+        try:
+            while not reader.at_eof():
+                line = await reader.readline()
+                if not line.strip():
+                    continue
+                message = json.loads(line)
+                method, params = message.get('method'), message.get('params', [])
+                try:
+                    if method == 'mining.subscribe':
+                        result = [[["mining.notify", extranonce1.hex()]], extranonce1.hex(), EXTRANONCE2_SIZE]
+                    elif method == 'mining.authorize':
+                        #the server is meant for local hashers, any worker name is accepted
+                        result = True
+                    elif method == 'mining.submit':
+                        result = self.check_share(extranonce1, params)
+                    else:
+                        raise StratumError(20, f"unknown method {method}")
+                    await send(writer, {'id': message.get('id'), 'result': result, 'error': None})
+                except (StratumError, ValueError) as error:
+                    await send(writer, {'id': message.get('id'), 'result': None,
+                                        'error': [getattr(error, 'code', 20), str(error)]})
+                    continue
+                if method == 'mining.authorize':
+                    await send(writer, {'id': None, 'method': 'mining.set_target', 'params': [self.share_target]})
+                    await send(writer, {'id': None, 'method': 'mining.notify', 'params': notify_params(self.job)})
+        except (ConnectionError, json.JSONDecodeError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            self.handlers.discard(asyncio.current_task())
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=DEFAULT_PORT, started=None):
+        """
+        Serves jobs until the block is found.
+
+        :param host: The interface to listen on.
+        :param port: The port to listen on, 0 for any free port.
+        :param started: An optional future receiving the port once the server listens.
+        :return: The contents of out.txt.
+        """
+        server = await asyncio.start_server(self.handle, host, port)
+        port = server.sockets[0].getsockname()[1]
+        print(f"serving job {self.job.job_id} with {len(self.template.records)} transactions on {host}:{port}")
+        if started is not None:
+            started.set_result(port)
+        async with server:
+            await self.found.wait()
+            #the server only finishes closing once every connection is closed
+            for writer in list(self.writers):
+                writer.close()
+            await asyncio.gather(*self.handlers, return_exceptions=True)
+        return self.block
+
+async def send(writer, message):
+    """
+    Writes a message as a line of JSON.
+    """
+    writer.write(json.dumps(message).encode() + b'\n')
+    await writer.drain()
+
+async def mine_job(job, extranonce1, target_bytes, submit, executor, processes):
+    """
+    Searches a job for shares, each extranonce2 in turn, keeping a nonce chunk in flight per process.
+    After a share, the rest of its chunk is searched again so no nonce is skipped.
+
+    :param job: A Job.
+    :param extranonce1: The extranonce1 given by the server (bytes).
+    :param target_bytes: The share target as 32 big-endian bytes.
+    :param submit: A coroutine function called with the job ID, extranonce2, time and nonce of each share.
+    :param executor: The process pool searching nonces.
+    :param processes: The number of processes of the pool.
+    """
+    loop = asyncio.get_running_loop()
+
+    def chunks():
+        for extranonce2 in range(1 << 8 * EXTRANONCE2_SIZE):
+            extranonce2 = extranonce2.to_bytes(EXTRANONCE2_SIZE, 'big')
+            _, prefix = header_prefix(job, extranonce1 + extranonce2, job.time)
+            for start, count in nonce_chunks(NONCE_CHUNK):
+                yield extranonce2, prefix, start, count
+
+    def search(extranonce2, prefix, start, count):
+        future = loop.run_in_executor(executor, search_nonce_range, prefix, start, count, target_bytes)
+        pending[future] = (extranonce2, prefix, start, count)
+
+    pending = {}
+    work = chunks()
+    try:
+        while True:
+            while len(pending) < 2 * processes:
+                search(*next(work))
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                extranonce2, prefix, start, count = pending.pop(future)
+                nonce, _ = future.result()
+                if nonce is not None:
+                    await submit(job.job_id, extranonce2, job.time, nonce)
+                    if nonce + 1 < start + count:
+                        search(extranonce2, prefix, nonce + 1, start + count - nonce - 1)
+    finally:
+        for future in pending:
+            future.cancel()
+
+async def run_hasher(host="127.0.0.1", port=DEFAULT_PORT, processes=1, worker="hasher"):
+    """
+    Connects to a work server and mines its jobs until the server closes the connection.
+
+    :param host: The server host.
+    :param port: The server port.
+    :param processes: The number of processes searching nonces.
+    :param worker: The worker name.
+    :return: A tuple of the numbers of accepted and rejected shares.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    message_ids = itertools.count(1)
+    subscribe_id = next(message_ids)
+    await send(writer, {'id': subscribe_id, 'method': 'mining.subscribe', 'params': []})
+    await send(writer, {'id': next(message_ids), 'method': 'mining.authorize', 'params': [worker, ""]})
+    extranonce1 = None
+    target_bytes = None
+    mining = None
+    submitted = set()
+    accepted = rejected = 0
+
+    async def submit(job_id, extranonce2, ntime, nonce):
+        message_id = next(message_ids)
+        submitted.add(message_id)
+        await send(writer, {'id': message_id, 'method': 'mining.submit',
+                            'params': [worker, job_id, extranonce2.hex(), f"{ntime:08x}", f"{nonce:08x}"]})
+
+    #forked workers would inherit the sockets of a server running in the same process and keep its
+    #connections open after it closes them
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as executor:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                method = message.get('method')
+                if message.get('id') == subscribe_id:
+                    extranonce1 = bytes.fromhex(message['result'][1])
+                elif method == 'mining.set_target':
+                    target_bytes = bytes.fromhex(message['params'][0])
+                elif method == 'mining.notify':
+                    if mining is not None:
+                        mining.cancel()
+                    mining = asyncio.create_task(mine_job(job_from_notify(message['params']), extranonce1, target_bytes, submit, executor, processes))
+                elif message.get('id') in submitted:
+                    submitted.discard(message['id'])
+                    if message['result']:
+                        accepted += 1
+                    else:
+                        rejected += 1
+                        print(f"{worker}: share rejected: {message['error']}")
+        except ConnectionError:
+            pass
+        finally:
+            if mining is not None:
+                mining.cancel()
+                await asyncio.gather(mining, return_exceptions=True)
+            writer.close()
+    return accepted, rejected
+
+def load_template(folder_path, workers):
+    """
+    Validates the mempool folder and selects the block's transactions.
+
+    :param folder_path: The mempool folder.
+    :param workers: The number of worker processes validating transactions.
+    :return: An IncrementalTemplate.
+    """
+    cache = ValidationCache(os.environ.get("MINER_CACHE", Path(__file__).parent / "validation-cache.sqlite3"),
+                            rules_version=VALIDATION_RULES_VERSION)
+    try:
+        mempool_txids = set()
+        valid_transactions = get_valid_transactions(Path(folder_path), workers, cache=cache, mempool_txids=mempool_txids)
+    finally:
+        cache.close()
+    template = IncrementalTemplate()
+    template.mempool_txids = mempool_txids
+    template.pool = {record.txid: record for record in select_consistent_transactions(valid_transactions)[0]}
+    template.rebuild()
+    return template
+
+async def run_local(server, clients):
+    """
+    Runs a work server and local hashers, one process each, until the block is found.
+
+    :param server: A WorkServer.
+    :param clients: The number of hashers.
+    :return: The contents of out.txt.
+    """
+    started = asyncio.get_running_loop().create_future()
+    serving = asyncio.create_task(server.serve(port=0, started=started))
+    port = await started
+    hashers = [asyncio.create_task(run_hasher(port=port, worker=f"hasher{i}")) for i in range(clients)]
+    block = await serving
+    await asyncio.gather(*hashers)
+    return block
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else 'local'
+    root = Path(__file__).parent.parent
+    if command == 'mine':
+        host = sys.argv[2] if len(sys.argv) > 2 else "127.0.0.1"
+        port = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_PORT
+        processes = int(sys.argv[4]) if len(sys.argv) > 4 else os.cpu_count() or 1
+        accepted, rejected = asyncio.run(run_hasher(host, port, processes, f"hasher-{os.getpid()}"))
+        print(f"{accepted} shares accepted, {rejected} rejected")
+        return
+    folder_path = sys.argv[2] if len(sys.argv) > 2 else root / "mempool"
+    out_path = sys.argv[3] if len(sys.argv) > 3 else root / "out.txt"
+    workers = int(os.environ.get("MINER_WORKERS", os.cpu_count() or 1))
+    server = WorkServer(load_template(folder_path, workers), get_payout_address("mywallet"), out_path)
+    if command == 'serve':
+        port = int(sys.argv[4]) if len(sys.argv) > 4 else DEFAULT_PORT
+        asyncio.run(server.serve("0.0.0.0", port))
+    else:
+        clients = int(sys.argv[4]) if len(sys.argv) > 4 else os.cpu_count() or 1
+        asyncio.run(run_local(server, clients))
+
+if __name__ == "__main__":
+    main()
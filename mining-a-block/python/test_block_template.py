@@ -0,0 +1,30 @@
+from block_template import build_block_template
+from mempool_loader import TransactionRecord
+
+def record(txid, fee, weight, parents=()):
+    return TransactionRecord(txid, txid, fee, weight, b'', tuple(parents))
+
+def txids(records):
+    return [record.txid for record in records]
+
+def test_transactions_are_taken_by_fee_rate():
+    transactions = [record('a', 100, 400), record('b', 300, 400), record('c', 200, 400)]
+    assert txids(build_block_template(transactions)) == ['b', 'c', 'a']
+
+def test_child_pays_for_its_parent():
+    transactions = [record('parent', 10, 400), record('child', 1000, 400, ['parent']), record('other', 300, 400)]
+    assert txids(build_block_template(transactions)) == ['parent', 'child', 'other']
+
+def test_packages_that_do_not_fit_are_skipped():
+    transactions = [record('big', 1000, 800), record('small', 100, 400), record('smaller', 10, 200)]
+    assert txids(build_block_template(transactions, max_weight=600)) == ['small', 'smaller']
+
+def test_descendants_of_missing_mempool_transactions_are_dropped():
+    transactions = [record('child', 500, 400, ['invalid']), record('grandchild', 500, 400, ['child']),
+                    record('other', 100, 400, ['confirmed'])]
+    selected = build_block_template(transactions, mempool_txids={'invalid', 'child', 'grandchild', 'other'})
+    assert txids(selected) == ['other']
+
+def test_parents_precede_children_in_a_shared_package():
+    transactions = [record('c', 5000, 400, ['a', 'b']), record('b', 1, 400, ['a']), record('a', 1, 400)]
+    assert txids(build_block_template(transactions)) == ['a', 'b', 'c']
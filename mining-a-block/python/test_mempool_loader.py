@@ -0,0 +1,59 @@
+import json
+import pytest
+from pathlib import Path
+from main import init_validation_worker, validate_shard
+from block_template import build_block_template
+from mempool_loader import load_transaction_record, iter_transaction_records, iter_prevouts, MalformedTransaction
+
+MEMPOOL = Path(__file__).parent.parent / "mempool"
+#a P2PKH spend with a single input
+P2PKH_TX = MEMPOOL / "004947e806c5afa74ea4b64de0bfe63bb7488c2c3e4e5d4d5d6c8403d16de46a.json"
+#a P2WPKH spend of an output of PARENT_TX
+CHILD_TX = MEMPOOL / "001d79a968a5f679b7b17276bc2d45700b575c0bf40befb52ec7687bc00d4364.json"
+PARENT_TX = MEMPOOL / "b73e65d50a91efc5f7c9c42145569ac42ff083cf5bf1ac68682a62fab5667338.json"
+
+@pytest.fixture
+def truncated_tx(tmp_path):
+    data = json.loads(P2PKH_TX.read_text())
+    data['hex'] = data['hex'][:len(data['hex']) // 2]
+    path = tmp_path / P2PKH_TX.name
+    path.write_text(json.dumps(data))
+    return path
+
+def test_record_matches_the_transaction_file():
+    data = json.loads(P2PKH_TX.read_text())
+    record = load_transaction_record(P2PKH_TX)
+    assert (record.txid, record.fee, record.weight, record.raw.hex()) == (data['txid'], data['fee'], data['weight'], data['hex'])
+    assert record.parents == tuple(dict.fromkeys(tx_input['txid'] for tx_input in data['vin']))
+    assert list(iter_prevouts(record.prevouts)) == [
+        (tx_input['prevout']['value'], bytes.fromhex(tx_input['prevout']['scriptpubkey'])) for tx_input in data['vin']]
+
+def test_files_without_a_transaction_are_skipped():
+    assert load_transaction_record(MEMPOOL / "mempool.json") is None
+    assert [record.txid for record in iter_transaction_records([MEMPOOL / "mempool.json", P2PKH_TX])] == [P2PKH_TX.stem]
+
+def test_truncated_transaction_is_malformed(truncated_tx):
+    with pytest.raises(MalformedTransaction):
+        load_transaction_record(truncated_tx)
+    malformed = []
+    assert list(iter_transaction_records([truncated_tx], malformed)) == []
+    assert malformed == [truncated_tx.stem]
+
+def test_truncated_transaction_is_invalid_without_stopping_validation(truncated_tx):
+    init_validation_worker({})
+    valid_records, _, new_results, _, _, count, *_ = validate_shard([truncated_tx, P2PKH_TX])
+    assert [record.txid for record in valid_records] == [P2PKH_TX.stem]
+    assert new_results == [(load_transaction_record(P2PKH_TX).wtxid, True)]
+    assert count == 2
+
+def test_children_of_a_truncated_transaction_are_excluded(tmp_path):
+    data = json.loads(PARENT_TX.read_text())
+    data['hex'] = data['hex'][:len(data['hex']) // 2]
+    truncated_parent = tmp_path / PARENT_TX.name
+    truncated_parent.write_text(json.dumps(data))
+    init_validation_worker({})
+    valid_records, *_, txids = validate_shard([truncated_parent, CHILD_TX])
+    #the child's signature is valid, but it spends an output of a transaction that can't be mined
+    assert [record.txid for record in valid_records] == [CHILD_TX.stem]
+    assert sorted(txids) == sorted([PARENT_TX.stem, CHILD_TX.stem])
+    assert build_block_template(valid_records, mempool_txids=set(txids)) == []
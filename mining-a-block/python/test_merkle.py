@@ -0,0 +1,54 @@
+import hashlib
+import pytest
+from merkle import MerkleTree, merkle_root_from_branch
+
+def hash256(data):
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+def naive_root(leaves):
+    level = list(leaves)
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [hash256(level[i] + level[i + 1]) for i in range(0, len(level), 2)]
+    return level[0]
+
+def leaves(count, seed=0):
+    return [hash256(bytes([seed]) + i.to_bytes(4, 'little')) for i in range(count)]
+
+def test_root_of_block_170():
+    #block 170 holds the coinbase and the first bitcoin transfer
+    txids = ["b1fea52486ce0c62bb442b530a3f0132b826c74e473d1f2c220bfa78111c5082",
+             "f4184fc596403b9d638783cf57adfe4c75c605f6356fbc91338530e9831e9e16"]
+    assert MerkleTree.from_txids(txids).root[::-1].hex() == \
+        "7dac2c5666815c17a3b36427de37bb9d2e2c5ccec3f8633eb91a4205cb4c10ff"
+
+@pytest.mark.parametrize("count", [1, 2, 3, 5, 8, 13])
+def test_root_matches_a_plain_computation(count):
+    assert MerkleTree(leaves(count)).root == naive_root(leaves(count))
+
+def test_empty_tree_has_no_root():
+    assert MerkleTree().root is None
+
+def test_update_and_append_match_a_rebuilt_tree():
+    tree = MerkleTree(leaves(6))
+    tree.update(0, b'\x11' * 32)
+    tree.append(b'\x22' * 32)
+    tree.append(b'\x33' * 32)
+    expected = [b'\x11' * 32] + leaves(6)[1:] + [b'\x22' * 32, b'\x33' * 32]
+    assert tree.levels == MerkleTree(expected).levels
+
+@pytest.mark.parametrize("length", [1, 2, 3, 4, 7, 9])
+def test_truncate_matches_a_rebuilt_tree(length):
+    tree = MerkleTree(leaves(10))
+    tree.truncate(length)
+    assert len(tree) == length
+    assert tree.levels == MerkleTree(leaves(10)[:length]).levels
+    tree.append(b'\x44' * 32)
+    assert tree.root == naive_root(leaves(10)[:length] + [b'\x44' * 32])
+
+@pytest.mark.parametrize("count", [1, 2, 5, 11])
+def test_branch_leads_every_leaf_to_the_root(count):
+    tree = MerkleTree(leaves(count))
+    for index, leaf in enumerate(leaves(count)):
+        assert merkle_root_from_branch(leaf, index, tree.branch(index)) == tree.root
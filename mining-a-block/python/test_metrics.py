@@ -0,0 +1,54 @@
+import json
+import shutil
+import tracemalloc
+import pytest
+from pathlib import Path
+from main import get_valid_transactions
+from metrics import Metrics
+
+MEMPOOL = Path(__file__).parent.parent / "mempool"
+
+def test_mempool_txids_come_from_the_transactions_read(tmp_path):
+    folder = tmp_path / "mempool"
+    folder.mkdir()
+    paths = sorted(MEMPOOL.glob('0*.json'))[:30]
+    for path in paths + [MEMPOOL / "mempool.json"]:
+        shutil.copy(path, folder)
+    mempool_txids = set()
+    metrics = Metrics()
+    valid = get_valid_transactions(folder, mempool_txids=mempool_txids, metrics=metrics)
+    assert mempool_txids == {json.loads(path.read_text())['txid'] for path in paths}
+    assert {record.txid for record in valid} <= mempool_txids
+    assert metrics.values['validation_cache_hits'] == 0
+
+def test_report_counts_transactions_by_outcome_and_reason():
+    metrics = Metrics()
+    with metrics.stage('validate'):
+        pass
+    with metrics.stage('validate'):
+        pass
+    metrics.count('accepted', amount=5)
+    metrics.count('rejected', 'double-spend', 2)
+    metrics.count('rejected', 'invalid_signature', 3)
+    metrics.set('hash_rate', 1.5)
+    report = metrics.report()
+    assert list(report['stages_seconds']) == ['validate']
+    assert report['transactions'] == {'accepted': 5, 'rejected': 5,
+                                      'rejected_by_reason': {'double-spend': 2, 'invalid_signature': 3}}
+    assert report['values'] == {'hash_rate': 1.5}
+
+@pytest.mark.parametrize("name", ["report.json", "report.prom"])
+def test_reports_are_written(name, tmp_path):
+    metrics = Metrics(trace_memory=name.endswith('.prom'))
+    with metrics.stage('build_template'):
+        bytearray(1 << 16)
+    metrics.count('rejected', 'parent rejected')
+    metrics.write(tmp_path / name)
+    #tracing slows every later test down
+    tracemalloc.stop()
+    text = (tmp_path / name).read_text()
+    if name.endswith('.json'):
+        assert json.loads(text)['transactions'] == {'rejected': 1, 'rejected_by_reason': {'parent rejected': 1}}
+    else:
+        assert 'miner_transactions{outcome="rejected",reason="parent rejected"} 1' in text
+        assert 'miner_stage_peak_memory_bytes{stage="build_template"}' in text
@@ -0,0 +1,37 @@
+from main import hash256, search_nonce_range, construct_block_header, nonce_chunks
+
+#one header hash in 256 meets it
+EASY_TARGET = "00ff" + "ff" * 30
+HEADER_PREFIX = bytes(range(76))
+
+def first_nonce(header_prefix, target_bytes):
+    nonce = 0
+    while hash256(header_prefix + nonce.to_bytes(4, 'little'))[::-1] >= target_bytes:
+        nonce += 1
+    return nonce
+
+def test_search_finds_the_first_nonce_meeting_the_target():
+    target_bytes = bytes.fromhex(EASY_TARGET)
+    expected = first_nonce(HEADER_PREFIX, target_bytes)
+    assert search_nonce_range(HEADER_PREFIX, 0, 10000, target_bytes) == (expected, expected + 1)
+    assert search_nonce_range(HEADER_PREFIX, expected, 10, target_bytes) == (expected, 1)
+
+def test_search_reports_every_hash_when_no_nonce_meets_the_target():
+    assert search_nonce_range(HEADER_PREFIX, 0, 500, bytes(32)) == (None, 500)
+
+def test_nonce_chunks_stop_at_the_largest_nonce():
+    assert list(nonce_chunks(1 << 31)) == [(0, 1 << 31), (1 << 31, 1 << 31)]
+    #3 * 10^9 doesn't divide 2^32: the second chunk is cut short
+    assert list(nonce_chunks(3 * 10 ** 9)) == [(0, 3 * 10 ** 9), (3 * 10 ** 9, (1 << 32) - 3 * 10 ** 9)]
+    start, count = list(nonce_chunks(3 * 10 ** 9))[-1]
+    assert search_nonce_range(HEADER_PREFIX, 0xffffff00, start + count - 0xffffff00, bytes(32)) == (None, 0x100)
+
+def test_header_is_the_same_whatever_the_number_of_workers():
+    merkle_root = bytes(range(32))
+    headers = [construct_block_header(4, "00" * 32, merkle_root, 1700000000, 520159231, EASY_TARGET, workers,
+                                      chunk_size=64) for workers in (1, 2)]
+    assert headers[0] == headers[1]
+    header = bytes.fromhex(headers[0])
+    assert hash256(header)[::-1] < bytes.fromhex(EASY_TARGET)
+    assert header[:76] == ((4).to_bytes(4, 'little') + bytes(32) + merkle_root + (1700000000).to_bytes(4, 'little') +
+                           (520159231).to_bytes(4, 'little'))
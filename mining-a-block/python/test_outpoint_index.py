@@ -0,0 +1,83 @@
+import pytest
+from mempool_loader import TransactionRecord
+from txparser import parse_transaction, serialize_varint
+from outpoint_index import (select_consistent_transactions, REJECT_DOUBLE_SPEND, REJECT_INSUFFICIENT_INPUTS,
+                            REJECT_MISSING_OUTPUT, REJECT_PREVOUT_MISMATCH, REJECT_PARENT_REJECTED)
+
+#outputs of confirmed transactions, outside the set
+FUNDING = ["aa" * 32, "bb" * 32, "cc" * 32]
+
+def make_record(inputs, outputs, fee):
+    """
+    Builds a legacy transaction spending the given (txid, vout, value) inputs into outputs of the given values.
+    """
+    raw = (b'\x01\x00\x00\x00' + serialize_varint(len(inputs))
+           + b''.join(bytes.fromhex(txid)[::-1] + vout.to_bytes(4, 'little') + b'\x00\xff\xff\xff\xff'
+                      for txid, vout, _ in inputs)
+           + serialize_varint(len(outputs)) + b''.join(value.to_bytes(8, 'little') + b'\x01\x51' for value in outputs)
+           + b'\x00\x00\x00\x00')
+    tx = parse_transaction(raw)
+    prevouts = b''.join(value.to_bytes(8, 'little') + b'\x01\x51' for _, _, value in inputs)
+    parents = [txid for txid, _, _ in inputs if txid not in FUNDING]
+    return TransactionRecord(tx.txid, tx.txid, fee, tx.weight, raw, parents, prevouts)
+
+def select(records):
+    kept, _, rejected = select_consistent_transactions(records)
+    return [record.txid for record in kept], rejected
+
+def test_consistent_transactions_are_kept():
+    parent = make_record([(FUNDING[0], 0, 10000)], [6000, 3000], 1000)
+    child = make_record([(parent.txid, 1, 3000)], [2500], 500)
+    assert select([child, parent]) == ([child.txid, parent.txid], {})
+
+def test_double_spend_keeps_the_higher_fee_rate():
+    low = make_record([(FUNDING[0], 0, 10000)], [9000], 1000)
+    high = make_record([(FUNDING[0], 0, 10000)], [8000], 2000)
+    assert select([low, high]) == ([high.txid], {low.txid: REJECT_DOUBLE_SPEND})
+
+def test_children_of_the_losing_spend_are_rejected():
+    low = make_record([(FUNDING[0], 0, 10000)], [9000], 1000)
+    high = make_record([(FUNDING[0], 0, 10000)], [8000], 2000)
+    child = make_record([(low.txid, 0, 9000)], [8000], 1000)
+    assert select([low, high, child]) == ([high.txid], {low.txid: REJECT_DOUBLE_SPEND,
+                                                        child.txid: REJECT_PARENT_REJECTED})
+
+def test_a_child_pays_for_its_parent_in_a_conflict():
+    parent = make_record([(FUNDING[0], 0, 10000)], [9900], 100)
+    child = make_record([(parent.txid, 0, 9900)], [1900], 8000)
+    other = make_record([(FUNDING[0], 0, 10000)], [8000], 2000)
+    kept, rejected = select([other, parent, child])
+    assert kept == [parent.txid, child.txid]
+    assert rejected == {other.txid: REJECT_DOUBLE_SPEND}
+
+def test_rejected_transactions_dont_win_conflicts():
+    #the child of an overspending parent would win the conflict on its own fee rate
+    parent = make_record([(FUNDING[0], 0, 1000)], [5000], 0)
+    child = make_record([(parent.txid, 0, 5000), (FUNDING[1], 0, 10000)], [5000], 10000)
+    other = make_record([(FUNDING[1], 0, 10000)], [9000], 1000)
+    assert select([parent, child, other]) == ([other.txid], {parent.txid: REJECT_INSUFFICIENT_INPUTS,
+                                                             child.txid: REJECT_PARENT_REJECTED})
+
+def test_accepted_parents_are_never_dropped_for_a_child():
+    parent = make_record([(FUNDING[0], 0, 10000)], [4000, 4000], 2000)
+    child = make_record([(parent.txid, 0, 4000), (FUNDING[1], 0, 10000)], [13000], 1000)
+    other = make_record([(FUNDING[1], 0, 10000)], [8000], 2000)
+    kept, rejected = select([parent, child, other])
+    assert kept == [parent.txid, other.txid]
+    assert rejected == {child.txid: REJECT_DOUBLE_SPEND}
+
+@pytest.mark.parametrize("vout, value, reason", [(2, 4000, REJECT_MISSING_OUTPUT),
+                                                 (0, 5000, REJECT_PREVOUT_MISMATCH)])
+def test_inputs_are_checked_against_the_parent_outputs(vout, value, reason):
+    parent = make_record([(FUNDING[0], 0, 10000)], [4000, 4000], 2000)
+    child = make_record([(parent.txid, vout, value)], [3000], 1000)
+    grandchild = make_record([(child.txid, 0, 3000)], [2000], 1000)
+    assert select([parent, child, grandchild]) == ([parent.txid], {child.txid: reason,
+                                                                  grandchild.txid: REJECT_PARENT_REJECTED})
+
+def test_index_only_holds_the_kept_spends():
+    low = make_record([(FUNDING[0], 0, 10000)], [9000], 1000)
+    high = make_record([(FUNDING[0], 0, 10000), (FUNDING[2], 0, 10000)], [18000], 2000)
+    _, index, _ = select_consistent_transactions([low, high])
+    assert set(index.spenders.values()) == {high.txid}
+    assert len(index) == 2
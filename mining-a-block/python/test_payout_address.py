@@ -0,0 +1,19 @@
+import main
+from main import get_payout_address
+
+def test_configured_address_wins(monkeypatch, tmp_path):
+    monkeypatch.setenv("MINER_PAYOUT_ADDRESS", "configured")
+    monkeypatch.setattr(main, "PAYOUT_ADDRESS_PATH", tmp_path / "payout-address")
+    (tmp_path / "payout-address").write_text("saved\n")
+    assert get_payout_address() == "configured"
+
+def test_wallet_is_only_opened_once(monkeypatch, tmp_path):
+    monkeypatch.delenv("MINER_PAYOUT_ADDRESS", raising=False)
+    monkeypatch.setattr(main, "PAYOUT_ADDRESS_PATH", tmp_path / "payout-address")
+    opened = []
+    monkeypatch.setattr(main, "create_or_load_wallet", lambda name: opened.append(name) or name)
+    monkeypatch.setattr(main, "generate_or_get_address", lambda wallet: f"address of {wallet}")
+    assert get_payout_address("mywallet") == "address of mywallet"
+    assert get_payout_address("mywallet") == "address of mywallet"
+    assert opened == ["mywallet"]
+    assert (tmp_path / "payout-address").read_text() == "address of mywallet\n"
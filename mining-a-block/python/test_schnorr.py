@@ -0,0 +1,144 @@
+import hashlib
+import pytest
+import schnorr
+from sighash import tagged_hash
+from schnorr import (P, N, G, BISECT_THRESHOLD, lift_x, jacobian_add, to_affine, double_scalar_multiply,
+                     multi_scalar_multiply, decode_public_key, parse_der_signature, ecdsa_verify, schnorr_verify,
+                     schnorr_batch_verify, verify_schnorr_signatures)
+
+PRIVATE_KEY = 0x1e99423a4ed27608a15a2616a2b0e9e52ced330ac530edcc32c8ffc6a526aedd
+real_schnorr_verify = schnorr_verify
+
+def multiply(scalar, point=G):
+    return to_affine(double_scalar_multiply(scalar, point, 0, point))
+
+def encode_point(point, compressed=True):
+    x, y = point
+    if compressed:
+        return bytes([2 + y % 2]) + x.to_bytes(32, 'big')
+    return b'\x04' + x.to_bytes(32, 'big') + y.to_bytes(32, 'big')
+
+def der_integer(value):
+    encoded = value.to_bytes((value.bit_length() + 8) // 8, 'big')
+    return b'\x02' + bytes([len(encoded)]) + encoded
+
+def der_signature(r, s):
+    body = der_integer(r) + der_integer(s)
+    return b'\x30' + bytes([len(body)]) + body
+
+def ecdsa_sign(private_key, message, nonce):
+    r = multiply(nonce)[0] % N
+    s = pow(nonce, -1, N) * (int.from_bytes(message, 'big') + r * private_key) % N
+    return der_signature(r, min(s, N - s))
+
+@pytest.fixture(params=["fastecdsa", "python"])
+def backend(request, monkeypatch):
+    if request.param == "fastecdsa" and schnorr.fastecdsa is None:
+        pytest.skip("fastecdsa isn't installed")
+    if request.param == "python":
+        monkeypatch.setattr(schnorr, "fastecdsa", None)
+    return request.param
+
+def test_public_keys_decode_to_the_same_point():
+    point = multiply(PRIVATE_KEY)
+    assert decode_public_key(encode_point(point)) == point
+    assert decode_public_key(encode_point(point, compressed=False)) == point
+    assert decode_public_key(encode_point((point[0], P - point[1]))) == (point[0], P - point[1])
+
+def test_invalid_public_keys_are_refused():
+    point = multiply(PRIVATE_KEY)
+    assert decode_public_key(b'\x04' + point[0].to_bytes(32, 'big') + (point[1] + 1).to_bytes(32, 'big')) is None
+    assert decode_public_key(b'\x02' + P.to_bytes(32, 'big')) is None
+    assert decode_public_key(b'\x05' + point[0].to_bytes(32, 'big')) is None
+    assert decode_public_key(encode_point(point)[:-1]) is None
+
+def test_strict_der_encoding():
+    assert parse_der_signature(der_signature(1, 2 ** 255)) == (1, 2 ** 255)
+    #a needless zero byte, a negative integer, a wrong length and trailing bytes
+    assert parse_der_signature(b'\x30\x07\x02\x02\x00\x01\x02\x01\x01') is None
+    assert parse_der_signature(b'\x30\x06\x02\x01\x81\x02\x01\x01') is None
+    assert parse_der_signature(b'\x30\x07\x02\x01\x01\x02\x01\x01') is None
+    assert parse_der_signature(der_signature(1, 1) + b'\x00') is None
+
+def test_signatures_are_verified(backend):
+    message = hashlib.sha256(b'message').digest()
+    pubkey = encode_point(multiply(PRIVATE_KEY))
+    signature = ecdsa_sign(PRIVATE_KEY, message, 0x1234567890abcdef)
+    assert ecdsa_verify(pubkey, message, signature)
+    assert ecdsa_verify(encode_point(multiply(PRIVATE_KEY), compressed=False), message, signature)
+    assert not ecdsa_verify(pubkey, hashlib.sha256(b'other message').digest(), signature)
+    assert not ecdsa_verify(encode_point(multiply(PRIVATE_KEY + 1)), message, signature)
+
+def test_out_of_range_scalars_are_refused(backend):
+    message = hashlib.sha256(b'message').digest()
+    pubkey = encode_point(multiply(PRIVATE_KEY))
+    assert not ecdsa_verify(pubkey, message, der_signature(0, 1))
+    assert not ecdsa_verify(pubkey, message, der_signature(1, N))
+
+def schnorr_sign(private_key, message, nonce):
+    point = multiply(private_key)
+    key = private_key if point[1] % 2 == 0 else N - private_key
+    nonce_point = multiply(nonce)
+    nonce = nonce if nonce_point[1] % 2 == 0 else N - nonce
+    r = nonce_point[0].to_bytes(32, 'big')
+    e = int.from_bytes(tagged_hash("BIP0340/challenge", r + point[0].to_bytes(32, 'big') + message), 'big') % N
+    return point[0].to_bytes(32, 'big'), r + ((nonce + e * key) % N).to_bytes(32, 'big')
+
+def schnorr_signatures(count):
+    signatures = []
+    for i in range(count):
+        message = hashlib.sha256(i.to_bytes(4, 'big')).digest()
+        pubkey, signature = schnorr_sign(PRIVATE_KEY + i, message, 0xabcdef + i)
+        signatures.append((pubkey, message, signature))
+    return signatures
+
+def off_curve_x():
+    x = 1
+    while lift_x(x) is not None:
+        x += 1
+    return x
+
+@pytest.mark.parametrize("count", [1, 3, 40])
+def test_multi_scalar_multiply_matches_separate_multiplications(count):
+    pairs = [((PRIVATE_KEY * (i + 7)) % N, multiply(i + 2)) for i in range(count)]
+    expected = None
+    for scalar, point in pairs:
+        expected = jacobian_add(expected, double_scalar_multiply(scalar, point, 0, point))
+    assert to_affine(multi_scalar_multiply(pairs)) == to_affine(expected)
+
+def test_valid_batch_is_accepted():
+    signatures = schnorr_signatures(8)
+    assert all(schnorr_verify(*signature) for signature in signatures)
+    assert schnorr_batch_verify(signatures)
+    assert verify_schnorr_signatures(signatures) == [True] * 8
+
+def test_empty_list():
+    assert verify_schnorr_signatures([]) == []
+    assert verify_schnorr_signatures([], batch=False) == []
+
+@pytest.mark.parametrize("batch", [True, False])
+def test_invalid_signature_is_pinpointed(batch, monkeypatch):
+    signatures = schnorr_signatures(2 * BISECT_THRESHOLD + 6)
+    pubkey, message, signature = signatures[45]
+    signatures[45] = (pubkey, message, signature[:32] + ((int.from_bytes(signature[32:], 'big') + 1) % N).to_bytes(32, 'big'))
+    single = []
+    monkeypatch.setattr(schnorr, "schnorr_verify", lambda *signature: single.append(signature) or real_schnorr_verify(*signature))
+    results = verify_schnorr_signatures(signatures, batch)
+    assert results == [index != 45 for index in range(len(signatures))]
+    #bisection only verifies the failing half of the failing half one by one
+    assert len(single) == (len(signatures) // 4 if batch else len(signatures))
+
+@pytest.mark.parametrize("tamper", ["r >= p", "s >= n", "x off the curve"])
+def test_invalid_encodings_are_refused(tamper):
+    signatures = schnorr_signatures(3)
+    pubkey, message, signature = signatures[1]
+    if tamper == "r >= p":
+        signature = P.to_bytes(32, 'big') + signature[32:]
+    elif tamper == "s >= n":
+        signature = signature[:32] + N.to_bytes(32, 'big')
+    else:
+        pubkey = off_curve_x().to_bytes(32, 'big')
+    signatures[1] = (pubkey, message, signature)
+    assert not schnorr_verify(pubkey, message, signature)
+    assert not schnorr_batch_verify(signatures)
+    assert verify_schnorr_signatures(signatures) == [True, False, True]
@@ -0,0 +1,113 @@
+import asyncio
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from merkle import MerkleTree
+from main import init_validation_worker
+from service import IncrementalTemplate, MiningService, ZERO_HASH
+from test_outpoint_index import make_record, FUNDING
+
+MEMPOOL = Path(__file__).parent.parent / "mempool"
+
+def template_of(records, max_weight=4000):
+    template = IncrementalTemplate(max_weight)
+    template.pool = {record.txid: record for record in records}
+    template.rebuild()
+    return template
+
+def check_trees(template):
+    leaves = [ZERO_HASH] + [bytes.fromhex(record.txid)[::-1] for record in template.records]
+    assert template.txid_tree.levels == MerkleTree(leaves).levels
+
+def test_packages_are_appended_parents_first():
+    first = make_record([(FUNDING[0], 0, 10000)], [9000], 1000)
+    template = template_of([first])
+    parent = make_record([(FUNDING[1], 0, 10000)], [9500], 500)
+    child = make_record([(parent.txid, 0, 9500)], [5500], 4000)
+    template.pool.update({parent.txid: parent, child.txid: child})
+    assert template.add(child) == 0
+    assert [record.txid for record in template.records] == [first.txid, parent.txid, child.txid]
+    assert template.fees == 5500
+    check_trees(template)
+
+def test_overspending_packages_are_refused():
+    template = template_of([])
+    parent = make_record([(FUNDING[0], 0, 10000)], [9000], 1000)
+    child = make_record([(parent.txid, 0, 9000)], [12000], 1000)
+    template.pool.update({parent.txid: parent, child.txid: child})
+    assert template.add(child) is None
+    assert template.records == []
+
+def test_spends_of_a_different_parent_output_value_are_refused():
+    parent = make_record([(FUNDING[0], 0, 10000)], [9000], 1000)
+    template = template_of([parent])
+    child = make_record([(parent.txid, 0, 8000)], [7000], 1000)
+    template.pool[child.txid] = child
+    assert template.add(child) is None
+    assert template.records == [parent]
+
+def test_conflicting_spends_are_refused():
+    spend = make_record([(FUNDING[0], 0, 10000)], [9000], 1000)
+    template = template_of([spend])
+    conflict = make_record([(FUNDING[0], 0, 10000)], [5000], 5000)
+    template.pool[conflict.txid] = conflict
+    assert template.add(conflict) is None
+    assert template.records == [spend]
+
+def test_lower_fee_rate_transactions_are_evicted_when_full():
+    low = make_record([(FUNDING[0], 0, 10000)], [9900], 100)
+    high = make_record([(FUNDING[1], 0, 10000)], [8000], 2000)
+    template = template_of([low, high], max_weight=low.weight + high.weight)
+    newcomer = make_record([(FUNDING[2], 0, 10000)], [9000], 1000)
+    template.pool[newcomer.txid] = newcomer
+    assert template.add(newcomer) == 1
+    assert [record.txid for record in template.records] == [high.txid, newcomer.txid]
+    assert template.weight == high.weight + newcomer.weight
+    check_trees(template)
+
+def test_rebuilds_run_off_the_event_loop(tmp_path, monkeypatch):
+    folder = tmp_path / "mempool"
+    folder.mkdir()
+    for path in sorted(MEMPOOL.glob('0*.json'))[:5]:
+        shutil.copy(path, folder)
+    threads = []
+    rebuild = IncrementalTemplate.rebuild
+    monkeypatch.setattr(IncrementalTemplate, "rebuild",
+                        lambda template: threads.append(threading.current_thread()) or rebuild(template))
+    init_validation_worker({})
+    service = MiningService(folder, tmp_path / "out.txt", None)
+
+    async def refresh():
+        with ThreadPoolExecutor(1) as executor:
+            return await service.refresh(executor), threading.current_thread()
+    changed, loop_thread = asyncio.run(refresh())
+    assert changed
+    assert len(threads) == 1 and threads[0] is not loop_thread
+    assert service.template.records
+
+def test_unreadable_files_are_retried_one_at_a_time(tmp_path):
+    folder = tmp_path / "mempool"
+    folder.mkdir()
+    paths = sorted(MEMPOOL.glob('0*.json'))[:5]
+    for path in paths:
+        shutil.copy(path, folder)
+    #a file still being written when the folder is polled
+    partial = folder / paths[0].name
+    partial.write_text(paths[0].read_text()[:100])
+    init_validation_worker({})
+    service = MiningService(folder, tmp_path / "out.txt", None)
+
+    async def refresh():
+        with ThreadPoolExecutor(1) as executor:
+            return await service.refresh(executor)
+    assert asyncio.run(refresh())
+    assert service.files == {path.name for path in paths[1:]}
+    assert service.failed == {paths[0].name}
+    #completing the file doesn't change the folder's mtime
+    folder_mtime = folder.stat().st_mtime_ns
+    shutil.copy(paths[0], partial)
+    assert folder.stat().st_mtime_ns == folder_mtime
+    assert asyncio.run(refresh())
+    assert service.files == {path.name for path in paths} and not service.failed
+    assert not asyncio.run(refresh())
@@ -0,0 +1,58 @@
+import hashlib
+import pytest
+import sha256d
+from main import search_nonce_range
+from merkle import MerkleTree
+
+HEADER_PREFIX = bytes(range(76))
+EASY_TARGET = bytes.fromhex("00ff" + "ff" * 30)
+
+def hash256(data):
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+@pytest.fixture(params=sha256d.SHA256D_BACKENDS)
+def backend(request, monkeypatch):
+    default = sha256d.backend
+    if sha256d.set_backend(request.param) != request.param:
+        pytest.skip(f"{request.param} isn't installed")
+    #small batches, so that several of them and a partial one are hashed
+    monkeypatch.setattr(sha256d, "BATCH_SIZE", 64)
+    monkeypatch.setattr(sha256d, "MIN_BATCH", 1)
+    yield request.param
+    sha256d.set_backend(default)
+
+def test_unknown_backends_are_refused():
+    with pytest.raises(ValueError):
+        sha256d.set_backend("gpu")
+
+def test_midstate_matches_hashlib():
+    state = sha256d.compress_scalar(sha256d.INITIAL_STATE, HEADER_PREFIX[:64])
+    padding = b'\x80' + bytes(55) + (512).to_bytes(8, 'big')
+    assert b''.join(word.to_bytes(4, 'big') for word in sha256d.compress_scalar(state, padding)) == \
+        hashlib.sha256(HEADER_PREFIX[:64]).digest()
+
+def test_pairs_are_double_hashed(backend):
+    pairs = b''.join(i.to_bytes(64, 'little') for i in range(150))
+    assert sha256d.hash_pairs(pairs) == [hash256(pairs[i:i + 64]) for i in range(0, len(pairs), 64)]
+
+@pytest.mark.parametrize("count", [1, 2, 3, 255, 256, 257])
+def test_merkle_roots_match_across_backends(backend, count):
+    leaves = [hashlib.sha256(i.to_bytes(4, 'little')).digest() for i in range(count)]
+    tree = MerkleTree(leaves)
+    sha256d.set_backend("hashlib")
+    assert tree.levels == MerkleTree(leaves).levels
+
+def test_nonce_search_finds_the_first_nonce(backend):
+    nonce, _ = search_nonce_range(HEADER_PREFIX, 100, 5000, EASY_TARGET)
+    expected = next(nonce for nonce in range(100, 5100)
+                    if hash256(HEADER_PREFIX + nonce.to_bytes(4, 'little'))[::-1] < EASY_TARGET)
+    assert nonce == expected
+
+def test_hash_counts(backend):
+    nonce, hashes = search_nonce_range(HEADER_PREFIX, 100, 5000, EASY_TARGET)
+    if backend == "numpy":
+        #every lane of the batch holding the nonce was hashed
+        assert hashes == min(100 + 64 * ((nonce - 100) // 64 + 1), 5100) - 100
+    else:
+        assert hashes == nonce - 100 + 1
+    assert search_nonce_range(HEADER_PREFIX, 0, 300, bytes(32)) == (None, 300)
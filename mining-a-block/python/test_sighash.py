@@ -0,0 +1,98 @@
+import json
+import pytest
+from pathlib import Path
+from main import parse_multisig_script, verify_multisig, init_validation_worker, validate_shard
+from mempool_loader import load_transaction_record, iter_prevouts
+from txparser import parse_transaction, witness_items, serialize_varint
+from sighash import SighashCache, p2wpkh_script_code
+from schnorr import ecdsa_verify, schnorr_verify
+
+MEMPOOL = Path(__file__).parent.parent / "mempool"
+#mempool transactions signed with SIGHASH_ALL, SIGHASH_ALL|ANYONECANPAY and SIGHASH_SINGLE|ANYONECANPAY
+P2WPKH_TXS = ["0007f518fef4069ed7afe6f093fc73da3447133d5d6abd59c1978a2b597b6aa6.json",
+              "254b130178ad82a2440aa4506bc45c23502772952bd20adb094701c9508040ef.json",
+              "0ade90373919230062ecf8844c7366dd462c83f40daa60398c873b37a7f9d56b.json"]
+#2-of-2 and 3-of-4 multisig, one of them also signed with SIGHASH_NONE|ANYONECANPAY
+P2WSH_TXS = ["00e51cd4fe109ce4a505e00ce348e04ff3e841925f4164c073d84d638a3bf14e.json",
+             "d255c2af6fc2897d6c4c4eabb50a8414e173006e9f9080b611bcfbeaee826303.json",
+             "9c0600ea5b52113dd0033edae19722d43abe561da1c0f6b0a1cf7e329f85993b.json"]
+#64-byte signatures, and SIGHASH_ALL, SIGHASH_ALL|ANYONECANPAY and SIGHASH_SINGLE|ANYONECANPAY ones
+TAPROOT_TXS = ["00000964b698b728022e6d180add7b2c060676e522ab2907f06198af7b2d0b99.json",
+               "053f9278ffafc8e50fd03cfda0982378d9eadf1980ae875541e23978f883b90d.json",
+               "b7f796d5bb80286bbbe41f963eecfb5ab9dc41e036e131abae09789cde8582f4.json",
+               "0141420f22545a669069643ac38366bac9cba5f6787b367e7d9f99df0bf71ad3.json"]
+
+def spent_inputs(name, program_prefix):
+    """
+    Yields the inputs of a mempool transaction spending outputs whose script starts with program_prefix.
+    """
+    record = load_transaction_record(MEMPOOL / name)
+    tx = parse_transaction(record.raw)
+    prevouts = list(iter_prevouts(record.prevouts))
+    sighashes = SighashCache(record.raw, tx, prevouts)
+    for index, (amount, script) in enumerate(prevouts):
+        if script.startswith(program_prefix):
+            yield sighashes, index, amount, script, [bytes(item) for item in witness_items(record.raw, tx, index)]
+
+def test_bip143_native_p2wpkh_example():
+    raw = bytes.fromhex(
+        "0100000002fff7f7881a8099afa6940d42d1e7f6362bec38171ea3edf433541db4e4ad969f0000000000eeffffffef51e1b804cc89d182d2"
+        "79655c3aa89e815b1b309fe287d9b2b55d57b90ec68a0100000000ffffffff02202cb206000000001976a9148280b37df378db99f66f85c9"
+        "5a783a76ac7a6d5988ac9093510d000000001976a9143bde42dbee7e4dbe6a21b2d50ce2f0167faa815988ac11000000")
+    sighashes = SighashCache(raw, parse_transaction(raw), [])
+    assert sighashes.hash_prevouts.hex() == "96b827c8483d4e9b96712b6713a7b68d6e8003a781feba36c31143470b4efd37"
+    assert sighashes.hash_sequence.hex() == "52b0a642eea2fb7ae638c36f6252b6750293dbe574a806984b8e4d8548339a3b"
+    assert sighashes.hash_outputs.hex() == "863ef3e1a92afbfdb97f31ad0fc7683ee943e9abcf2501590ff8f6551f47e5e5"
+    script_code = p2wpkh_script_code(bytes.fromhex("1d0f172a0ecb48aee1be1f2687d2963ae33f71a1"))
+    assert sighashes.segwit_v0(1, script_code, 600000000).hex() == \
+        "c37af31116d1b27caf68aae9e3ac82f1477929014d5b917657d0eb49478cb670"
+
+@pytest.mark.parametrize("name", P2WPKH_TXS)
+def test_bip143_digests_of_p2wpkh_signatures(name):
+    inputs = list(spent_inputs(name, b'\x00\x14'))
+    assert inputs
+    for sighashes, index, amount, script, (signature, pubkey) in inputs:
+        script_code = p2wpkh_script_code(script[2:])
+        assert ecdsa_verify(pubkey, sighashes.segwit_v0(index, script_code, amount, signature[-1]), signature[:-1])
+        #the digest commits to the amount of the spent output
+        assert not ecdsa_verify(pubkey, sighashes.segwit_v0(index, script_code, amount + 1, signature[-1]), signature[:-1])
+
+@pytest.mark.parametrize("name", P2WSH_TXS)
+def test_bip143_digests_of_p2wsh_multisig_signatures(name):
+    inputs = list(spent_inputs(name, b'\x00\x20'))
+    assert inputs
+    for sighashes, index, amount, script, items in inputs:
+        witness_script = items[-1]
+        _, pubkeys = parse_multisig_script(witness_script)
+        script_code = serialize_varint(len(witness_script)) + witness_script
+        signatures = [(signature[:-1], sighashes.segwit_v0(index, script_code, amount, signature[-1]))
+                      for signature in items[1:-1]]
+        assert verify_multisig(signatures, pubkeys)
+        #the signatures must follow the order of the public keys
+        assert not verify_multisig(signatures[::-1], pubkeys)
+
+@pytest.mark.parametrize("name", TAPROOT_TXS)
+def test_bip341_digests_of_key_path_signatures(name):
+    inputs = [spent for spent in spent_inputs(name, b'\x51\x20') if len(spent[4]) == 1]
+    assert inputs
+    for sighashes, index, _, script, (signature,) in inputs:
+        hashtype = signature[64] if len(signature) == 65 else 0
+        assert schnorr_verify(script[2:], sighashes.taproot_key_path(index, hashtype), signature[:64])
+        assert not schnorr_verify(script[2:], sighashes.taproot_key_path(index, hashtype ^ 0x80 or 0x01), signature[:64])
+
+def test_sighash_single_without_a_matching_output_is_refused():
+    #the transaction has four inputs and a single output
+    sighashes, *_ = next(spent_inputs(TAPROOT_TXS[0], b'\x51\x20'))
+    sighashes.taproot_key_path(0, 0x03)
+    with pytest.raises(ValueError):
+        sighashes.taproot_key_path(1, 0x03)
+
+@pytest.mark.parametrize("name", [P2WPKH_TXS[0], P2WSH_TXS[0]])
+def test_segwit_v0_spends_are_verified_against_the_prevout_amounts(name, tmp_path):
+    data = json.loads((MEMPOOL / name).read_text())
+    data['vin'][0]['prevout']['value'] += 1
+    (tmp_path / name).write_text(json.dumps(data))
+    init_validation_worker({})
+    valid_records, _, new_results, *_ = validate_shard([MEMPOOL / name, tmp_path / name])
+    assert [record.txid for record in valid_records] == [data['txid']]
+    assert [valid for _, valid in new_results] == [True, False]
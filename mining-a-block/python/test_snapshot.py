@@ -0,0 +1,49 @@
+import pickle
+import shutil
+import pytest
+from pathlib import Path
+from mempool_loader import iter_transaction_records
+from snapshot import compile_snapshot, MempoolSnapshot
+
+MEMPOOL = Path(__file__).parent.parent / "mempool"
+
+def fields(record):
+    return (record.txid, record.wtxid, record.fee, record.weight, bytes(record.raw), record.parents, bytes(record.prevouts))
+
+@pytest.fixture
+def folder(tmp_path):
+    folder = tmp_path / "mempool"
+    folder.mkdir()
+    for path in sorted(MEMPOOL.glob('0*.json'))[:40] + [MEMPOOL / "mempool.json"]:
+        shutil.copy(path, folder)
+    return folder
+
+def test_snapshot_holds_the_records_of_the_folder(folder, tmp_path):
+    expected = sorted(iter_transaction_records(sorted(folder.iterdir())), key=lambda record: record.txid)
+    assert compile_snapshot(folder, tmp_path / "mempool.snapshot") == 40
+    with MempoolSnapshot(tmp_path / "mempool.snapshot") as snapshot:
+        records = list(snapshot)
+        assert [fields(record) for record in records] == [fields(record) for record in expected]
+        assert snapshot.txids() == [record.txid for record in expected]
+        del records
+
+def test_transactions_are_found_by_txid(folder, tmp_path):
+    compile_snapshot(folder, tmp_path / "mempool.snapshot")
+    with MempoolSnapshot(tmp_path / "mempool.snapshot") as snapshot:
+        for index, txid in enumerate(snapshot.txids()):
+            assert snapshot.find(txid) == index
+        assert snapshot.find("ff" * 32) is None
+
+def test_records_are_copied_out_of_the_mapping_when_pickled(folder, tmp_path):
+    compile_snapshot(folder, tmp_path / "mempool.snapshot")
+    with MempoolSnapshot(tmp_path / "mempool.snapshot") as snapshot:
+        record = snapshot.record(0)
+        expected = fields(record)
+        data = pickle.dumps(record)
+        del record
+    assert fields(pickle.loads(data)) == expected
+
+def test_other_files_are_refused(tmp_path):
+    (tmp_path / "not.snapshot").write_bytes(bytes(64))
+    with pytest.raises(ValueError):
+        MempoolSnapshot(tmp_path / "not.snapshot")
@@ -0,0 +1,75 @@
+import pytest
+from main import hash256, search_nonce_range
+from merkle import MerkleTree
+from service import IncrementalTemplate, ZERO_HASH
+from stratum import (WorkServer, StratumError, make_job, notify_params, job_from_notify, header_prefix,
+                     add_coinbase_witness, EXTRANONCE1_SIZE)
+from test_outpoint_index import make_record, FUNDING
+
+ADDRESS = "miner"
+EASY_TARGET = "00ff" + "ff" * 30
+EXTRANONCE1 = (1).to_bytes(EXTRANONCE1_SIZE, 'big')
+
+@pytest.fixture
+def template():
+    parent = make_record([(FUNDING[0], 0, 10000)], [9000], 1000)
+    child = make_record([(parent.txid, 0, 9000)], [8000], 1000)
+    other = make_record([(FUNDING[1], 0, 10000)], [7000], 3000)
+    template = IncrementalTemplate()
+    template.pool = {record.txid: record for record in (parent, child, other)}
+    template.rebuild()
+    return template
+
+def find_share(job, extranonce2, target):
+    _, prefix = header_prefix(job, EXTRANONCE1 + extranonce2, job.time)
+    nonce, _ = search_nonce_range(prefix, 0, 1 << 20, bytes.fromhex(target))
+    return ["hasher", job.job_id, extranonce2.hex(), f"{job.time:08x}", f"{nonce:08x}"]
+
+def test_notify_round_trip(template):
+    job = make_job("1", template, ADDRESS)
+    assert job_from_notify(notify_params(job)) == job
+
+def test_header_commits_to_the_coinbase_and_the_transactions(template):
+    job = make_job("1", template, ADDRESS)
+    extranonce = EXTRANONCE1 + b'\x00\x00\x00\x07'
+    coinbase, prefix = header_prefix(job, extranonce, job.time)
+    assert extranonce in coinbase
+    leaves = [hash256(coinbase)] + [bytes.fromhex(record.txid)[::-1] for record in template.records]
+    assert prefix[36:68] == MerkleTree(leaves).root
+    assert len(prefix) == 76
+
+def test_coinbase_witness_is_added():
+    coinbase = bytes(range(60))
+    assert add_coinbase_witness(coinbase) == coinbase[:4] + b'\x00\x01' + coinbase[4:-4] + b'\x01\x20' + bytes(32) + coinbase[-4:]
+
+def test_shares_are_checked(template, tmp_path):
+    server = WorkServer(template, ADDRESS, tmp_path / "out.txt", share_target=EASY_TARGET, target="00" * 32)
+    params = find_share(server.job, b'\x00\x00\x00\x01', EASY_TARGET)
+    assert server.check_share(EXTRANONCE1, params)
+    assert server.shares == {"hasher": 1}
+    with pytest.raises(StratumError, match="duplicate"):
+        server.check_share(EXTRANONCE1, params)
+    with pytest.raises(StratumError, match="stale"):
+        server.check_share(EXTRANONCE1, [params[0], "ff"] + params[2:])
+    with pytest.raises(StratumError, match="time"):
+        server.check_share(EXTRANONCE1, params[:3] + [f"{server.job.time - 1:08x}", params[4]])
+    with pytest.raises(StratumError, match="malformed"):
+        server.check_share(EXTRANONCE1, params[:2] + ["00"] + params[3:])
+    _, prefix = header_prefix(server.job, EXTRANONCE1 + b'\x00\x00\x00\x01', server.job.time)
+    nonce = next(nonce for nonce in range(1 << 20)
+                 if hash256(prefix + nonce.to_bytes(4, 'little'))[::-1] >= bytes.fromhex(EASY_TARGET))
+    with pytest.raises(StratumError, match="low difficulty"):
+        server.check_share(EXTRANONCE1, params[:4] + [f"{nonce:08x}"])
+    assert server.block is None and not (tmp_path / "out.txt").exists()
+
+def test_block_is_written_once_a_share_meets_the_target(template, tmp_path):
+    server = WorkServer(template, ADDRESS, tmp_path / "out.txt", share_target=EASY_TARGET, target=EASY_TARGET)
+    server.check_share(EXTRANONCE1, find_share(server.job, b'\x00\x00\x00\x02', EASY_TARGET))
+    assert server.found.is_set()
+    header, coinbase, *txids = (tmp_path / "out.txt").read_text().split()
+    assert hash256(bytes.fromhex(header))[::-1] < bytes.fromhex(EASY_TARGET)
+    assert txids[1:] == [record.txid for record in template.records]
+    leaves = [bytes.fromhex(txid)[::-1] for txid in txids]
+    assert bytes.fromhex(header)[36:68] == MerkleTree(leaves).root
+    assert bytes.fromhex(coinbase)[4:6] == b'\x00\x01'
+    assert ZERO_HASH not in leaves
@@ -0,0 +1,43 @@
+import json
+import pytest
+from pathlib import Path
+from txparser import parse_transaction, input_outpoints, witness_items, read_varint, serialize_varint
+
+MEMPOOL = Path(__file__).parent.parent / "mempool"
+#a legacy P2PKH spend and a P2WSH 2-of-3 multisig spend
+LEGACY_TX = MEMPOOL / "004947e806c5afa74ea4b64de0bfe63bb7488c2c3e4e5d4d5d6c8403d16de46a.json"
+SEGWIT_TX = MEMPOOL / "00e51cd4fe109ce4a505e00ce348e04ff3e841925f4164c073d84d638a3bf14e.json"
+
+@pytest.mark.parametrize("path", sorted(MEMPOOL.glob('00*.json')))
+def test_identifiers_and_sizes_match_the_transaction_file(path):
+    data = json.loads(path.read_text())
+    tx = parse_transaction(bytes.fromhex(data['hex']))
+    assert (tx.txid, tx.weight, tx.size) == (data['txid'], data['weight'], data['size'])
+    assert (tx.version, tx.locktime, len(tx.inputs), len(tx.outputs)) == \
+        (data['version'], data['locktime'], len(data['vin']), len(data['vout']))
+
+@pytest.mark.parametrize("path", [LEGACY_TX, SEGWIT_TX])
+def test_inputs_are_read(path):
+    data = json.loads(path.read_text())
+    raw = bytes.fromhex(data['hex'])
+    tx = parse_transaction(raw)
+    assert tx.segwit == ('witness' in data['vin'][0])
+    assert input_outpoints(raw, tx) == [(tx_input['txid'], tx_input['vout']) for tx_input in data['vin']]
+
+@pytest.mark.parametrize("path", [LEGACY_TX, SEGWIT_TX])
+def test_witness_stacks_are_read(path):
+    data = json.loads(path.read_text())
+    raw = bytes.fromhex(data['hex'])
+    tx = parse_transaction(raw)
+    for index, tx_input in enumerate(data['vin']):
+        assert [bytes(item).hex() for item in witness_items(raw, tx, index)] == tx_input.get('witness', [])
+
+def test_trailing_bytes_are_refused():
+    raw = bytes.fromhex(json.loads(LEGACY_TX.read_text())['hex'])
+    with pytest.raises(ValueError):
+        parse_transaction(raw + b'\x00')
+
+@pytest.mark.parametrize("value", [0, 0xfc, 0xfd, 0xffff, 0x10000, 0xffffffff, 0x100000000])
+def test_varint_round_trip(value):
+    serialized = serialize_varint(value)
+    assert read_varint(memoryview(serialized + b'\x00'), 0) == (value, len(serialized))
@@ -0,0 +1,41 @@
+from pathlib import Path
+from main import init_validation_worker, validate_shard
+from validation_cache import ValidationCache
+
+MEMPOOL = Path(__file__).parent.parent / "mempool"
+#a P2PKH spend bitcoinlib verifies
+P2PKH_TX = MEMPOOL / "004947e806c5afa74ea4b64de0bfe63bb7488c2c3e4e5d4d5d6c8403d16de46a.json"
+#a taproot script path spend bitcoinlib fails to parse, reported as a (False, message) tuple
+UNPARSABLE_TX = MEMPOOL / "01269a7ee8dccd5fb374251a7a299a23c227ed142564503dd5c10942ce0065af.json"
+
+def test_results_are_read_back(tmp_path):
+    cache = ValidationCache(tmp_path / "cache.sqlite3")
+    cache.update([("aa", True), ("bb", False)], [])
+    cache.close()
+    cache = ValidationCache(tmp_path / "cache.sqlite3")
+    assert cache.load() == {"aa": True, "bb": False}
+
+def test_results_of_other_rules_are_discarded(tmp_path):
+    cache = ValidationCache(tmp_path / "cache.sqlite3", rules_version=1)
+    cache.update([("aa", True)], [])
+    cache.close()
+    cache = ValidationCache(tmp_path / "cache.sqlite3", rules_version=2)
+    assert cache.load() == {}
+    cache.update([("bb", True)], [])
+    cache.close()
+    cache = ValidationCache(tmp_path / "cache.sqlite3", rules_version=2)
+    assert cache.load() == {"bb": True}
+
+def test_least_recently_used_results_are_evicted(tmp_path):
+    cache = ValidationCache(tmp_path / "cache.sqlite3", max_entries=2)
+    cache.update([("aa", True)], [])
+    cache.update([("bb", True)], [])
+    cache.update([("cc", True)], ["aa"])
+    assert cache.load() == {"aa": True, "cc": True}
+
+def test_verification_errors_are_cached_as_invalid():
+    init_validation_worker({})
+    valid_records, _, new_results, hits, *_ = validate_shard([UNPARSABLE_TX, P2PKH_TX])
+    assert [record.txid for record in valid_records] == [P2PKH_TX.stem]
+    assert [valid for _, valid in new_results] == [False, True]
+    assert hits == []
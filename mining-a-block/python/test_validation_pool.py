@@ -0,0 +1,22 @@
+import shutil
+import pytest
+from pathlib import Path
+from main import get_valid_transactions
+
+MEMPOOL = Path(__file__).parent.parent / "mempool"
+
+@pytest.fixture
+def folder(tmp_path):
+    folder = tmp_path / "mempool"
+    folder.mkdir()
+    #legacy, segwit v0 and taproot spends, some of them invalid
+    for path in sorted(MEMPOOL.glob('0*.json'))[:60]:
+        shutil.copy(path, folder)
+    return folder
+
+@pytest.mark.parametrize("batch_schnorr", [True, False])
+def test_result_doesnt_depend_on_the_number_of_workers(folder, batch_schnorr):
+    single = get_valid_transactions(folder, 1, shard_size=8, batch_schnorr=batch_schnorr)
+    pooled = get_valid_transactions(folder, 2, shard_size=8, batch_schnorr=batch_schnorr)
+    assert [record.txid for record in pooled] == [record.txid for record in single]
+    assert 0 < len(single) < 60
@@ -0,0 +1,199 @@
+"""
+An allocation-light parser for serialized transactions, legacy and segwit.
+
+Usage: python txparser.py <mempool folder>
+    checks the parser against the txid, weight and size fields of every transaction file
+    and compares its throughput with bitcoinlib's Transaction.parse_bytes.
+"""
+import hashlib
+import json
+import sys
+import time
+from pathlib import Path
+
+class ParsedTransaction:
+    """
+    The identifiers, sizes and field offsets of a serialized transaction.
+    Offsets are (start, length) pairs into the buffer given to parse_transaction.
+    """
+    __slots__ = ('txid', 'wtxid', 'version', 'locktime', 'segwit', 'size', 'weight', 'inputs', 'outputs', 'witnesses')
+
+    @property
+    def vsize(self):
+        """
+        The virtual size, the weight divided by 4 and rounded up.
+        """
+        return (self.weight + 3) // 4
+
+def read_varint(view, offset):
+    """
+    Reads a Bitcoin variable length integer.
+
+    :param view: A memoryview over the serialized transaction.
+    :param offset: The position of the integer.
+    :return: A tuple of the integer and the position right after it.
+    """
+    first = view[offset]
+    if first < 0xfd:
+        return first, offset + 1
+    size = 2 if first == 0xfd else 4 if first == 0xfe else 8
+    return int.from_bytes(view[offset + 1:offset + 1 + size], 'little'), offset + 1 + size
+
+def serialize_varint(value):
+    """
+    Serializes a Bitcoin variable length integer.
+
+    :param value: The integer.
+    :return: The serialized integer as bytes.
+    """
+    if value < 0xfd:
+        return bytes([value])
+    if value <= 0xffff:
+        return b'\xfd' + value.to_bytes(2, 'little')
+    if value <= 0xffffffff:
+        return b'\xfe' + value.to_bytes(4, 'little')
+    return b'\xff' + value.to_bytes(8, 'little')
+
+def parse_transaction(raw):
+    """
+    Parses a serialized transaction in a single pass without copying it.
+    The txid is hashed from slices of the buffer, skipping the segwit marker, flag and witnesses.
+
+    :param raw: The serialized transaction as bytes, bytearray or memoryview.
+    :return: A ParsedTransaction.
+    """
+    view = memoryview(raw)
+    tx = ParsedTransaction()
+    tx.version = int.from_bytes(view[0:4], 'little')
+    tx.segwit = view[4] == 0 and view[5] != 0
+    body_start = offset = 6 if tx.segwit else 4
+    count, offset = read_varint(view, offset)
+    inputs = []
+    for _ in range(count):
+        start = offset
+        script_length, offset = read_varint(view, offset + 36)
+        offset += script_length + 4
+        inputs.append((start, offset - start))
+    count, offset = read_varint(view, offset)
+    outputs = []
+    for _ in range(count):
+        start = offset
+        script_length, offset = read_varint(view, offset + 8)
+        offset += script_length
+        outputs.append((start, offset - start))
+    body_end = offset
+    witnesses = []
+    if tx.segwit:
+        for _ in inputs:
+            start = offset
+            items, offset = read_varint(view, offset)
+            for _ in range(items):
+                item_length, offset = read_varint(view, offset)
+                offset += item_length
+            witnesses.append((start, offset - start))
+    tx.locktime = int.from_bytes(view[offset:offset + 4], 'little')
+    tx.size = offset + 4
+    if tx.size != len(view):
+        raise ValueError(f"transaction has {len(view) - tx.size} trailing bytes")
+
+    wtxid = hashlib.sha256(hashlib.sha256(view).digest()).digest()
+    if tx.segwit:
+        first_hash = hashlib.sha256(view[0:4])
+        first_hash.update(view[body_start:body_end])
+        first_hash.update(view[offset:offset + 4])
+        txid = hashlib.sha256(first_hash.digest()).digest()
+        stripped_size = 4 + (body_end - body_start) + 4
+    else:
+        txid = wtxid
+        stripped_size = tx.size
+    tx.txid = txid[::-1].hex()
+    tx.wtxid = wtxid[::-1].hex()
+    tx.weight = 3 * stripped_size + tx.size
+    tx.inputs = inputs
+    tx.outputs = outputs
+    tx.witnesses = witnesses
+    return tx
+
+def input_outpoints(raw, tx):
+    """
+    Reads the outpoint spent by each input.
+
+    :param raw: The serialized transaction given to parse_transaction.
+    :param tx: The ParsedTransaction of raw.
+    :return: A list of (txid in hexadecimal format, output index) tuples.
+    """
+    view = memoryview(raw)
+    return [(bytes(view[start:start + 32])[::-1].hex(), int.from_bytes(view[start + 32:start + 36], 'little'))
+            for start, _ in tx.inputs]
+
+def witness_items(raw, tx, index):
+    """
+    Reads the witness stack of an input.
+
+    :param raw: The serialized transaction given to parse_transaction.
+    :param tx: The ParsedTransaction of raw.
+    :param index: The position of the input.
+    :return: A list of the stack items as memoryview slices of raw, empty for a transaction without witnesses.
+    """
+    if not tx.witnesses:
+        return []
+    view = memoryview(raw)
+    count, offset = read_varint(view, tx.witnesses[index][0])
+    items = []
+    for _ in range(count):
+        item_length, offset = read_varint(view, offset)
+        items.append(view[offset:offset + item_length])
+        offset += item_length
+    return items
+
+def verify_mempool(folder_path):
+    """
+    Parses every transaction file of the mempool and compares the result with its txid, weight and size fields.
+
+    :param folder_path: The folder path to where the transaction files are located.
+    :return: A tuple of the raw transactions and a list of (file name, field) mismatches.
+    """
+    raws = []
+    mismatches = []
+    for path in sorted(Path(folder_path).iterdir()):
+        with open(path, 'rb') as file:
+            data = json.load(file)
+        if not isinstance(data, dict) or 'hex' not in data:
+            continue
+        raw = bytes.fromhex(data['hex'])
+        raws.append(raw)
+        tx = parse_transaction(raw)
+        for field in ('txid', 'weight', 'size'):
+            if getattr(tx, field) != data[field]:
+                mismatches.append((path.name, field))
+    return raws, mismatches
+
+def benchmark_parsers(raws):
+    """
+    Times parse_transaction against bitcoinlib's parser on the same transactions.
+    bitcoinlib rejects some scripts of the mempool, those transactions are counted as failures.
+
+    :param raws: A list of serialized transactions.
+    :return: A dictionary mapping each parser's name to its (transactions per second, failures) tuple.
+    """
+    from bitcoinlib.transactions import Transaction
+    parsers = {'txparser': parse_transaction, 'bitcoinlib': Transaction.parse_bytes}
+    results = {}
+    for name, parse in parsers.items():
+        failures = 0
+        start = time.perf_counter()
+        for raw in raws:
+            try:
+                parse(raw)
+            except Exception:
+                failures += 1
+        results[name] = (len(raws) / (time.perf_counter() - start), failures)
+    return results
+
+if __name__ == "__main__":
+    raws, mismatches = verify_mempool(sys.argv[1])
+    print(f"{len(raws)} transactions parsed, {len(mismatches)} mismatches")
+    for name, field in mismatches:
+        print(f"  {name}: {field}")
+    for name, (rate, failures) in benchmark_parsers(raws).items():
+        print(f"{name}: {rate:.0f} tx/s, {failures} failures")
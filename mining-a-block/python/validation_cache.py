@@ -0,0 +1,68 @@
+import sqlite3
+import time
+
+class ValidationCache:
+    """
+    An on-disk cache of signature validation results keyed by wtxid.
+    The wtxid commits to the whole serialized transaction including its witness,
+    so any change to the signatures gives a new key and the old entry is never reused.
+    Entries are evicted least recently used first once the cache holds more than max_entries.
+    The database is stamped with the version of the validation rules, and results written
+    under other rules are discarded when it is opened.
+    """
+
+    def __init__(self, path, max_entries=200000, rules_version=0):
+        """
+        Opens the cache database, creating it if it doesn't exist.
+
+        :param path: The path to the SQLite database file.
+        :param max_entries: The maximum number of validation results kept on disk.
+        :param rules_version: The version of the validation rules the results are computed with.
+        """
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(str(path))
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != rules_version:
+            self.connection.execute("DROP TABLE IF EXISTS verified")
+            self.connection.execute(f"PRAGMA user_version = {int(rules_version)}")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS verified ("
+            "wtxid TEXT PRIMARY KEY, valid INTEGER NOT NULL, last_used INTEGER NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS verified_last_used ON verified (last_used)")
+        self.connection.commit()
+
+    def load(self):
+        """
+        Reads every cached validation result.
+
+        :return: A dictionary mapping a wtxid to True or False.
+        """
+        rows = self.connection.execute("SELECT wtxid, valid FROM verified")
+        return {wtxid: bool(valid) for wtxid, valid in rows}
+
+    def update(self, results, hits):
+        """
+        Stores new validation results, marks the cache hits as recently used and evicts
+        the least recently used entries beyond max_entries.
+
+        :param results: A list of (wtxid, valid) tuples for the transactions verified in this run.
+        :param hits: A list of wtxids that were answered from the cache in this run.
+        """
+        now = time.time_ns()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO verified (wtxid, valid, last_used) VALUES (?, ?, ?)",
+                [(wtxid, int(valid), now) for wtxid, valid in results])
+            self.connection.executemany(
+                "UPDATE verified SET last_used = ? WHERE wtxid = ?", [(now, wtxid) for wtxid in hits])
+            self.connection.execute(
+                "DELETE FROM verified WHERE wtxid IN ("
+                "SELECT wtxid FROM verified ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM verified").fetchone()[0]
+
+    def close(self):
+        """
+        Closes the cache database.
+        """
+        self.connection.close()